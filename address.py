@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Bitcoin address decoding for GlacierScript
+#
+# Validates base58check (P2PKH, P2SH) and bech32/bech32m (segwit, taproot) addresses and converts
+# them to the output script (scriptPubKey) they pay to, and builds multisig addresses the way
+# bitcoind's createmultisig does, without asking bitcoind.
+#
+################################################################################################
+
+import hashlib
+
+import bech32
+from base58 import b58check_decode, b58check_encode
+from ripemd160 import hash_160
+
+MAINNET = {"p2pkh": 0x00, "p2sh": 0x05, "hrp": "bc"}
+TESTNET = {"p2pkh": 0x6f, "p2sh": 0xc4, "hrp": "tb"}
+
+
+class InvalidAddressError(ValueError):
+    """The string is not a valid address for the network in use"""
+
+
+def decode_address(address, testnet=False):
+    """
+    Decode & validate an address, without asking bitcoind
+    returns => (<string> type, <string> raw output script bytes); the type is one of
+               "p2pkh", "p2sh", "p2wpkh", "p2wsh", "p2tr" or "witness_unknown"
+    raises InvalidAddressError if the address is malformed or for the other network
+
+    address: <string> base58check, bech32 (segwit v0) or bech32m (segwit v1+) address
+    testnet: <boolean> expect testnet rather than mainnet addresses
+    """
+    network, other = (TESTNET, MAINNET) if testnet else (MAINNET, TESTNET)
+    network_name, other_name = ("testnet", "mainnet") if testnet else ("mainnet", "testnet")
+
+    prefix = address[:len(network["hrp"]) + 1].lower()
+    if prefix == other["hrp"] + "1" and bech32.decode(other["hrp"], address)[0] is not None:
+        raise InvalidAddressError("{0} address given, expected a {1} one: {2}".format(
+            other_name, network_name, address))
+    if prefix == network["hrp"] + "1":
+        version, program = bech32.decode(network["hrp"], address)
+        if version is None:
+            raise InvalidAddressError("invalid bech32 address: {0}".format(address))
+        opcode = chr(0x50 + version) if version else "\x00"
+        script = opcode + chr(len(program)) + "".join(chr(b) for b in program)
+        if version == 0:
+            return ("p2wpkh" if len(program) == 20 else "p2wsh"), script
+        if version == 1 and len(program) == 32:
+            return "p2tr", script
+        return "witness_unknown", script
+
+    data = b58check_decode(address, 21)
+    if data is None:
+        raise InvalidAddressError("invalid address: {0}".format(address))
+    version, payload = ord(data[0]), data[1:21]
+    if version == network["p2pkh"]:
+        return "p2pkh", "\x76\xa9\x14" + payload + "\x88\xac"
+    if version == network["p2sh"]:
+        return "p2sh", "\xa9\x14" + payload + "\x87"
+    if version in (other["p2pkh"], other["p2sh"]):
+        raise InvalidAddressError("{0} address given, expected a {1} one: {2}".format(
+            other_name, network_name, address))
+    raise InvalidAddressError("unknown address version {0}: {1}".format(version, address))
+
+
+def address_to_script_pubkey(address, testnet=False):
+    """
+    Get the output script paying to an address
+    returns => <string> raw script bytes
+
+    address: <string> base58check or bech32 address
+    testnet: <boolean> expect testnet rather than mainnet addresses
+    """
+    return decode_address(address, testnet)[1]
+
+
+def hash_160_to_p2sh_address(h160, testnet=False):
+    """Base58check P2SH address for a script hash"""
+    network = TESTNET if testnet else MAINNET
+    return b58check_encode(chr(network["p2sh"]) + h160)
+
+
+def multisig_redeem_script(m, pubkeys):
+    """
+    Build an m-of-n OP_CHECKMULTISIG script, keeping the order of pubkeys
+    returns => <string> raw script bytes
+
+    m: <int> number of signatures required
+    pubkeys: List<string> raw public keys
+    """
+    if not 1 <= m <= len(pubkeys) <= 16:
+        raise ValueError("invalid multisig parameters: {0}-of-{1}".format(m, len(pubkeys)))
+    script = chr(0x50 + m)
+    for pubkey in pubkeys:
+        script += chr(len(pubkey)) + pubkey
+    return script + chr(0x50 + len(pubkeys)) + "\xae"
+
+
+def create_multisig(m, pubkeys, address_type="p2sh-segwit", testnet=False):
+    """
+    Equivalent of `bitcoin-cli createmultisig` (v0.17), computed in-process
+    returns => {"address": <string>, "redeemScript": <string> hex}
+
+    m: <int> number of signatures required
+    pubkeys: List<string> raw public keys
+    address_type: <string> "legacy", "p2sh-segwit" or "bech32"
+    """
+    redeem_script = multisig_redeem_script(m, pubkeys)
+    if any(len(pubkey) != 33 for pubkey in pubkeys):
+        # like bitcoind, segwit isn't used with uncompressed keys
+        address_type = "legacy"
+
+    if address_type == "legacy":
+        address = hash_160_to_p2sh_address(hash_160(redeem_script), testnet)
+    else:
+        witness_program = [ord(c) for c in hashlib.sha256(redeem_script).digest()]
+        if address_type == "bech32":
+            address = bech32.encode((TESTNET if testnet else MAINNET)["hrp"], 0, witness_program)
+        elif address_type == "p2sh-segwit":
+            script_pubkey = "\x00\x20" + "".join(chr(b) for b in witness_program)
+            address = hash_160_to_p2sh_address(hash_160(script_pubkey), testnet)
+        else:
+            raise ValueError("unknown address type: {0}".format(address_type))
+
+    return {"address": address, "redeemScript": redeem_script.encode("hex")}
@@ -25,59 +25,60 @@
 
 """encode/decode base58 in the same way that Bitcoin does"""
 
-import math
+import hashlib
 
 __b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __b58base = len(__b58chars)
+__b58index = dict((c, i) for (i, c) in enumerate(__b58chars))
+
+# digits are converted __b58chunk_digits at a time, so the big number is divided (or
+# multiplied) once per chunk rather than once per digit; chunks are encoded two digits at a time
+__b58chunk_digits = 10
+__b58chunk = __b58base ** __b58chunk_digits
+__b58pairs = [a + b for a in __b58chars for b in __b58chars]
+__b58pair_base = __b58base * __b58base
 
 
 def b58encode(v):
-    """ encode v, which is a string of bytes, to base58.    
+    """ encode v, which is a string of bytes, to base58.
     """
+    long_value = int(v.encode('hex'), 16) if v else 0
 
-    long_value = 0L
-    for (i, c) in enumerate(v[::-1]):
-        long_value += ord(c) << (8 * i)  # 2x speedup vs. exponentiation
-
-    result = ''
-    while long_value >= __b58base:
-        div, mod = divmod(long_value, __b58base)
-        result = __b58chars[mod] + result
-        long_value = div
-    result = __b58chars[long_value] + result
+    pairs = []
+    while long_value:
+        long_value, chunk = divmod(long_value, __b58chunk)
+        for _ in xrange(__b58chunk_digits // 2):
+            chunk, mod = divmod(chunk, __b58pair_base)
+            pairs.append(__b58pairs[mod])
+    result = ''.join(reversed(pairs)).lstrip(__b58chars[0])
 
     # Bitcoin does a little leading-zero-compression:
     # leading 0-bytes in the input become leading-1s
-    nPad = 0
-    for c in v:
-        if c == '\0':
-            nPad += 1
-        else:
-            break
+    nPad = len(v) - len(v.lstrip('\0'))
 
     return (__b58chars[0] * nPad) + result
 
 
 def b58decode(v, length):
     """ decode v into a string of len bytes
+    returns None if v isn't base58, or doesn't decode to length bytes (if given)
     """
-    long_value = 0L
-    for (i, c) in enumerate(v[::-1]):
-        long_value += __b58chars.find(c) * (__b58base**i)
+    long_value = 0
+    try:
+        for start in xrange(0, len(v), __b58chunk_digits):
+            chunk = 0
+            for c in v[start:start + __b58chunk_digits]:
+                chunk = chunk * __b58base + __b58index[c]
+            long_value = long_value * __b58base ** len(v[start:start + __b58chunk_digits]) + chunk
+    except KeyError:
+        return None
 
     result = ''
-    while long_value >= 256:
-        div, mod = divmod(long_value, 256)
-        result = chr(mod) + result
-        long_value = div
-    result = chr(long_value) + result
-
-    nPad = 0
-    for c in v:
-        if c == __b58chars[0]:
-            nPad += 1
-        else:
-            break
+    if long_value:
+        result = '%x' % long_value
+        result = ('0' * (len(result) % 2) + result).decode('hex')
+
+    nPad = len(v) - len(v.lstrip(__b58chars[0]))
 
     result = chr(0) * nPad + result
     if length is not None and len(result) != length:
@@ -85,11 +86,43 @@ def b58decode(v, length):
 
     return result
 
+
+def b58check_encode(payload):
+    """ encode payload (a string of bytes) with its 4-byte checksum to base58
+    """
+    return b58encode(payload + _checksum(payload))
+
+
+def b58check_decode(v, length=None):
+    """ decode & verify a base58check string
+    returns the payload (without checksum), or None if v isn't valid base58check or the payload
+    isn't length bytes (if given)
+    """
+    data = b58decode(v, None if length is None else length + 4)
+    if data is None or len(data) < 4 or _checksum(data[:-4]) != data[-4:]:
+        return None
+    return data[:-4]
+
+
+def b58check_encode_many(payloads):
+    """ b58check_encode a list of payloads
+    """
+    return map(b58check_encode, payloads)
+
+
+def b58check_decode_many(strings, length=None):
+    """ b58check_decode a list of base58check strings (None for each invalid one)
+    """
+    return [b58check_decode(v, length) for v in strings]
+
+
+def _checksum(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
 try:
-    import hashlib
     hashlib.new('ripemd160')
     have_crypto = True
-except ImportError:
+except (ImportError, ValueError):  # ValueError: OpenSSL 3 without the legacy provider
     have_crypto = False
 
 
@@ -113,10 +146,7 @@ def public_key_to_bc_address(public_key, version="\x00"):
 def hash_160_to_bc_address(h160, version="\x00"):
     if not have_crypto:
         return ''
-    vh160 = version + h160
-    h3 = hashlib.sha256(hashlib.sha256(vh160).digest()).digest()
-    addr = vh160 + h3[0:4]
-    return b58encode(addr)
+    return b58check_encode(version + h160)
 
 
 def bc_address_to_hash_160(addr):
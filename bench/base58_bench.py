@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Micro-benchmark of base58.py against the original per-digit implementation
+#
+# Usage:
+#   bench/base58_bench.py [-n NUMBER] [--sizes 25,38,...]
+#
+# Times encoding & decoding of random payloads of each size (25 bytes is an address, 38 a WIF
+# private key), checks both implementations agree, and prints one row per size & operation.
+#
+################################################################################################
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import base58
+
+B58_CHARS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def legacy_b58encode(v):
+    """base58.b58encode before the chunked rewrite: one divmod & string prepend per digit"""
+    long_value = 0L
+    for (i, c) in enumerate(v[::-1]):
+        long_value += ord(c) << (8 * i)
+
+    result = ''
+    while long_value >= 58:
+        div, mod = divmod(long_value, 58)
+        result = B58_CHARS[mod] + result
+        long_value = div
+    result = B58_CHARS[long_value] + result
+
+    nPad = 0
+    for c in v:
+        if c == '\0':
+            nPad += 1
+        else:
+            break
+    return (B58_CHARS[0] * nPad) + result
+
+
+def legacy_b58decode(v, length):
+    """base58.b58decode before the chunked rewrite: a power of 58 & find() per digit"""
+    long_value = 0L
+    for (i, c) in enumerate(v[::-1]):
+        long_value += B58_CHARS.find(c) * (58**i)
+
+    result = ''
+    while long_value >= 256:
+        div, mod = divmod(long_value, 256)
+        result = chr(mod) + result
+        long_value = div
+    result = chr(long_value) + result
+
+    nPad = 0
+    for c in v:
+        if c == B58_CHARS[0]:
+            nPad += 1
+        else:
+            break
+    result = chr(0) * nPad + result
+    if length is not None and len(result) != length:
+        return None
+    return result
+
+
+def best_time(function, number, repeat=3):
+    """Seconds per call, best of repeat runs"""
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=1000,
+                        help="payloads encoded & decoded per timing run (default: 1000)")
+    parser.add_argument("--sizes", default="25,38,100,500",
+                        help="comma-separated payload sizes in bytes (default: 25,38,100,500)")
+    args = parser.parse_args()
+
+    print "{0:>6} {1:<8} {2:>14} {3:>14} {4:>9}".format("bytes", "op", "legacy/sec", "base58/sec", "speedup")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        # a leading zero byte, like version 0x00 addresses, exercises the padding
+        payloads = ["\0" + os.urandom(size - 1) for _ in range(args.number)]
+        encoded = [base58.b58encode(p) for p in payloads]
+        if encoded != [legacy_b58encode(p) for p in payloads]:
+            sys.exit("encodings differ for {0}-byte payloads".format(size))
+        if [base58.b58decode(e, size) for e in encoded] != payloads:
+            sys.exit("decodings differ for {0}-byte payloads".format(size))
+
+        runs = [
+            ("encode", lambda: [legacy_b58encode(p) for p in payloads],
+                       lambda: [base58.b58encode(p) for p in payloads]),
+            ("decode", lambda: [legacy_b58decode(e, size) for e in encoded],
+                       lambda: [base58.b58decode(e, size) for e in encoded]),
+        ]
+        number = max(1, 20000 // (args.number * max(1, size // 25)))
+        for op, legacy, current in runs:
+            legacy_time = best_time(legacy, number) / args.number
+            current_time = best_time(current, number) / args.number
+            print "{0:>6} {1:<8} {2:>14.0f} {3:>14.0f} {4:>8.1f}x".format(
+                size, op, 1 / legacy_time, 1 / current_time, legacy_time / current_time)
+
+        # base58check encode + verify/decode round trip, with the batch functions
+        check_time = best_time(lambda: base58.b58check_decode_many(base58.b58check_encode_many(payloads), size), number)
+        print "{0:>6} {1:<8} {2:>14} {3:>14.0f}".format(size, "check", "-", args.number / check_time)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Benchmarks of the GlacierScript withdrawal & deposit hot paths
+#
+# Usage:
+#   bench/glacier_bench.py [--inputs 1,10,100,1000] [--multisig 1-of-2,2-of-3,15-of-15]
+#                          [--repeat 3] [--rpc stub|bitcoind] [--qr] [-o results.json]
+#                          [--compare old-results.json]
+#
+# For every number of inputs & m-of-n, generates transactions funding an m-of-n address and times
+# each stage of a withdrawal from it separately:
+#
+#   decode           decode_raw_transactions on the funding transactions
+#   utxos            index_utxos, finding the UTXOs of the source address
+#   fee_estimate     the size estimate & fee calculation of get_fee_interactive
+#   create_unsigned  create_unsigned_transaction (createrawtransaction)
+#   sign             sign_transaction (signrawtransactionwithkey with m keys)
+#   wif              hex_private_key_to_WIF_private_key for the n keys (base58check)
+#   deposit_address  create_multisig_from_privkeys for the n keys
+#   qr               write_and_verify_qr_code of the signed transaction (with --qr; needs
+#                    qrencode & zbarimg)
+#
+# RPC calls go to bench/stub_rpc.py by default. With --rpc bitcoind they go to an already
+# running regtest or testnet bitcoind instead (--rpc-port & --rpc-cookie).
+#
+# Each stage is timed --repeat times & the fastest run kept. Results are printed as a table and
+# can be written as JSON (-o), to be compared against the results of another version (--compare).
+#
+################################################################################################
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import glacierscript
+from transaction import serialize_transaction
+from address import address_to_script_pubkey
+from stub_rpc import start_stub_rpc
+
+STAGES = ["decode", "utxos", "fee_estimate", "create_unsigned", "sign", "wif", "deposit_address", "qr"]
+FEE_RATE = 10  # satoshis per vbyte
+
+
+def bench_keys(n, salt):
+    """n deterministic hex private keys"""
+    return [hashlib.sha256("glacier bench key {0} {1}".format(salt, i)).hexdigest() for i in range(n)]
+
+
+def funding_transactions(count, address, other_address):
+    """
+    count transactions, each paying address (and some change elsewhere), as raw hex
+    """
+    script, other_script = address_to_script_pubkey(address, True), address_to_script_pubkey(other_address, True)
+    txs = []
+    for i in range(count):
+        tx = {"version": 2, "locktime": 0,
+              "vin": [{"txid": hashlib.sha256("funding {0}".format(i)).hexdigest(), "vout": 0, "script_sig": "",
+                       "sequence": 0xffffffff, "witness": []}],
+              "vout": [{"value": 1000000 + i, "script_pubkey": script},
+                       {"value": 5000000, "script_pubkey": other_script}]}
+        txs.append(serialize_transaction(tx).encode("hex"))
+    return txs
+
+
+def time_call(function):
+    """returns => (<float> seconds, result)"""
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+
+def run_case(inputs, m, n, write_qr, devnull):
+    """
+    Time every stage of a withdrawal of inputs UTXOs from an m-of-n address once
+    returns => {stage <string>: <float> seconds}
+    """
+    g = glacierscript
+    timings = {}
+
+    hex_keys = bench_keys(n, "source")
+    timings["wif"], keys = time_call(lambda: [g.hex_private_key_to_WIF_private_key(key) for key in hex_keys])
+    timings["deposit_address"], source = time_call(lambda: g.create_multisig_from_privkeys(m, keys))
+    destination = g.create_multisig_from_privkeys(1, [g.hex_private_key_to_WIF_private_key(key)
+                                                      for key in bench_keys(2, "destination")])["address"]
+    hex_txs = funding_transactions(inputs, source["address"], destination)
+
+    describe = lambda i: "funding transaction #{0}".format(i + 1)
+    timings["decode"], decoded = time_call(lambda: g.decode_raw_transactions(hex_txs, describe))
+    timings["utxos"], index = time_call(lambda: g.index_utxos(decoded, describe))
+    utxos = index[source["address"]]
+
+    input_amount = g.sum_utxos(utxos)
+    amount = input_amount // 2
+    destinations = {destination: amount, source["address"]: 0}
+
+    def fee_estimate():
+        size = g.estimate_vsize(destinations, source["redeemScript"], utxos)["expected"]
+        return size * FEE_RATE
+    timings["fee_estimate"], fee = time_call(fee_estimate)
+
+    destinations[source["address"]] = input_amount - amount - fee
+    timings["create_unsigned"], unsigned = time_call(
+        lambda: g.create_unsigned_transaction(dict(destinations), utxos))
+    timings["sign"], signed = time_call(
+        lambda: g.sign_transaction(keys[:m], source["redeemScript"], unsigned, utxos))
+    if not signed["complete"]:
+        sys.exit("signing failed for {0} inputs, {1}-of-{2}: {3}".format(inputs, m, n, signed.get("errors")))
+
+    if write_qr:
+        timings["qr"], _ = time_call(
+            lambda: g.write_and_verify_qr_code("transaction", "bench-transaction", signed["hex"], devnull))
+    return timings
+
+
+def clean_qr_files():
+    for name in os.listdir(ROOT):
+        if name.startswith("bench-transaction") and name.endswith(".png"):
+            os.remove(os.path.join(ROOT, name))
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                                       stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, old_path):
+    """Print how each timing compares with the same one in an earlier results file"""
+    with open(old_path) as f:
+        old = json.load(f)
+    old_times = dict(((r["inputs"], r["m"], r["n"], r["stage"]), r["seconds"]) for r in old["results"])
+
+    print "\nCompared with {0} ({1}):".format(old_path, old.get("version") or "unknown version")
+    print "{0:>7} {1:>8} {2:<16} {3:>12} {4:>12} {5:>8}".format("inputs", "m-of-n", "stage", "old ms", "new ms", "change")
+    for r in results:
+        before = old_times.get((r["inputs"], r["m"], r["n"], r["stage"]))
+        if not before:
+            continue
+        print "{0:>7} {1:>8} {2:<16} {3:>12.3f} {4:>12.3f} {5:>+7.1f}%".format(
+            r["inputs"], "{0}-of-{1}".format(r["m"], r["n"]), r["stage"], before * 1000, r["seconds"] * 1000,
+            (r["seconds"] / before - 1) * 100)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default="1,10,100,1000",
+                        help="comma-separated numbers of UTXOs to withdraw (default: 1,10,100,1000)")
+    parser.add_argument("--multisig", default="1-of-2,2-of-3,15-of-15",
+                        help="comma-separated m-of-n address types (default: 1-of-2,2-of-3,15-of-15)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each case; the fastest is kept (default: 3)")
+    parser.add_argument("--rpc", choices=["stub", "bitcoind"], default="stub",
+                        help="send RPC calls to the local stub (default) or a running bitcoind")
+    parser.add_argument("--rpc-port", type=int, default=18443, help="--rpc bitcoind: RPC port (default: 18443, regtest)")
+    parser.add_argument("--rpc-cookie", default=os.path.expanduser("~/.bitcoin/regtest/.cookie"),
+                        help="--rpc bitcoind: RPC cookie file (default: ~/.bitcoin/regtest/.cookie)")
+    parser.add_argument("--qr", action="store_true", help="also time writing & verifying QR codes")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="FILE", help="compare with the results in an earlier JSON file")
+    args = parser.parse_args()
+
+    cases = [(int(inputs), int(m), int(n)) for inputs in args.inputs.split(",")
+             for m, n in (mn.split("-of-") for mn in args.multisig.split(","))]
+
+    g = glacierscript
+    g.testnet_mode = True
+    g.wif_prefix = "EF"
+    g.cache_max_entries = 0  # every run decodes for real
+    g.PROGRESS_MIN_ITEMS = float("inf")
+
+    datadir = tempfile.mkdtemp(prefix="glacier-bench-")
+    server = None
+    try:
+        if args.rpc == "stub":
+            server, g.rpc_port, g.rpc_cookie_file = start_stub_rpc(datadir)
+        else:
+            g.rpc_port, g.rpc_cookie_file = args.rpc_port, args.rpc_cookie
+        g.ensure_bitcoind_running()
+
+        devnull = open(os.devnull, "w")
+        results = []
+        print "{0:>7} {1:>8} {2:<16} {3:>12} {4:>12}".format("inputs", "m-of-n", "stage", "ms", "us/input")
+        for inputs, m, n in cases:
+            best = {}
+            for _ in range(args.repeat):
+                for stage, seconds in run_case(inputs, m, n, args.qr, devnull).items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+                clean_qr_files()
+            for stage in STAGES:
+                if stage not in best:
+                    continue
+                results.append({"inputs": inputs, "m": m, "n": n, "stage": stage, "seconds": best[stage]})
+                print "{0:>7} {1:>8} {2:<16} {3:>12.3f} {4:>12.1f}".format(
+                    inputs, "{0}-of-{1}".format(m, n), stage, best[stage] * 1000, best[stage] * 1e6 / inputs)
+    finally:
+        if server:
+            g.reset_rpc_connection()
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(datadir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"version": git_version(), "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                       "python": platform.python_version(), "rpc": args.rpc, "repeat": args.repeat,
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print "\nResults written to {0}".format(args.output)
+
+    if args.compare:
+        print_comparison(results, args.compare)
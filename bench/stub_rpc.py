@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Stand-in for bitcoind's JSON-RPC server, for benchmarks
+#
+# Serves the few calls GlacierScript makes while withdrawing, over HTTP with cookie auth like
+# bitcoind, so the real client code (connection reuse, batching, JSON handling) is exercised:
+#
+#   getnetworkinfo, decoderawtransaction    as bitcoind v0.17
+#   createrawtransaction                    builds the real unsigned transaction
+#   signrawtransactionwithkey               fills each input with placeholder signatures of the
+#                                           real size, so later stages see realistic data; no
+#                                           actual signing is done, which keeps the timings about
+#                                           GlacierScript rather than about ECDSA
+#
+# Amounts are only checked for being numbers, and addresses must be testnet.
+#
+################################################################################################
+
+import BaseHTTPServer
+import SocketServer
+import base64
+import hashlib
+import json
+import os
+import socket
+import threading
+from decimal import Decimal
+
+from address import address_to_script_pubkey
+from transaction import deserialize_transaction, serialize_transaction, decode_raw_transaction
+from transaction import parse_multisig_redeem_script, multisig_address_type, write_bytes
+
+STUB_VERSION = 170000
+PLACEHOLDER_SIGNATURE = "\x30\x44" + "\x00" * 68 + "\x01"  # 71 bytes, the most common DER size + sighash
+
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+def createrawtransaction(inputs, outputs, locktime=0):
+    tx = {"version": 2, "locktime": locktime, "vout": [],
+          "vin": [{"txid": txin["txid"], "vout": txin["vout"], "script_sig": "", "sequence": 0xffffffff,
+                   "witness": []} for txin in inputs]}
+    for address, amount in outputs.items():
+        tx["vout"].append({"value": int(Decimal(str(amount)) * 100000000),
+                           "script_pubkey": address_to_script_pubkey(address, testnet=True)})
+    return serialize_transaction(tx).encode("hex")
+
+
+def signrawtransactionwithkey(hex_tx, keys, prevtxs):
+    """Give every input in prevtxs m placeholder signatures, as signing with m of the keys would"""
+    tx = deserialize_transaction(hex_tx.decode("hex"))
+    prevouts = dict(((prev["txid"], prev["vout"]), prev) for prev in prevtxs)
+    errors = []
+    for txin in tx["vin"]:
+        prev = prevouts.get((txin["txid"], txin["vout"]))
+        if prev is None:
+            errors.append({"txid": txin["txid"], "vout": txin["vout"], "error": "Input not found or already spent"})
+            continue
+        redeem = prev["redeemScript"].decode("hex")
+        m, pubkeys = parse_multisig_redeem_script(redeem)
+        if m is None:
+            raise RPCError(-8, "redeemScript is not multisig")
+        signatures = [PLACEHOLDER_SIGNATURE] * min(m, len(keys))
+        if len(keys) < m:
+            errors.append({"txid": txin["txid"], "vout": txin["vout"], "error": "Signature must be zero for failed CHECK(MULTI)SIG operation"})
+
+        address_type = multisig_address_type(prev["scriptPubKey"].decode("hex"), redeem)
+        if address_type == "p2sh":
+            txin["script_sig"] = "".join(write_bytes(item) for item in [""] + signatures + [redeem])
+        else:
+            txin["witness"] = [""] + signatures + [redeem]
+            if address_type == "p2sh-p2wsh":
+                txin["script_sig"] = write_bytes("\x00\x20" + hashlib.sha256(redeem).digest())
+    return {"hex": serialize_transaction(tx).encode("hex"), "complete": not errors, "errors": errors}
+
+
+def decoderawtransaction(hex_tx):
+    decoded = decode_raw_transaction(hex_tx, testnet=True)
+    for vout in decoded["vout"]:
+        # bitcoind only writes the BTC value; as a float, json writes its shortest repr, the same digits
+        vout["value"] = float(vout.pop("satoshis")) / 100000000
+    return decoded
+
+
+METHODS = {
+    "getnetworkinfo": lambda: {"version": STUB_VERSION, "subversion": "/Satoshi:0.17.0(stub)/"},
+    "decoderawtransaction": decoderawtransaction,
+    "createrawtransaction": createrawtransaction,
+    "signrawtransactionwithkey": signrawtransactionwithkey,
+}
+
+
+def handle_request(request):
+    try:
+        method = METHODS.get(request.get("method"))
+        if method is None:
+            raise RPCError(-32601, "Method not found")
+        try:
+            result = method(*request.get("params", []))
+        except (TypeError, ValueError, KeyError) as e:
+            raise RPCError(-22, str(e))
+        return {"result": result, "error": None, "id": request.get("id")}
+    except RPCError as e:
+        return {"result": None, "error": {"code": e.code, "message": str(e)}, "id": request.get("id")}
+
+
+class StubRPCHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like bitcoind
+    wbufsize = -1  # send headers & body together
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # large responses go out in several segments; don't hold the last one back waiting for an ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        if self.headers.get("Authorization") != self.server.auth_header:
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(payload, list):
+            body = json.dumps([handle_request(request) for request in payload])
+        else:
+            body = json.dumps(handle_request(payload))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRPCServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_stub_rpc(datadir):
+    """
+    Start the stub server on a free local port, in a background thread
+    returns => (<StubRPCServer>, <int> port, <string> path of its RPC cookie file)
+
+    datadir: <string> directory to write the cookie file to
+    """
+    cookie = "__cookie__:" + os.urandom(16).encode("hex")
+    cookie_file = os.path.join(datadir, ".cookie")
+    with open(cookie_file, "w") as f:
+        f.write(cookie)
+
+    server = StubRPCServer(("127.0.0.1", 0), StubRPCHandler)
+    server.auth_header = "Basic " + base64.b64encode(cookie)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, server.server_address[1], cookie_file
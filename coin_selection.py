@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Coin selection for GlacierScript
+#
+# Chooses which of the available UTXOs a withdrawal should spend. Multisig inputs are large, so
+# the aim is to spend as few of them as needed, and to avoid a change output when an exact
+# enough match exists (the same strategy as Bitcoin Core's wallet: branch-and-bound first, then
+# a simple heuristic which creates change).
+#
+# All amounts are in satoshis and sizes in weight units. Internally values are kept in
+# satoshis * 4 ("effective value" of an input = its value less the fee to spend it), so fee
+# rates in satoshis per vbyte stay integral.
+#
+################################################################################################
+
+WITNESS_SCALE_FACTOR = 4
+MAX_BNB_TRIES = 100000
+
+
+class InsufficientFundsError(ValueError):
+    """The candidate UTXOs can't pay for the outputs plus the fee"""
+
+
+def select_coins_bnb(effective_values, target, cost_of_change, max_tries=MAX_BNB_TRIES):
+    """
+    Depth-first branch-and-bound search for inputs whose total effective value lands in
+    [target, target + cost_of_change], i.e. needs no change output, minimizing the excess
+    (which is given up as extra fee)
+    returns => List<int> indexes into effective_values, or None if no such subset was found
+
+    effective_values: List<int> value of each candidate less the fee to spend it
+    target: <int> effective value needed
+    cost_of_change: <int> cost of creating & later spending a change output
+    """
+    order = sorted((i for i, value in enumerate(effective_values) if value > 0),
+                   key=lambda i: effective_values[i], reverse=True)
+    pool = [effective_values[i] for i in order]
+
+    available = sum(pool)
+    if available < target:
+        return None
+
+    value = 0
+    selection = []  # include/exclude decision for each pool position considered so far
+    best, best_excess = None, None
+
+    for _ in xrange(max_tries):
+        backtrack = False
+        if value + available < target or value > target + cost_of_change:
+            backtrack = True  # can't reach the target, or overshot it
+        elif value >= target:
+            if best is None or value - target < best_excess:
+                best = [order[pos] for pos, included in enumerate(selection) if included]
+                best_excess = value - target
+                if best_excess == 0:
+                    break
+            backtrack = True
+
+        if backtrack:
+            # walk back to the last included candidate & try excluding it instead
+            while selection and not selection[-1]:
+                selection.pop()
+                available += pool[len(selection)]
+            if not selection:
+                break  # search space exhausted
+            selection[-1] = False
+            value -= pool[len(selection) - 1]
+        else:
+            pos = len(selection)
+            available -= pool[pos]
+            if selection and not selection[-1] and pool[pos] == pool[pos - 1]:
+                # including this one is equivalent to the sibling branch just explored
+                selection.append(False)
+            else:
+                selection.append(True)
+                value += pool[pos]
+
+    return best
+
+
+def select_coins_with_change(effective_values, target):
+    """
+    Fallback when no changeless selection exists: the smallest single candidate which covers the
+    target, else the largest candidates until the target is covered (fewest inputs)
+    returns => List<int> indexes into effective_values, or None if the target can't be reached
+
+    effective_values: List<int> value of each candidate less the fee to spend it
+    target: <int> effective value needed, including the cost of the change output
+    """
+    covering = [i for i, value in enumerate(effective_values) if value >= target]
+    if covering:
+        return [min(covering, key=lambda i: effective_values[i])]
+
+    selected, value = [], 0
+    for i in sorted(range(len(effective_values)), key=lambda i: effective_values[i], reverse=True):
+        if effective_values[i] <= 0 or value >= target:
+            break
+        selected.append(i)
+        value += effective_values[i]
+    return selected if value >= target else None
+
+
+def select_coins(candidates, target, fee_rate, base_weight, change_weight, change_spend_weight):
+    """
+    Choose which UTXOs to spend to pay target satoshis at fee_rate
+    returns => (List<int> indexes of the chosen candidates, <boolean> whether a change output is needed)
+    raises InsufficientFundsError if all candidates together can't pay for the outputs & fee
+
+    candidates: List<(<int> value in satoshis, <int> weight of the signed input)>
+    target: <int> satoshis paid to the destinations
+    fee_rate: <int> satoshis per vbyte
+    base_weight: <int> weight of the transaction without any inputs or change output
+    change_weight: <int> weight a change output adds
+    change_spend_weight: <int> weight of the input which will later spend the change
+    """
+    effective_values = [value * WITNESS_SCALE_FACTOR - weight * fee_rate for value, weight in candidates]
+    # round the fixed part up to a whole vbyte, as the fee is charged on whole vbytes
+    needed = target * WITNESS_SCALE_FACTOR + (base_weight + WITNESS_SCALE_FACTOR - 1) * fee_rate
+    cost_of_change = (change_weight + change_spend_weight) * fee_rate
+
+    selected = select_coins_bnb(effective_values, needed, cost_of_change)
+    if selected is not None:
+        return sorted(selected), False
+
+    selected = select_coins_with_change(effective_values, needed + cost_of_change)
+    if selected is None:
+        raise InsufficientFundsError("insufficient funds: {0} UTXO(s) can't pay {1} satoshis plus fees".format(
+            len(candidates), target))
+    return sorted(selected), True
@@ -30,21 +30,90 @@ import os
 import sys
 import hashlib
 from hashlib import sha256, md5
-import random
 import subprocess
 import json
+import csv
+import re
+import glob
+import mmap
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import errno
+import base64
+import httplib
+import socket
+import select
+import atexit
+import tempfile
+import shutil
+import urllib
+import threading
+from collections import OrderedDict
 from decimal import Decimal
 
 # Taken from Gavin Andresen's "bitcointools" python library (exact link in source file)
-from base58 import b58encode
-
+from base58 import b58check_encode
+
+# In-process equivalent of `bitcoin-cli decoderawtransaction`, and transaction size estimation
+from transaction import decode_raw_transaction, TransactionDecodeError, sha256d
+from transaction import deserialize_transaction, serialize_transaction, combine_signed_inputs
+from transaction import format_amount
+from transaction import estimate_multisig_vsize, multisig_address_type, parse_multisig_redeem_script
+from transaction import multisig_input_weight, output_weight, compact_size_len, WITNESS_SCALE_FACTOR
+from coin_selection import select_coins, InsufficientFundsError
+from address import address_to_script_pubkey, decode_address, InvalidAddressError, create_multisig
+from keys import wif_to_public_key, InvalidKeyError
+from psbt import create_psbt, parse_psbt, psbt_from_base64, psbt_to_base64, input_utxo, signing_script
+from psbt import partial_signatures, add_partial_signature, multisig_input_signatures, PSBTError
+from psbt import PSBT_GLOBAL_UNSIGNED_TX
+from qr_chunks import split_payload, is_qr_chunk, parse_chunk, missing_chunks, reassemble_payload, QRChunkError
+
+# Amounts are handled as <int> satoshi throughout: converted exactly from BTC where they come in
+# (decoded transactions, user input & withdrawal specs), and back to BTC only for display & bitcoind
+SATOSHIS_PER_BTC = 100000000
+SATOSHIS_PER_MBTC = 100000
 SATOSHI_PLACES = Decimal("0.00000001")
-SATOSHI_MBTC_PLACES = Decimal("0.00001")
-SATOSHI_MICROBTC_PLACES = Decimal("0.01")
+
+MAX_FEE = 500000  # in satoshi (0.005 btc).  hardcoded limit to protect against user typos
 
 verbose_mode = False
 re_sign_mode = False
 single_safety_confirm_mode = False
+testnet_mode = False
+bitcoind_decoding = False  # decode transactions with bitcoind rather than in-process
+wallet_derivation = False  # derive deposit addresses through bitcoind's wallet rather than in-process
+coin_selection_mode = False  # batch withdrawals spend only the UTXOs they need rather than all of them
+psbt_mode = False  # withdrawals are written as unsigned PSBTs for signing with sign-psbt
+sign_jobs = 1  # processes signing shards of a transaction's inputs concurrently; 1 signs in one request
+SIGN_SHARD_MAX_INPUTS = 25
+qr_jobs = 4  # QR codes encoded & verified concurrently
+QR_MAX_CHARS = 2953  # capacity of a version 40 QR code at the lowest error correction level
+QR_CHUNK_CHARS = 1000
+qr_chunk_size = None  # split data longer than this into multi-part QR codes (default: only what won't fit one)
+
+# "http" talks JSON-RPC to bitcoind over one kept-alive connection; "cli" spawns bitcoin-cli per call;
+# "replay" answers from a recorded RPC session (see rpc_replay_file)
+rpc_backend = "http"
+rpc_host = "127.0.0.1"
+rpc_port = 8332
+rpc_cookie_file = os.path.expanduser("~/.bitcoin/.cookie")
+RPC_TIMEOUT = 900  # seconds; same as bitcoin-cli's default -rpcclienttimeout
+RPC_BATCH_SIZE = 50  # max requests per JSON-RPC batch, keeps request bodies & bitcoind's work queue bounded
+
+# Positional arguments which bitcoin-cli parses as JSON rather than passing as strings.
+# (Mirrors vRPCConvertParams in Bitcoin Core for the RPCs we use.)
+RPC_JSON_PARAMS = {
+    "addmultisigaddress": [0, 1],
+    "combinepsbt": [0],
+    "combinerawtransaction": [0],
+    "createmultisig": [0, 1],
+    "createrawtransaction": [0, 1, 2, 3],
+    "createwallet": [1, 2, 4, 5, 6],
+    "decoderawtransaction": [1],
+    "finalizepsbt": [1],
+    "importprivkey": [2],
+    "signrawtransactionwithkey": [1, 2],
+}
 
 ################################################################################################
 #
@@ -66,29 +135,183 @@ def hash_md5(s):
     return m.hexdigest()
 
 
-def satoshi_to_btc(satoshi):
+def btc_to_satoshi(btc):
+    """
+    Converts a value in BTC to satoshi, exactly (rounding to the nearest satoshi)
+    outputs => <int>
+
+    btc: <Decimal>, <string> or <float>. A float is converted from its shortest repr, which is
+         the decimal it was written as for any amount up to 21 million BTC
+    """
+    if isinstance(btc, float):
+        btc = repr(btc)
+    return int(Decimal(btc).quantize(SATOSHI_PLACES) * SATOSHIS_PER_BTC)
+
+
+def vout_satoshis(vout):
+    """
+    The amount of a decoded transaction output
+    returns => <int> satoshi
+
+    vout: <dict> output decoded in-process (which carries "satoshis") or by bitcoind
+    """
+    return vout["satoshis"] if "satoshis" in vout else btc_to_satoshi(vout["value"])
+
+def btc_string(satoshi):
     """
-    Converts a value in satoshi to a value in BTC
-    outputs => Decimal
+    Converts a value in satoshi to a decimal BTC string, as given to bitcoind
+    outputs => <string> "0", or the amount with 8 decimal places
 
     satoshi: <int>
     """
-    value = Decimal(satoshi) / Decimal(100000000)
-    return value.quantize(SATOSHI_PLACES)
+    return format_amount(satoshi) if satoshi else "0"
 
+def verbose(content, *args):
+    """
+    Print content in verbose mode
+    args: formatted into content with str.format, only in verbose mode, so that large payloads
+          (e.g. transaction hex) cost nothing to log otherwise
+    """
+    if verbose_mode: print content.format(*args) if args else content
 
-def btc_to_satoshi(btc):
+PROGRESS_MIN_ITEMS = 100  # only steps over at least this many items report progress
+PROGRESS_INTERVAL = 50
+
+def report_progress(task, done, total, count=1):
     """
-    Converts a value in BTC to satoshi
-    outputs => <int>
+    Show how far a long task over many items (e.g. hundreds of input transactions) has got
+    Written to stderr, so stdout stays the same however many items there are
+
+    count: <int> items completed since the last call
+    """
+    if total < PROGRESS_MIN_ITEMS or (done // PROGRESS_INTERVAL == (done - count) // PROGRESS_INTERVAL and done != total):
+        return
+    sys.stderr.write("\r{0}: {1}/{2}".format(task, done, total))
+    if done == total:
+        sys.stderr.write("\n")
+
+################################################################################################
+#
+# Profiling
+#
+# --profile times every bitcoind request (by RPC method) and the major stages of a run, e.g.
+# decoding the input transactions, the fee calculation, signing & writing QR codes. At exit a
+# summary table goes to stderr and every timed span to a trace file: a Chrome trace (open it in
+# chrome://tracing or Perfetto) or, for a file name ending in .jsonl, one JSON event per line.
+# Each span records its duration and, for requests, the bytes sent & received. Requests made by
+# the signing processes of --sign-jobs are only timed as part of the "sign" stage.
+# With --profile off, nothing is timed and no span details are computed.
+#
+################################################################################################
+
+PROFILE_SUMMARY_HEADER = "{0:<6} {1:<28} {2:>6} {3:>11} {4:>10} {5:>10} {6:>12} {7:>12}"
+PROFILE_SUMMARY_ROW = "{0:<6} {1:<28} {2:>6} {3:>11.1f} {4:>10.2f} {5:>10.2f} {6:>12} {7:>12}"
+
+profile_path = None
+profile_events = None  # List<dict> finished spans, in Chrome trace event format; None when not profiling
+profile_start = None
+profile_spans = threading.local()  # .open: List<dict> details of this thread's unfinished spans, innermost last
 
-    btc: <Decimal> or <Float>
+def start_profiling(path):
+    global profile_path, profile_events, profile_start
+    profile_path = path
+    profile_events = []
+    profile_start = time.time()
+    atexit.register(write_profile)
+
+def profiled(category, name):
+    """
+    Decorator timing each call of a function as a span, when profiling
+
+    category: <string> "rpc" or "stage"
+    name: <string> span name; for "rpc", None to name each span after its RPC method (args[0])
+    """
+    def decorate(function):
+        def profiled_function(*args, **kwargs):
+            if profile_events is None:
+                return function(*args, **kwargs)
+            if name is None:
+                span_name = "bitcoind" if kwargs.get("use_bitcoind") else args[0]
+            else:
+                span_name = name
+            open_spans = profile_spans.__dict__.setdefault("open", [])
+            details = {}
+            open_spans.append(details)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            except BaseException as e:
+                details["error"] = type(e).__name__
+                raise
+            finally:
+                end = time.time()
+                open_spans.pop()
+                profile_events.append({"name": span_name, "cat": category, "ph": "X",
+                                       "ts": int((start - profile_start) * 1e6), "dur": int((end - start) * 1e6),
+                                       "pid": os.getpid(), "tid": threading.current_thread().ident, "args": details})
+        profiled_function.__name__ = function.__name__
+        profiled_function.__doc__ = function.__doc__
+        return profiled_function
+    return decorate
+
+def profile_note(**details):
+    """Add details (e.g. request_bytes) to the innermost span open in this thread, if profiling"""
+    open_spans = getattr(profile_spans, "open", None)
+    if profile_events is not None and open_spans:
+        open_spans[-1].update(details)
+
+def format_bytes(count):
+    for unit in ["B", "KB", "MB"]:
+        if count < 1024:
+            return "{0:.0f} {1}".format(count, unit) if unit == "B" else "{0:.1f} {1}".format(count, unit)
+        count /= 1024.0
+    return "{0:.1f} GB".format(count)
+
+def profile_summary(events):
+    """
+    Totals of the profiled spans by category & name, slowest first
+    returns => List<dict> with "cat", "name", "calls", "seconds", "max_seconds", "request_bytes", "response_bytes"
     """
-    value = btc * 100000000
-    return int(value)
+    totals = {}
+    for event in events:
+        total = totals.setdefault((event["cat"], event["name"]), {
+            "cat": event["cat"], "name": event["name"], "calls": 0, "seconds": 0.0, "max_seconds": 0.0,
+            "request_bytes": 0, "response_bytes": 0})
+        total["calls"] += 1
+        total["seconds"] += event["dur"] / 1e6
+        total["max_seconds"] = max(total["max_seconds"], event["dur"] / 1e6)
+        total["request_bytes"] += event["args"].get("request_bytes", 0)
+        total["response_bytes"] += event["args"].get("response_bytes", 0)
+    return sorted(totals.values(), key=lambda total: (total["cat"] != "stage", -total["seconds"]))
+
+def write_profile():
+    """Print the profile summary table to stderr & write the trace file"""
+    elapsed = time.time() - profile_start
+    events = sorted(profile_events, key=lambda event: event["ts"])
+    summary = profile_summary(events)
+
+    sys.stderr.write("\nprofile: {0:.3f} s total, {1} spans\n".format(elapsed, len(events)))
+    sys.stderr.write(PROFILE_SUMMARY_HEADER.format("kind", "name", "calls", "total ms", "mean ms", "max ms", "sent", "received") + "\n")
+    for total in summary:
+        sys.stderr.write(PROFILE_SUMMARY_ROW.format(
+            total["cat"], total["name"][:28], total["calls"], total["seconds"] * 1000,
+            total["seconds"] * 1000 / total["calls"], total["max_seconds"] * 1000,
+            format_bytes(total["request_bytes"]) if total["cat"] == "rpc" else "",
+            format_bytes(total["response_bytes"]) if total["cat"] == "rpc" else "").rstrip() + "\n")
 
-def verbose(content):
-    if verbose_mode: print content
+    try:
+        with open(profile_path, "w") as f:
+            if profile_path.endswith(".jsonl"):
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+            else:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                           "otherData": {"command": " ".join(sys.argv[1:]), "summary": summary}}, f)
+                f.write("\n")
+    except IOError as e:
+        sys.stderr.write("WARNING: could not write profile {0}: {1}\n".format(profile_path, e.strerror))
+        return
+    sys.stderr.write("profile trace written to {0}\n".format(profile_path))
 
 ################################################################################################
 #
@@ -98,19 +321,23 @@ def verbose(content):
 
 def bitcoin_cli_call_json(*args, **kwargs):
     """
-    Run `bitcoin-cli` using subprocess.check_output, parse output as JSON
+    Run `bitcoin-cli` (or the equivalent JSON-RPC call), parse output as JSON
+    Results of read-only requests (CACHEABLE_RPCS) are memoized in the result cache
     """
-    return json.loads(process_bitcoin_cli_call(*args, **kwargs))
+    if args and args[0] in CACHEABLE_RPCS:
+        return cached_call(cache_request("bitcoind", args),
+                           lambda: process_bitcoin_cli_call(*args, parse_json=True, **kwargs))
+    return process_bitcoin_cli_call(*args, parse_json=True, **kwargs)
 
 def bitcoin_cli_call(*args, **kwargs):
     """
-    Run `bitcoin-cli` using subprocess.check_output
+    Run `bitcoin-cli` (or the equivalent JSON-RPC call) using subprocess.check_output semantics
     """
     return process_bitcoin_cli_call(*args, **kwargs)
 
 def bitcoin_cli_call_no_output_check(*args, **kwargs):
     """
-    Run `bitcoin-cli` using subprocess.call
+    Run `bitcoin-cli` (or the equivalent JSON-RPC call) using subprocess.call semantics
     """
     return process_bitcoin_cli_call(*args, subprocess_call=True, **kwargs)
 
@@ -121,35 +348,602 @@ def bitcoin_daemon_call(*args, **kwargs):
     """
     return bitcoin_cli_call_no_output_check(*args, use_bitcoind=True, silent=True, **kwargs)
 
+@profiled("rpc", None)
 def process_bitcoin_cli_call(*args, **kwargs):
     """
-    Run a subprocess (bitcoind or bitcoin-cli)
+    Run a subprocess (bitcoind or bitcoin-cli), or send the bitcoin-cli request over JSON-RPC
     Returns => return value of subprocess.call() or subprocess.check_output()
+               (or the parsed JSON output if parse_json is set)
     args: for bitcoind or bitcoin-cli (e.g. decoderawtransaction)
     kwargs:
       subprocess_call: if True use subprocess.call rather than subprocess.check_output
       use_bitcoind: use bitcoind instead of bitcoin-cli
       silent: if True, redirect stdout & stderr to /dev/null
+      parse_json: if True, parse the output as JSON
     By default: shell=False used for subprocessed calls
     All bitcoin-cli & bitcoind calls should go through this function
     """
-    daemon_or_client = "bitcoind" if kwargs.pop('use_bitcoind', False) else "bitcoin-cli"
-    subfunction = subprocess.call if kwargs.pop('subprocess_call', None) else subprocess.check_output
+    use_bitcoind = kwargs.pop('use_bitcoind', False)
+    subprocess_call = kwargs.pop('subprocess_call', None)
     silent = kwargs.pop('silent', False)
+    parse_json = kwargs.pop('parse_json', False)
     if kwargs: raise TypeError('Unexpected **kwargs: %r' % kwargs)
-    full_cmd = [daemon_or_client] + cli_args + list(args)
+
+    if rpc_backend == "replay":
+        if silent:
+            return 0  # starting bitcoind or checking it's up: there is none to wait for
+        profile_note(transport="replay")
+        result, error = replay_rpc_response(args)
+        return format_rpc_response(args, result, error, subprocess_call, silent, parse_json)
+
+    if not use_bitcoind and rpc_backend == "http":
+        try:
+            return process_bitcoin_rpc_call(args, subprocess_call, silent, parse_json)
+        except BitcoinRPCUnavailable as e:
+            # bitcoind not (yet) reachable over HTTP; keep the original bitcoin-cli behavior
+            verbose("bitcoin rpc unavailable ({0}), falling back to bitcoin-cli\n".format(e))
+
+    daemon_or_client = "bitcoind" if use_bitcoind else "bitcoin-cli"
+    subfunction = subprocess.call if subprocess_call else subprocess.check_output
+    wallet_args = ["-rpcwallet=" + session_wallet] if session_wallet and not use_bitcoind else []
+    full_cmd = [daemon_or_client] + cli_args + wallet_args + list(args)
     subprocess_args = { 'shell': False }
     devnull = None
     if silent:
         devnull = open("/dev/null")
         subprocess_args.update({ 'stdout': devnull, 'stderr': devnull })
-    verbose("bitcoin cli call:\n  {0}\n".format(full_cmd))
-    cmd_output = subfunction(full_cmd, **subprocess_args)
-    if devnull:
-        devnull.close()
-    verbose("bitcoin cli call output:\n  {0}\n".format(cmd_output))
+    verbose("bitcoin cli call:\n  {0}\n", full_cmd)
+    profile_note(transport="cli", request_bytes=sum(len(arg) for arg in full_cmd))
+    try:
+        cmd_output = subfunction(full_cmd, **subprocess_args)
+    except subprocess.CalledProcessError as e:
+        if not use_bitcoind:
+            record_rpc_response(args, None, {"code": -e.returncode, "message": e.output})
+        raise
+    finally:
+        if devnull:
+            devnull.close()
+    verbose("bitcoin cli call output:\n  {0}\n", cmd_output)
+    if not subprocess_call:
+        profile_note(response_bytes=len(cmd_output))
+    if rpc_record_file and not use_bitcoind and not silent:
+        if subprocess_call:
+            record_rpc_response(args, None, {"code": -cmd_output, "message": None} if cmd_output else None)
+        else:
+            try:
+                result = parse_rpc_json(cmd_output)
+            except ValueError:
+                record_rpc_response(args, cmd_output.strip(), None)  # string results (e.g. hex) are printed unquoted
+            else:
+                record_rpc_response(args, result, None)
+                if parse_json:
+                    return result
+    if parse_json:
+        return parse_rpc_json(cmd_output)
     return cmd_output
 
+################################################################################################
+#
+# JSON-RPC helper functions
+#
+# A drop-in replacement for spawning `bitcoin-cli`: requests are sent straight to bitcoind's
+# RPC port over a single kept-alive HTTP connection, authenticated with the RPC cookie.
+#
+################################################################################################
+
+class BitcoinRPCUnavailable(Exception):
+    """bitcoind could not be reached over HTTP (not running, or no cookie file yet)"""
+
+
+class BitcoinRPCError(subprocess.CalledProcessError):
+    """
+    bitcoind returned an error for a request.
+    Subclasses CalledProcessError so callers see the same exception as a failing bitcoin-cli.
+    """
+    def __init__(self, method, error):
+        self.code = error.get("code")
+        self.message = error.get("message")
+        subprocess.CalledProcessError.__init__(self, abs(self.code or 1), ["bitcoin-cli", method],
+                                               "error code: {0}\nerror message:\n{1}".format(self.code, self.message))
+
+
+rpc_connection = None
+rpc_auth_header = None
+session_wallet = None  # wallet requests go to, see ensure_session_wallet; None for bitcoind's default wallet
+
+def read_rpc_cookie():
+    """
+    Read the RPC auth cookie written by bitcoind
+    returns => <string> value for the HTTP Authorization header
+    """
+    try:
+        with open(rpc_cookie_file) as f:
+            cookie = f.read().strip()
+    except IOError as e:
+        raise BitcoinRPCUnavailable("cannot read RPC cookie {0}: {1}".format(rpc_cookie_file, e.strerror))
+    return "Basic " + base64.b64encode(cookie)
+
+
+def parse_rpc_json(text):
+    """
+    Parse JSON from bitcoind the way bitcoin-cli does: object keys keep their order, and
+    amounts keep their exact digits
+    returns => parsed JSON, with objects as OrderedDict and non-integer numbers as Decimal
+    """
+    return json.loads(text, object_pairs_hook=OrderedDict, parse_float=Decimal)
+
+
+def format_rpc_json(value, indent=0, level=1):
+    """
+    Serialize JSON as bitcoind's UniValue writes it: compact, or (with indent) byte-for-byte what
+    bitcoin-cli prints. Decimal amounts are written with their digits, never in exponent notation.
+    returns => <string>
+
+    value: JSON value, e.g. from parse_rpc_json
+    indent: <int> spaces per level; 0 for compact output
+    level: <int> nesting level of value (1 at the top)
+    """
+    if isinstance(value, dict):
+        opening, closing = "{", "}"
+        items = ["{0}:{1}{2}".format(format_rpc_json(key), " " if indent else "", format_rpc_json(item, indent, level + 1))
+                 for key, item in value.items()]
+    elif isinstance(value, (list, tuple)):
+        opening, closing = "[", "]"
+        items = [format_rpc_json(item, indent, level + 1) for item in value]
+    elif isinstance(value, Decimal):
+        return "{0:f}".format(value)
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, unicode):
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+    else:
+        return json.dumps(value)
+
+    if not indent:
+        return opening + ",".join(items) + closing
+    # UniValue puts every item on its own line, and the closing bracket on a line of its own
+    # even when there are no items
+    return (opening + "\n" + "".join(" " * indent * level + item + ",\n" for item in items[:-1]) +
+            "".join(" " * indent * level + item + "\n" for item in items[-1:]) +
+            " " * indent * (level - 1) + closing)
+
+
+def rpc_params(method, args):
+    """
+    Convert bitcoin-cli style string arguments into JSON-RPC params
+    returns => List
+
+    method: <string> RPC method name
+    args: List<string> arguments as they would be passed to bitcoin-cli
+    """
+    json_positions = RPC_JSON_PARAMS.get(method, [])
+    return [parse_rpc_json(arg) if i in json_positions else arg for i, arg in enumerate(args)]
+
+
+def rpc_post(payload):
+    """
+    POST a JSON-RPC payload to bitcoind, reusing the open connection when possible
+    returns => parsed JSON response body
+
+    payload: <dict> or List<dict> (for batch requests)
+    """
+    global rpc_connection, rpc_auth_header
+
+    body = format_rpc_json(payload)
+    method = payload.get("method") if isinstance(payload, dict) else "batch"
+    for attempt in range(2):
+        if rpc_auth_header is None:
+            rpc_auth_header = read_rpc_cookie()
+        if rpc_connection is None:
+            rpc_connection = httplib.HTTPConnection(rpc_host, rpc_port, timeout=RPC_TIMEOUT)
+        elif rpc_connection.sock is not None and select.select([rpc_connection.sock], [], [], 0)[0]:
+            # bitcoind closed the idle keep-alive connection (the socket reads as EOF); reconnect
+            rpc_connection.close()
+        try:
+            path = "/wallet/" + urllib.quote(session_wallet, safe="") if session_wallet else "/"
+            rpc_connection.request("POST", path, body, {
+                "Authorization": rpc_auth_header,
+                "Content-Type": "application/json",
+                "Connection": "keep-alive"})
+        except (httplib.HTTPException, socket.error) as e:
+            # the request wasn't sent, so bitcoind hasn't acted on it: safe to try once more
+            rpc_connection.close()
+            rpc_connection = None
+            if attempt == 0:
+                continue
+            raise BitcoinRPCUnavailable("cannot connect to {0}:{1}: {2}".format(rpc_host, rpc_port, e))
+        try:
+            response = rpc_connection.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, socket.error) as e:
+            # bitcoind may already have carried out the request (importprivkey, createwallet...),
+            # so it must not be sent again, over HTTP or by falling back to bitcoin-cli
+            rpc_connection.close()
+            rpc_connection = None
+            return {"result": None, "error": {"code": None, "message": "connection to bitcoind lost after sending "
+                                              "the {0} request: {1}".format(method, e)}}
+        profile_note(transport="http", request_bytes=len(body), response_bytes=len(data))
+
+        if response.status == httplib.UNAUTHORIZED:
+            # bitcoind was restarted and wrote a new cookie; it rejected the request without running it
+            rpc_auth_header = None
+            if attempt == 0:
+                continue
+            raise BitcoinRPCUnavailable("RPC authorization failed")
+        try:
+            return parse_rpc_json(data)
+        except ValueError:
+            raise BitcoinRPCUnavailable("unexpected HTTP {0} response from bitcoind".format(response.status))
+
+
+def format_rpc_result(result):
+    """
+    Render an RPC result the way bitcoin-cli prints it
+    returns => <string>
+    """
+    if result is None:
+        return ""
+    if isinstance(result, basestring):
+        return result + "\n"
+    return format_rpc_json(result, 2) + "\n"
+
+
+def process_bitcoin_rpc_call(args, subprocess_call, silent, parse_json):
+    """
+    Perform a bitcoin-cli request over JSON-RPC, mimicking the subprocess return conventions
+    of process_bitcoin_cli_call
+    """
+    method = args[0]
+    params = rpc_params(method, args[1:])
+    verbose("bitcoin rpc call:\n  {0} {1}\n", method, params)
+    response = rpc_post({"jsonrpc": "1.0", "id": "glacier", "method": method, "params": params})
+
+    result, error = response.get("result"), response.get("error")
+    if not silent:
+        record_rpc_response(args, result, error)
+    return format_rpc_response(args, result, error, subprocess_call, silent, parse_json)
+
+def format_rpc_response(args, result, error, subprocess_call, silent, parse_json):
+    """
+    Turn the result or error of a bitcoin-cli request into what process_bitcoin_cli_call returns
+    """
+    method = args[0]
+    if error:
+        if not silent:
+            sys.stderr.write("error code: {0}\nerror message:\n{1}\n".format(error.get("code"), error.get("message")))
+        if subprocess_call:
+            return abs(error.get("code") or 1)
+        raise BitcoinRPCError(method, error)
+
+    verbose("bitcoin rpc call output:\n  {0}\n", result)
+    if subprocess_call:
+        if not silent:
+            sys.stdout.write(format_rpc_result(result))
+        return 0
+    if parse_json:
+        return result
+    return format_rpc_result(result)
+
+def bitcoin_cli_call_batch(calls, batch_size=RPC_BATCH_SIZE):
+    """
+    Run several bitcoin-cli requests, as JSON-RPC batches of at most batch_size requests
+    returns => List<(result, error)> in the same order as calls; error is None or
+               {"code": <int>, "message": <string>}
+
+    calls: List<tuple> bitcoin-cli arguments for each request, e.g. ("decoderawtransaction", hex)
+    """
+    results = [None] * len(calls)
+    misses = []
+    for i, call in enumerate(calls):
+        if call[0] in CACHEABLE_RPCS:
+            found, result = cache_lookup(cache_request("bitcoind", call))
+            if found:
+                results[i] = (result, None)
+                continue
+        misses.append(i)
+
+    missed_results = None
+    if rpc_backend == "replay":
+        missed_results = [replay_rpc_response(calls[i]) for i in misses]
+    elif rpc_backend == "http":
+        try:
+            missed_results = process_bitcoin_rpc_batch([calls[i] for i in misses], batch_size)
+        except BitcoinRPCUnavailable as e:
+            verbose("bitcoin rpc unavailable ({0}), falling back to bitcoin-cli\n".format(e))
+        else:
+            for i, (result, error) in zip(misses, missed_results):
+                record_rpc_response(calls[i], result, error)
+
+    if missed_results is None:
+        missed_results = []
+        for i in misses:
+            try:
+                output = process_bitcoin_cli_call(*calls[i])
+                try:
+                    result = parse_rpc_json(output)
+                except ValueError:
+                    result = output.strip()  # bitcoin-cli prints string results (e.g. hex) unquoted
+                missed_results.append((result, None))
+            except subprocess.CalledProcessError as e:
+                missed_results.append((None, {"code": getattr(e, "code", -e.returncode), "message": e.output}))
+
+    for i, (result, error) in zip(misses, missed_results):
+        results[i] = (result, error)
+        if not error and calls[i][0] in CACHEABLE_RPCS:
+            cache_store(cache_request("bitcoind", calls[i]), result)
+    return results
+
+
+def process_bitcoin_rpc_batch(calls, batch_size):
+    """
+    Send bitcoin-cli style requests to bitcoind as JSON-RPC batches
+    returns => List<(result, error)> in the same order as calls
+    """
+    results = []
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        payload = [{"jsonrpc": "1.0", "id": i, "method": call[0], "params": rpc_params(call[0], call[1:])}
+                   for i, call in enumerate(chunk)]
+        verbose("bitcoin rpc batch call:\n  {0} requests ({1})\n", len(chunk), ", ".join(sorted(set(call[0] for call in chunk))))
+        response = post_rpc_batch(payload)
+        if not isinstance(response, list):
+            # bitcoind rejects a whole batch (e.g. parse error) with a single error object
+            error = response.get("error") or {"code": None, "message": "invalid batch response"}
+            results += [(None, error)] * len(chunk)
+            continue
+        by_id = dict((item.get("id"), item) for item in response)
+        for i in range(len(chunk)):
+            item = by_id.get(i, {"error": {"code": None, "message": "no response for request"}})
+            results.append((item.get("result"), item.get("error")))
+    return results
+
+@profiled("rpc", "batch")
+def post_rpc_batch(payload):
+    """rpc_post one JSON-RPC batch, profiled as a single "batch" request"""
+    profile_note(requests=len(payload))
+    return rpc_post(payload)
+
+
+def bitcoin_cli_call_batch_or_fail(calls, describe):
+    """
+    Run bitcoin_cli_call_batch, raising on the first failed request
+    returns => List of results in the same order as calls
+
+    describe: <function> index => <string> description of the request, used in error output
+    """
+    results = []
+    for i, (result, error) in enumerate(bitcoin_cli_call_batch(calls)):
+        if error:
+            print "ERROR: bitcoind could not process {0}: {1}".format(describe(i), error.get("message"))
+            raise BitcoinRPCError(calls[i][0], error)
+        results.append(result)
+    return results
+
+################################################################################################
+#
+# RPC session recording & replay
+#
+# --rpc-record appends every bitcoind request & its response to a session file (JSON lines), and
+# --rpc-replay answers requests from such a file instead of bitcoind. A withdrawal can then be
+# rehearsed, or a past ceremony re-run for an audit, without starting bitcoind at all.
+# Requests are matched exactly, by the sha256 of the whole request; a request made more than
+# once gets its responses in the order they were recorded, and an unrecorded request fails.
+# Private keys are not written to the session file: their parameters are replaced by a hash.
+#
+################################################################################################
+
+RPC_SECRET_PARAMS = {"importprivkey": [0], "signrawtransactionwithkey": [1]}
+RPC_REPLAY_MISSING = -1  # error code for requests that aren't in the session (RPC_MISC_ERROR)
+RPC_SESSION_WALLET = "<session wallet>"
+
+rpc_record_file = None
+rpc_replay_file = None
+rpc_replay_responses = None  # request hash => List<(result, error)> not replayed yet
+
+def session_params(args):
+    """
+    The parameters of a request as they are recorded: the throwaway wallet's path, which differs
+    in every run (see ensure_session_wallet), is replaced by a placeholder
+    returns => List<string>
+    """
+    wallet = session_wallet_dir and os.path.join(session_wallet_dir, "wallet")
+    return [RPC_SESSION_WALLET if wallet and param == wallet else param for param in args[1:]]
+
+def rpc_request_hash(args):
+    return hash_sha256(json.dumps([args[0]] + session_params(args)))
+
+def record_rpc_response(args, result, error):
+    """
+    Append a request & its response to the session file, if recording
+    Written with a single append, so the processes of sign_transaction_sharded can share the file.
+
+    args: <tuple> bitcoin-cli arguments of the request
+    """
+    if not rpc_record_file:
+        return
+    params = session_params(args)
+    for i in RPC_SECRET_PARAMS.get(args[0], []):
+        if i < len(params):
+            params[i] = "<redacted sha256:{0}>".format(hash_sha256(params[i]))
+    line = format_rpc_json(OrderedDict([("method", args[0]), ("request", rpc_request_hash(args)), ("params", params),
+                                        ("result", result), ("error", error)])) + "\n"
+    fd = os.open(rpc_record_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def read_rpc_session(path):
+    """
+    Load a session file written by record_rpc_response
+    returns => {<string> request hash: List<(result, error)>}
+    """
+    responses = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = parse_rpc_json(line)
+                    responses.setdefault(entry["request"], []).append((entry["result"], entry["error"]))
+    except (IOError, ValueError, KeyError, TypeError) as e:
+        print "ERROR: could not read RPC session {0}: {1}. Exiting...".format(path, e)
+        sys.exit()
+    return responses
+
+def replay_rpc_response(args):
+    """
+    Answer a request from the recorded session
+    returns => (result, error) as recorded; the error for a request that wasn't recorded (or not
+               as many times) says so, and is raised like any bitcoind error by the callers
+    """
+    global rpc_replay_responses
+    if rpc_replay_responses is None:
+        rpc_replay_responses = read_rpc_session(rpc_replay_file)
+    responses = rpc_replay_responses.get(rpc_request_hash(args))
+    if not responses:
+        return None, {"code": RPC_REPLAY_MISSING, "message": "no recorded response to this {0} request in RPC session {1}; "
+                      "the run differs from the recorded one".format(args[0], rpc_replay_file)}
+    return responses.pop(0)
+
+
+################################################################################################
+#
+# Result cache
+#
+# Memoizes read-only requests (decoding transactions & scripts) under the sha256 of the request,
+# in a bounded in-memory LRU and optionally in a cache directory on disk.
+# Entries are stored as JSON text, so every hit returns a fresh copy that callers may modify, and
+# the full request is compared on every hit: a stale, colliding or corrupt entry can only ever
+# cause a miss, never a different result.
+#
+################################################################################################
+
+CACHEABLE_RPCS = ("decoderawtransaction", "decodescript")
+
+cache_max_entries = 256
+cache_max_bytes = 64 * 1024 * 1024
+cache_dir = None
+cache_stats = {"hits": 0, "misses": 0}
+result_cache = OrderedDict()
+result_cache_bytes = 0
+
+
+def cache_request(backend, args):
+    """
+    The request a cached result is stored under
+    returns => List
+
+    backend: <string> what computes the result ("bitcoind" or "local")
+    args: bitcoin-cli style arguments, e.g. ("decoderawtransaction", hex)
+    """
+    return [backend, "testnet" if testnet_mode else "mainnet"] + list(args)
+
+
+def cache_entry_is_valid(entry, request):
+    """
+    Check a cache entry really holds the result for request
+    returns => <boolean>
+    """
+    try:
+        if entry["request"] != request or hash_sha256(entry["result"]) != entry["checksum"]:
+            return False
+        if request[2] == "decoderawtransaction":
+            # the decoded wtxid must be the hash of the very transaction that was asked for
+            result = parse_rpc_json(entry["result"])
+            return result["hash"] == sha256d(request[3].strip().decode("hex"))[::-1].encode("hex")
+        return True
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+
+
+def cache_lookup(request):
+    """
+    Look up a cached result
+    returns => (<boolean> found, result)
+    """
+    if cache_max_entries <= 0 and not cache_dir:
+        return False, None
+
+    key = hash_sha256(json.dumps(request))
+    entry = forget_cache_entry(key)
+    if entry is None and cache_dir:
+        try:
+            with open(os.path.join(cache_dir, key + ".json")) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            entry = None
+
+    if entry is None or not cache_entry_is_valid(entry, request):
+        cache_stats["misses"] += 1
+        return False, None
+
+    cache_stats["hits"] += 1
+    remember_cache_entry(key, entry)
+    return True, parse_rpc_json(entry["result"])
+
+
+def cache_entry_size(entry):
+    return len(entry["result"]) + len(entry["request"][-1])
+
+
+def forget_cache_entry(key):
+    """Remove an entry from the in-memory cache, returning it (or None)"""
+    global result_cache_bytes
+    entry = result_cache.pop(key, None)
+    if entry is not None:
+        result_cache_bytes -= cache_entry_size(entry)
+    return entry
+
+
+def remember_cache_entry(key, entry):
+    """Insert an entry as most recently used, evicting the least recently used ones over the bounds"""
+    global result_cache_bytes
+    if cache_max_entries <= 0:
+        return
+    forget_cache_entry(key)
+    result_cache[key] = entry
+    result_cache_bytes += cache_entry_size(entry)
+    while len(result_cache) > cache_max_entries or result_cache_bytes > cache_max_bytes:
+        forget_cache_entry(next(iter(result_cache)))
+
+
+def cache_store(request, result):
+    """Store a result in the in-memory cache and, if enabled, the disk cache"""
+    if cache_max_entries <= 0 and not cache_dir:
+        return
+
+    key = hash_sha256(json.dumps(request))
+    text = format_rpc_json(result)
+    entry = {"request": request, "result": text, "checksum": hash_sha256(text)}
+    remember_cache_entry(key, entry)
+
+    if cache_dir:
+        # write to a temporary file & rename, so concurrent runs never read a partial entry
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.rename(tmp_path, os.path.join(cache_dir, key + ".json"))
+        except (IOError, OSError) as e:
+            verbose("could not write cache entry {0}: {1}".format(key, e))
+
+
+def cached_call(request, compute):
+    """
+    Return the cached result for request, or compute() it and cache it
+    """
+    found, result = cache_lookup(request)
+    if found:
+        return result
+    result = compute()
+    cache_store(request, result)
+    return result
+
+
+def report_cache_stats():
+    if cache_stats["hits"] or cache_stats["misses"]:
+        verbose("\nresult cache: {0} hits, {1} misses".format(cache_stats["hits"], cache_stats["misses"]))
+
 ################################################################################################
 #
 # Read & validate random data from the user
@@ -288,16 +1082,23 @@ def hex_private_key_to_WIF_private_key(hex_key):
     returns => <string> in hex format
     """
 
-    hex_key_with_prefix = wif_prefix + hex_key + "01"
+    return b58check_encode((wif_prefix + hex_key + "01").decode("hex"))
 
-    h1 = hash_sha256(hex_key_with_prefix.decode("hex"))
-    h2 = hash_sha256(h1.decode("hex"))
-    checksum = h2[0:8]
 
-    wif_key_before_base58Check = hex_key_with_prefix + checksum
-    wif_key = b58encode(wif_key_before_base58Check.decode("hex"))
+def seeds_to_WIF_private_key(dice_seed_string, rng_seed_string):
+    """
+    Combine dice & computer entropy into a private key
+    returns => <string> WIF private key
+
+    dice_seed_string: <string> validated dice rolls
+    rng_seed_string: <string> validated hex computer entropy
+    """
+    dice_seed_hash = hash_sha256(dice_seed_string)
+    rng_seed_hash = hash_sha256(rng_seed_string)
 
-    return wif_key
+    # back to hex string
+    hex_private_key = xor_hex_strings(dice_seed_hash, rng_seed_hash)
+    return hex_private_key_to_WIF_private_key(hex_private_key)
 
 
 ################################################################################################
@@ -306,26 +1107,66 @@ def hex_private_key_to_WIF_private_key(hex_key):
 #
 ################################################################################################
 
+# bitcoind options for a quick start on the offline Quarantined Laptop: no peer connections or
+# listening socket, the minimum database cache, no block verification at startup and no mempool
+# file to load.
+BITCOIND_OFFLINE_ARGS = ["-connect=0.0.0.0", "-listen=0", "-dnsseed=0", "-upnp=0", "-dbcache=4",
+                         "-checkblocks=1", "-checklevel=0", "-persistmempool=0"]
+BITCOIND_START_TIMEOUT = 30  # seconds
+BITCOIND_POLL_INITIAL = 0.05  # seconds; doubled after every unsuccessful readiness check
+BITCOIND_POLL_MAX = 1.0
+
+bitcoind_known_running = False
+
+def bitcoind_pid():
+    """
+    Get the pid of the bitcoind using our data directory, from its pidfile
+    returns => <int> pid, or None if there is no such running process
+    """
+    pidfile = os.path.join(os.path.dirname(rpc_cookie_file), "bitcoind.pid")
+    try:
+        with open(pidfile) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (IOError, OSError, ValueError):
+        return None
+    return pid
+
+def bitcoind_ready():
+    """
+    Check whether bitcoind is accepting RPC requests
+    returns => <boolean>
+    """
+    # fails (e.g. "Loading block index...") until bitcoind has finished starting up. There's no
+    # cookie file to check for first: a node set up with rpcuser/rpcpassword never writes one, and
+    # without it the request goes through bitcoin-cli, which reads those from bitcoin.conf.
+    return bitcoin_cli_call_no_output_check("getnetworkinfo", silent=True) == 0
+
 def ensure_bitcoind_running():
     """
     Start bitcoind (if it's not already running) and ensure it's functioning properly
+    Once bitcoind is known to be running, later calls return immediately.
     """
-
-    # start bitcoind.  If another bitcoind process is already running, this will just print an error
-    # message (to /dev/null) and exit.
-    #
-    # -connect=0.0.0.0 because we're doing local operations only (and have no network connection anyway)
-    bitcoin_daemon_call("-daemon", "-connect=0.0.0.0")
-
-    # verify bitcoind started up and is functioning correctly
-    times = 0
-    while times <= 20:
-        times += 1
-        if bitcoin_cli_call_no_output_check("getnetworkinfo", silent=True) == 0:
-            return
-        time.sleep(0.5)
-
-    raise Exception("Timeout while starting bitcoin server")
+    global bitcoind_known_running
+    if bitcoind_known_running:
+        return
+
+    if not bitcoind_ready():
+        if bitcoind_pid() is None:
+            # start bitcoind.  If another bitcoind process is already running, this will just print an error
+            # message (to /dev/null) and exit.
+            bitcoin_daemon_call("-daemon", *BITCOIND_OFFLINE_ARGS)
+
+        # verify bitcoind started up and is functioning correctly, checking often at first
+        deadline = time.time() + BITCOIND_START_TIMEOUT
+        delay = BITCOIND_POLL_INITIAL
+        while not bitcoind_ready():
+            if time.time() >= deadline:
+                raise Exception("Timeout while starting bitcoin server")
+            time.sleep(min(delay, max(deadline - time.time(), 0)))
+            delay = min(delay * 2, BITCOIND_POLL_MAX)
+
+    bitcoind_known_running = True
 
 def require_minimum_bitcoind_version(min_version):
     """
@@ -338,6 +1179,46 @@ def require_minimum_bitcoind_version(min_version):
         print "ERROR: Your bitcoind version is too old. You have {}, I need {} or newer. Exiting...".format(networkinfo["version"], min_version)
         sys.exit()
 
+session_wallet_dir = None
+session_wallet_labels = 0
+
+def ensure_session_wallet():
+    """
+    Create a throwaway bitcoind wallet for this run, and send all further requests to it
+    Keys imported to derive deposit addresses then never reach the default wallet, which would
+    otherwise grow with every ceremony, and one bitcoind can serve several runs at once without
+    them seeing each other's keys. The wallet is unloaded & deleted when the run ends.
+    """
+    global session_wallet, session_wallet_dir
+    if session_wallet:
+        return
+    ensure_bitcoind_running()
+    networkinfo = bitcoin_cli_call_json("getnetworkinfo")
+    # an absolute wallet name makes bitcoind create the wallet at that path, outside its own walletdir
+    session_wallet_dir = tempfile.mkdtemp(prefix="glacier-wallet-")
+    name = os.path.join(session_wallet_dir, "wallet")
+    if int(networkinfo["version"]) >= 210000:
+        # descriptor wallets (the default from v23) can't importprivkey; the option is new in v0.21
+        bitcoin_cli_call_json("createwallet", name, "false", "false", "", "false", "false")
+    else:
+        bitcoin_cli_call_json("createwallet", name)
+    session_wallet = name
+    atexit.register(remove_session_wallet)
+    verbose("\nusing throwaway wallet {0}".format(name))
+
+def remove_session_wallet():
+    """
+    Unload & delete the wallet made by ensure_session_wallet
+    """
+    global session_wallet
+    name, session_wallet = session_wallet, None
+    if name is None:
+        return
+    if bitcoin_cli_call_no_output_check("unloadwallet", name, silent=True) != 0:
+        print >>sys.stderr, "WARNING: could not unload wallet {0}; delete it once bitcoind has stopped".format(name)
+        return
+    shutil.rmtree(session_wallet_dir, ignore_errors=True)
+
 def get_address_for_wif_privkey(privkey):
     """A method for retrieving the address associated with a private key from bitcoin core
        <privkey> - a bitcoin private key in WIF format"""
@@ -345,13 +1226,15 @@ def get_address_for_wif_privkey(privkey):
     # Bitcoin Core doesn't have an RPC for "get the addresses associated w/this private key"
     # just "get the addresses associated with this label"
     # where "label" corresponds to an arbitrary tag we can associate with each private key
-    # so, we'll generate a unique "label" to attach to this private key.
+    # so, we'll give each private key its own label.
     #
-    # we're running on a fresh bitcoind installation in the Glacier Protocol, so there's no
-    # meaningful risk here of colliding with previously-existing labels.
-    label = str(random.randint(0, 2**128))
+    # the keys go into this run's own wallet (see ensure_session_wallet), so labels can't
+    # collide with any imported before.
+    global session_wallet_labels
+    ensure_session_wallet()
+    session_wallet_labels += 1
+    label = "key{0}".format(session_wallet_labels)
 
-    ensure_bitcoind_running()
     bitcoin_cli_call_no_output_check("importprivkey", privkey, label)
     addresses_json = bitcoin_cli_call_json("getaddressesbylabel", label)
 
@@ -371,29 +1254,94 @@ def addmultisigaddress(m, addresses_or_pubkeys, address_type='p2sh-segwit'):
     m: <int> number of multisig keys required for withdrawal
     addresses_or_pubkeys: List<string> either addresses or hex pubkeys for each of the N keys
     """
-    address_string = json.dumps(addresses_or_pubkeys)
+    ensure_session_wallet()
+    address_string = format_rpc_json(addresses_or_pubkeys)
     return bitcoin_cli_call_json("addmultisigaddress", str(m), address_string, address_type)
 
-def get_utxos(tx, address):
+@profiled("stage", "deposit address")
+def create_multisig_from_privkeys(m, privkeys, address_type='p2sh-segwit'):
     """
-    Given a transaction, find all the outputs that were sent to an address
-    returns => List<Dictionary> list of UTXOs in bitcoin core format
+    Derive the multisig address for WIF private keys in-process, without a bitcoind wallet
+    returns => <dict> same "address" & "redeemScript" fields as addmultisigaddress
 
-    tx - <Dictionary> in bitcoind core format
-    address - <string>
+    m: <int> number of multisig keys required for withdrawal
+    privkeys: List<string> WIF private keys for each of the N keys
     """
-    utxos = []
+    pubkeys = [wif_to_public_key(privkey, testnet_mode) for privkey in privkeys]
+    return create_multisig(m, pubkeys, address_type, testnet_mode)
 
-    for output in tx["vout"]:
-        if "addresses" not in output["scriptPubKey"]:
-            # In Bitcoin Core versions older than v0.16, native segwit outputs have no address decoded
-            continue
-        out_addresses = output["scriptPubKey"]["addresses"]
-        amount_btc = output["value"]
-        if address in out_addresses:
-            utxos.append(output)
+@profiled("stage", "index utxos")
+def index_utxos(input_txs, describe):
+    """
+    Index the outputs of the input transactions by address, built once when they're decoded
+    returns => {address <string>: List<dict> utxos}; each UTXO is an output in bitcoin core format
+               with the "txid" of its transaction & its value in satoshi ("satoshis") added, in input
+               transaction & output order
+    Exits if a transaction was given twice (or two copies with different witnesses, i.e. the
+    same txid), since its outputs would be spent twice.
+
+    input_txs: List<dict> input transactions (bitcoind decoded format)
+    describe: <function> index => <string> description of the transaction, used in error output
+    """
+    index = {}
+    first_seen = {}
+
+    for i, tx in enumerate(input_txs):
+        if tx["txid"] in first_seen:
+            j = first_seen[tx["txid"]]
+            relation = "is the same as" if tx["hash"] == input_txs[j]["hash"] else "has the same txid as"
+            print "ERROR: {0} {1} {2}; its outputs would be spent twice. Exiting...".format(describe(i), relation, describe(j))
+            sys.exit()
+        first_seen[tx["txid"]] = i
+
+        for output in tx["vout"]:
+            if "addresses" not in output["scriptPubKey"]:
+                # In Bitcoin Core versions older than v0.16, native segwit outputs have no address decoded
+                continue
+            utxo = dict(output)
+            utxo["txid"] = tx["txid"]
+            utxo["satoshis"] = vout_satoshis(output)
+            for address in set(output["scriptPubKey"]["addresses"]):
+                index.setdefault(address, []).append(utxo)
+
+    return index
+
+@profiled("stage", "decode inputs")
+def decode_raw_transactions(hex_txs, describe):
+    """
+    Decode raw transactions in-process (or with bitcoind's decoderawtransaction if requested)
+    returns => List<dict> decoded transactions (bitcoind decoded format), in the order of hex_txs
+
+    hex_txs: List<string> hex-encoded transactions
+    describe: <function> index => <string> description of the transaction, used in error output
+    """
+    if bitcoind_decoding:
+        return bitcoin_cli_call_batch_or_fail([("decoderawtransaction", hex_tx) for hex_tx in hex_txs], describe)
+
+    decoded = []
+    for i, hex_tx in enumerate(hex_txs):
+        try:
+            decoded.append(cached_call(cache_request("local", ["decoderawtransaction", hex_tx]),
+                                       lambda: decode_raw_transaction(hex_tx, testnet_mode)))
+        except TransactionDecodeError as e:
+            print "ERROR: could not decode {0}: {1}".format(describe(i), e)
+            raise
+        report_progress("Decoding input transactions", i + 1, len(hex_txs))
+    return decoded
+
+def read_keys_interactive():
+    """
+    Ask for the private keys to sign with
+    returns => List<string> WIF private keys
+    """
+    print "\nHow many private keys will you be signing this transaction with? "
+    key_count = int(raw_input("#: "))
 
-    return utxos
+    keys = []
+    while len(keys) < key_count:
+        key = raw_input("Key #{0}: ".format(len(keys) + 1))
+        keys.append(key)
+    return keys
 
 def get_raw_tx_interactive(unique_init_prompt):
     # handle inputting of raw tx hex. display initial prompt specific to the input
@@ -406,68 +1354,190 @@ def get_raw_tx_interactive(unique_init_prompt):
     print "  input a filename located in the current directory which contains the raw transaction data"
     print "  (If the transaction data is over ~4000 characters long, you _must_ use a file.):"
 
-    raw_tx = raw_input()
-    if os.path.isfile(raw_tx):
-        raw_tx = open(raw_tx).read().strip()
-    return raw_tx
+    return read_raw_tx(raw_input())
+
+def read_raw_tx(hex_or_filename, directory=""):
+    """
+    Get raw transaction hex given either the hex itself or the name of a file containing it
+    Multi-part QR code data (see qr_chunks.py) is reassembled: a file may hold all the parts, one
+    per line; a part entered directly is followed by the other parts on standard input.
+    returns => <string>
+
+    directory: <string> where relative filenames are looked up (default: current directory)
+    """
+    filename = os.path.join(directory, hex_or_filename)
+    if os.path.isfile(filename):
+        data = open(filename).read().strip()
+        if is_qr_chunk(data):
+            try:
+                return reassemble_payload(data.split())
+            except QRChunkError as e:
+                print "ERROR: could not reassemble the QR code parts in {0}: {1}. Exiting...".format(filename, e)
+                sys.exit()
+        return data
+    if is_qr_chunk(hex_or_filename):
+        return read_qr_parts_interactive(hex_or_filename)
+    return hex_or_filename
+
+RAW_TX_LINE = re.compile(r"[^\S\n]*([^\n]*?)[^\S\n]*(?:\n|\Z)")
+JSON_RAW_TX_ITEM = re.compile(r'\s*"([^"\\]*)"\s*([,\]])')
+JSON_LIST_END = re.compile(r"\s*\]\s*\Z")
+LEADING_SPACE = re.compile(r"\s*")
+
+def read_raw_tx_file(filename):
+    """
+    Read the raw transactions in a file: one hex transaction per line, or a JSON list of them
+    returns => List<string> hex-encoded transactions
+
+    The file is memory-mapped and each transaction is copied out of it once, so big files of big
+    transactions are never held in memory as whole-file strings.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        hex_txs = []
+        pos = LEADING_SPACE.match(data).end()
+
+        if data[pos:pos + 1] == "[":
+            pos += 1
+            if JSON_LIST_END.match(data, pos):
+                return hex_txs
+            while True:
+                item = JSON_RAW_TX_ITEM.match(data, pos)
+                if item is None:
+                    print "ERROR: {0} is not a JSON list of raw transactions. Exiting...".format(filename)
+                    sys.exit()
+                hex_txs.append(item.group(1))
+                pos = item.end()
+                if item.group(2) == "]":
+                    if LEADING_SPACE.match(data, pos).end() != len(data):
+                        print "ERROR: unexpected data after the JSON list in {0}. Exiting...".format(filename)
+                        sys.exit()
+                    return hex_txs
+
+        while pos < len(data):
+            line = RAW_TX_LINE.match(data, pos)
+            if line.group(1):
+                hex_txs.append(line.group(1))
+            pos = line.end()
+        return hex_txs
+    finally:
+        data.close()
+
+def reassemble_raw_txs(lines, filename):
+    """
+    Reassemble multi-part QR code data (see qr_chunks.py) among the transactions read from a file,
+    as read_raw_tx does: the parts of each transaction are replaced by the whole transaction, where
+    its first part was. Parts of several transactions may be in one file, in any order.
+    returns => List<string> hex-encoded transactions
+    """
+    if not any(is_qr_chunk(line) for line in lines):
+        return lines
+
+    hex_txs = []
+    parts = OrderedDict()  # (total, checksum) of a transaction => its parts
+    try:
+        for line in lines:
+            if is_qr_chunk(line):
+                index, total, checksum, data = parse_chunk(line)
+                if (total, checksum) not in parts:
+                    parts[(total, checksum)] = []
+                    hex_txs.append((total, checksum))
+                parts[(total, checksum)].append(line)
+            else:
+                hex_txs.append(line)
+        return [reassemble_payload(parts[tx]) if isinstance(tx, tuple) else tx for tx in hex_txs]
+    except QRChunkError as e:
+        print "ERROR: could not reassemble the QR code parts in {0}: {1}. Exiting...".format(filename, e)
+        sys.exit()
+
+@profiled("stage", "read inputs")
+def read_raw_txs(source, directory=""):
+    """
+    Get raw transactions given either the hex itself, or a file, directory or glob pattern of files
+    each containing one or more transactions (see read_raw_tx_file), or multi-part QR code data
+    returns => List<string> hex-encoded transactions, in filename order
+
+    directory: <string> where relative paths are looked up (default: current directory)
+    """
+    path = os.path.join(directory, source)
+    if os.path.isdir(path):
+        filenames = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if not name.startswith(".") and os.path.isfile(os.path.join(path, name)))
+    elif os.path.isfile(path):
+        filenames = [path]
+    elif re.search(r"[*?[]", source):
+        filenames = sorted(name for name in glob.glob(path) if os.path.isfile(name))
+        if not filenames:
+            print "ERROR: no files match {0}. Exiting...".format(path)
+            sys.exit()
+    else:
+        return [read_raw_tx(source)]
+
+    hex_txs = []
+    for i, filename in enumerate(filenames):
+        hex_txs.extend(reassemble_raw_txs(read_raw_tx_file(filename), filename))
+        report_progress("Reading input transaction files", i + 1, len(filenames))
+    return hex_txs
 
 def parse_part_signed_tx(source_address):
     # parses partially-signed transaction hex for tx data (to later re-sign)
     # inputs: source/cold address (arg), part-signed tx hex (manual in fn, passed as output)
-    # outputs parsed: redeem_script, dest_address, change_amount, withdrawal_amount, num_tx
+    # outputs parsed: redeem_script, dest_addresses, change_amount, withdrawal_amounts (one per destination), num_tx
     part_signed_tx_hex = get_raw_tx_interactive("For the partially-signed transaction")
 
-    part_signed_tx = bitcoin_cli_call_json("decoderawtransaction", part_signed_tx_hex)
+    part_signed_tx = decode_raw_transactions([part_signed_tx_hex], lambda i: "the partially-signed transaction")[0]
     redeem_script=part_signed_tx["vin"][0]["txinwitness"][-1]
     num_tx = len(part_signed_tx["vin"])
 
-    # parse change amount & destination address from partly-signed data
-    if len(part_signed_tx["vout"]) is 1:
+    # parse change amount & destination addresses from partly-signed data
+    if len(part_signed_tx["vout"]) == 1:
         verbose("only 1 transaction output indicates entire balance being withdrawn (change amount = 0)")
         #thus destination address data in vout[0]
-        change_amount = Decimal(0)
-        withdrawal_amount = Decimal(part_signed_tx["vout"][0]["value"]).quantize(SATOSHI_PLACES)
-        dest_address = part_signed_tx["vout"][0]["scriptPubKey"]["addresses"][0]
+        change_amount = 0
+        destination_vouts = part_signed_tx["vout"]
     else:
-        verbose("multiple outputs indicates change to be delivered back to cold storage address")
-        # ascertain where destination and change addresses are in vout array
-        cold_storage_vout_index = -1
-        destination_vout_index = -1
-        i = 0
-        for output in part_signed_tx["vout"]:
-            for address in output["scriptPubKey"]["addresses"]:
-                if address == source_address:
-                    cold_storage_vout_index = i
-                    break
-            i += 1
+        # ascertain which output (if any) is the change back to cold storage; all others are destinations
+        cold_storage_vouts = [output for output in part_signed_tx["vout"]
+                              if source_address in output["scriptPubKey"].get("addresses", [])]
 
-        if cold_storage_vout_index is -1:
-            print "could not find cold storage source address in partially signed transaction hex (more than 1 output without cold address found in these for change!)! exiting..."
+        if len(cold_storage_vouts) > 1:
+            print "found more than one output to the cold storage source address in partially signed transaction hex! exiting..."
             sys.exit()
-        if cold_storage_vout_index == 0:
-            destination_vout_index = 1
+        if len(cold_storage_vouts) == 0:
+            verbose("no output to the cold storage address indicates entire balance being withdrawn to several destinations (change amount = 0)")
+            change_amount = 0
+            destination_vouts = part_signed_tx["vout"]
         else:
-            destination_vout_index = 0
-        dest_address = part_signed_tx["vout"][destination_vout_index]["scriptPubKey"]["addresses"][0]
-
-        # now parse out amounts knowing array positions of source/destination vouts
-        change_amount = Decimal(part_signed_tx["vout"][cold_storage_vout_index]["value"]).quantize(SATOSHI_PLACES)
-        withdrawal_amount = Decimal(part_signed_tx["vout"][destination_vout_index]["value"]).quantize(SATOSHI_PLACES)
+            verbose("an output to the cold storage address indicates change to be delivered back to it")
+            destination_vouts = [output for output in part_signed_tx["vout"] if output is not cold_storage_vouts[0]]
+            change_amount = vout_satoshis(cold_storage_vouts[0])
 
         print"\nfollowing variables parsed from partially signed hex input & storage address:"
         print "\n    cold storage / source_address: {0} (for reference from manual input)".format(source_address)
+
+    dest_addresses = [output["scriptPubKey"]["addresses"][0] for output in destination_vouts]
+    withdrawal_amounts = [vout_satoshis(output) for output in destination_vouts]
+
     print "\n    redemption script: {0}".format(redeem_script)
-    print "\n    destination address: {0}".format(dest_address)
+    if len(dest_addresses) == 1:
+        print "\n    destination address: {0}".format(dest_addresses[0])
+    else:
+        for i, (dest_address, amount) in enumerate(zip(dest_addresses, withdrawal_amounts)):
+            print "\n    destination address #{0}: {1} ({2})".format(i + 1, dest_address, btc_string(amount))
     print "\n    number of input transactions: {0}".format(num_tx)
-    print "\n    change amount: {0}".format(change_amount)
-    print "\n    withdrawal amount: {0}".format(withdrawal_amount)
+    print "\n    change amount: {0}".format(btc_string(change_amount))
+    print "\n    withdrawal amount: {0}".format(btc_string(sum(withdrawal_amounts)))
 
     print "\n\nplease confirm whether above data is correct before proceeding to input additional data for transaction re-sign"
     confirm = yes_no_interactive()
     if not confirm:
         print "auto parsed data from transaction incorrect so aborting"
         sys.exit()
-    return part_signed_tx_hex, redeem_script, dest_address, change_amount, withdrawal_amount, num_tx
+    return part_signed_tx_hex, redeem_script, dest_addresses, change_amount, withdrawal_amounts, num_tx
 
 
 def check_fee_to_input_amt(fee, input_amount):
@@ -477,177 +1547,288 @@ def check_fee_to_input_amt(fee, input_amount):
         print "ERROR: Your fee is greater than the sum of your unspent transactions.  Try using larger unspent transactions. Exiting..."
         sys.exit()
 
-def zero_less_than_satoshi(btc):
-    # less than a satoshi due to weird floating point imprecision
-    # this originally applied only to change amount, but display problems can also happen with 0 Decimals
-    #   if attempt to display 0 with Decimal to satoshi will get 0E-8 (noted on consolidating btc display)
-    if btc < 1e-8:
-        btc = 0
-    return btc
-
-def btc_display(btc):
+def btc_display(satoshi):
     # streamline display of btc including mbtc if < 1 btc (& in comments microbtc if < 1 mbtc)
     #   reduce user errors (e.g. w counting decimals in fee checking)
     # note: calls SHOULD initially break existing testing as changing display output
     # 8 call points will include:
     #   get_fee_interactive: multiple calls ("bitcoins")
     #   withdraw_interactive: multiple calls ("BTC", "bitcoins")
-    btc = zero_less_than_satoshi(Decimal(btc).quantize(SATOSHI_PLACES))
-    
+    # satoshi: <int> amount; anything under a satoshi is shown as 0
+    if satoshi < 1:
+        return "0 btc"
+
     expanded_display_str = ""
-    if btc < 1 and btc > 0:
-        expanded_display_str = " ({} mbtc".format((btc*1000).quantize(SATOSHI_MBTC_PLACES))
+    if satoshi < SATOSHIS_PER_BTC:
+        expanded_display_str = " ({0}.{1:05d} mbtc".format(*divmod(satoshi, SATOSHIS_PER_MBTC))
         # following may be useful in future
-        # if btc < 0.001:
-        #    expanded_display_str += " = {} micro-btc".format(Decimal(btc*1000*1000).quantize(SATOSHI_MICROBTC_PLACES))
+        # if satoshi < SATOSHIS_PER_MBTC:
+        #    expanded_display_str += " = {0}.{1:02d} micro-btc".format(*divmod(satoshi, 100))
         expanded_display_str += ")"
-    return "{0} btc{1}".format(btc,expanded_display_str)
+    return "{0} btc{1}".format(format_amount(satoshi), expanded_display_str)
 
-def create_unsigned_transaction(source_address, destinations, redeem_script, input_txs):
+@profiled("stage", "create transaction")
+def create_unsigned_transaction(destinations, utxos):
     """
     Returns a hex string representing an unsigned bitcoin transaction
     returns => <string>
 
-    source_address: <string> input_txs will be filtered for utxos to this source address
-    destinations: {address <string>: amount<string>} dictionary mapping destination addresses to amount in BTC
-    redeem_script: <string>
-    input_txs: List<dict> List of input transactions in dictionary form (bitcoind decoded format)
+    destinations: {address <string>: amount <int>} dictionary mapping destination addresses to amount in satoshi
+    utxos: List<dict> UTXOs to spend, from index_utxos
     """
     ensure_bitcoind_running()
 
+    tx_unsigned_hex = bitcoin_cli_call(*createrawtransaction_args(destinations, utxos)).strip()
+
+    return tx_unsigned_hex
+
+
+def createrawtransaction_args(destinations, utxos):
+    """
+    Build the `bitcoin-cli createrawtransaction` request for create_unsigned_transaction
+    returns => <tuple> bitcoin-cli arguments
+    """
     # prune destination addresses sent 0 btc
-    for address, value in destinations.items():
-        if value == "0":
-            del destinations[address]
+    outputs = OrderedDict((address, btc_string(value)) for address, value in destinations.items() if value)
 
     # For each UTXO used as input, we need the txid and vout index to generate a transaction
     inputs = []
-    for tx in input_txs:
-        utxos = get_utxos(tx, source_address)
-        txid = tx["txid"]
-
-        for utxo in utxos:
-            inputs.append({
-                "txid": txid,
-                "vout": int(utxo["n"])
-            })
-
-    tx_unsigned_hex = bitcoin_cli_call("createrawtransaction", json.dumps(inputs), json.dumps(destinations)).strip()
+    for utxo in utxos:
+        inputs.append({
+            "txid": utxo["txid"],
+            "vout": int(utxo["n"])
+        })
 
-    return tx_unsigned_hex
+    return ("createrawtransaction", format_rpc_json(inputs), format_rpc_json(outputs))
 
 
-def sign_transaction(source_address, keys, redeem_script, unsigned_hex, input_txs):
+@profiled("stage", "sign")
+def sign_transaction(keys, redeem_script, unsigned_hex, utxos):
     """
     Creates a signed transaction
     output => dictionary {"hex": transaction <string>, "complete": <boolean>}
 
-    source_address: <string> input_txs will be filtered for utxos to this source address
     keys: List<string> The private keys you wish to sign with
     redeem_script: <string>
     unsigned_hex: <string> The unsigned transaction, in hex format
-    input_txs: List<dict> A list of input transactions to use (bitcoind decoded format)
+    utxos: List<dict> The UTXOs spent by the transaction, from index_utxos
+    """
+    if sign_jobs > 1 and len(utxos) > 1:
+        return sign_transaction_sharded(keys, redeem_script, unsigned_hex, utxos)
+    return bitcoin_cli_call_json(*signrawtransaction_args(keys, redeem_script, unsigned_hex, utxos))
+
+def sign_transaction_sharded(keys, redeem_script, unsigned_hex, utxos):
+    """
+    Creates a signed transaction, signing shards of its inputs concurrently in sign_jobs processes
+    output => dictionary {"hex": transaction <string>, "complete": <boolean>}, as sign_transaction
+
+    Each shard's signrawtransactionwithkey request only has the prevout data of the shard's own
+    inputs, so bitcoind signs just those. The scriptSigs & witnesses of each shard's inputs are then
+    merged in-process: combinerawtransaction can't be used, as it needs the inputs in bitcoind's
+    UTXO set, which an offline node doesn't have.
     """
+    try:
+        unsigned_tx = deserialize_transaction(unsigned_hex.decode("hex"))
+    except (TransactionDecodeError, TypeError) as e:
+        print "ERROR: could not decode the transaction to sign: {0}. Exiting...".format(e)
+        sys.exit()
+    input_index = dict(((txin["txid"], txin["vout"]), i) for i, txin in enumerate(unsigned_tx["vin"]))
+
+    num_shards = min(len(utxos), max(sign_jobs, -(-len(utxos) // SIGN_SHARD_MAX_INPUTS)))
+    bounds = [len(utxos) * i // num_shards for i in range(num_shards + 1)]
+    shards = [utxos[bounds[i]:bounds[i + 1]] for i in range(num_shards)]
+    calls = [signrawtransaction_args(keys, redeem_script, unsigned_hex, shard) for shard in shards]
+
+    results = [None] * num_shards
+    signed_inputs = 0
+    pool = multiprocessing.Pool(min(sign_jobs, num_shards), initializer=reset_rpc_connection)
+    try:
+        for i, result, error in pool.imap_unordered(sign_shard, enumerate(calls)):
+            if error:
+                print "ERROR: bitcoind could not sign inputs {0}-{1}: {2}".format(
+                    bounds[i] + 1, bounds[i + 1], error.get("message"))
+                raise BitcoinRPCError("signrawtransactionwithkey", error)
+            results[i] = result
+            signed_inputs += len(shards[i])
+            report_progress("Signing inputs", signed_inputs, len(utxos), len(shards[i]))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    # bitcoind verifies the scripts it signs: an input is complete unless its own shard reported an error
+    complete = True
+    signed_copies = []
+    for shard, result in zip(shards, results):
+        outpoints = set((utxo["txid"], int(utxo["n"])) for utxo in shard)
+        if any((error.get("txid"), error.get("vout")) in outpoints for error in result.get("errors", [])):
+            complete = False
+        signed_copies.append((result["hex"].decode("hex"),
+                              [input_index[outpoint] for outpoint in outpoints if outpoint in input_index]))
 
+    try:
+        signed_hex = combine_signed_inputs(unsigned_hex.decode("hex"), signed_copies).encode("hex")
+        signed_inputs = {}
+        for raw, indexes in signed_copies:
+            signed_copy = deserialize_transaction(raw)
+            for i in indexes:
+                signed_inputs[i] = signed_copy["vin"][i]
+        merged_tx = deserialize_transaction(signed_hex.decode("hex"))
+    except (TransactionDecodeError, TypeError) as e:
+        print "ERROR: could not merge the signed shards: {0}. Exiting...".format(e)
+        sys.exit()
+
+    # check the merge: each input carries what its own shard signed, and without those scriptSigs &
+    # witnesses it's the very transaction that was signed (not compared by txid, which covers the
+    # scriptSigs of P2SH & P2SH-P2WSH inputs)
+    for i, txin in enumerate(merged_tx["vin"]):
+        if i not in signed_inputs or (txin["script_sig"], txin["witness"]) != (
+                signed_inputs[i]["script_sig"], signed_inputs[i]["witness"]):
+            print "ERROR: input {0} of the merged transaction is not as its shard signed it. Exiting...".format(i + 1)
+            sys.exit()
+        txin["script_sig"], txin["witness"] = "", []
+    if serialize_transaction(merged_tx) != unsigned_hex.decode("hex"):
+        print "ERROR: the merged transaction is not the transaction that was signed. Exiting..."
+        sys.exit()
+    return {"hex": signed_hex, "complete": complete}
+
+def sign_shard(indexed_call):
+    """
+    Pool worker for sign_transaction_sharded: send one signrawtransactionwithkey request
+    returns => (<int> shard index, result, error) with error as in bitcoin_cli_call_batch
+    """
+    i, call = indexed_call
+    try:
+        return i, bitcoin_cli_call_json(*call), None
+    except subprocess.CalledProcessError as e:
+        return i, None, {"code": getattr(e, "code", -e.returncode), "message": getattr(e, "message", None) or e.output}
+
+def reset_rpc_connection():
+    """Pool worker initializer: open a new JSON-RPC connection rather than sharing the parent's socket"""
+    global rpc_connection
+    rpc_connection = None
+
+
+def signrawtransaction_args(keys, redeem_script, unsigned_hex, utxos):
+    """
+    Build the `bitcoin-cli signrawtransactionwithkey` request for sign_transaction
+    returns => <tuple> bitcoin-cli arguments
+    """
     # For each UTXO used as input, we need the txid, vout index, scriptPubKey, amount, and redeemScript
     # to generate a signature
     inputs = []
-    for tx in input_txs:
-        utxos = get_utxos(tx, source_address)
-        txid = tx["txid"]
-        for utxo in utxos:
-            inputs.append({
-                "txid": txid,
-                "vout": int(utxo["n"]),
-                "amount": utxo["value"],
-                "scriptPubKey": utxo["scriptPubKey"]["hex"],
-                "redeemScript": redeem_script
-            })
-
-    signed_tx = bitcoin_cli_call_json("signrawtransactionwithkey", unsigned_hex, json.dumps(keys), json.dumps(inputs))
-
-    return signed_tx
-
-def num_required_keys_from_redeem(redeem_script):
-    decoded_redeem_script = bitcoin_cli_call_json("decodescript",redeem_script)
-    return decoded_redeem_script["reqSigs"]
-
-def num_cur_signatures_from_witness(decoded_tx_witness):
-    # assumptions re *decoded* witness data:
-    #   first element blank
-    #   next elements: signatures (if signed) or blank (if unsigned)
-    #   last element redeem_script
-    # so to get current number of sigs iterate through elements and see if blank, ignoring 1st & last
-    num_sigs = 0
-    for i in range(1, (len(decoded_tx_witness) - 1)):
-        if not decoded_tx_witness[i]:
-            verbose("\nsignature place #{} is blank (unsigned)".format(i))
-        else:
-            verbose("\nsignature place #{0}: {1}".format(i,decoded_tx_witness[i]))
-            num_sigs+=1
-    return num_sigs
-    
-def revise_vsize_if_missing_keys(vsize, size, num_cur_sigs, num_req_sigs):
-    remaining_keys = int(num_req_sigs) - int(num_cur_sigs)
-    # key size: 73 bytes (142 hex chars; 72 bytes but then add 1 for opcode)
-    key_added_size = 73
-    stripped_size = ( (vsize * 4) - size ) / 3
-    final_size = size + (remaining_keys * key_added_size)
-    final_vsize = ((3 * stripped_size) + final_size) / 4
+    for utxo in utxos:
+        inputs.append({
+            "txid": utxo["txid"],
+            "vout": int(utxo["n"]),
+            "amount": btc_string(utxo["satoshis"]),
+            "scriptPubKey": utxo["scriptPubKey"]["hex"],
+            "redeemScript": redeem_script
+        })
+
+    return ("signrawtransactionwithkey", unsigned_hex, format_rpc_json(keys), format_rpc_json(inputs))
+
+def estimate_vsize(destinations, redeem_script, utxos):
+    """
+    Estimate the size of the fully-signed transaction, without building or signing it
+    returns => {"expected": <int>, "worst": <int>} vsize (see transaction.estimate_multisig_vsize)
+
+    destinations: {address <string>: amount <int>} dictionary mapping destination addresses to amount in satoshi
+    redeem_script: <string>
+    utxos: List<dict> UTXOs to spend, from index_utxos
+    """
+    redeem = redeem_script.decode("hex")
+    m, pubkeys = parse_multisig_redeem_script(redeem)
+    if m is None:
+        print "ERROR: the redemption script is not a multisig script. Exiting..."
+        sys.exit()
+
+    address_types = []
+    for utxo in utxos:
+        address_type = multisig_address_type(utxo["scriptPubKey"]["hex"].decode("hex"), redeem)
+        if address_type is None:
+            print "ERROR: the redemption script does not match the source address. Exiting..."
+            sys.exit()
+        address_types.append(address_type)
+
+    try:
+        output_scripts = [address_to_script_pubkey(address, testnet_mode) for address in destinations]
+    except InvalidAddressError as e:
+        print "ERROR: {0}. Exiting...".format(e)
+        sys.exit()
+
+    estimate = estimate_multisig_vsize(len(address_types), address_types, m, len(pubkeys), output_scripts,
+                                       redeem_script_size=len(redeem))
+    verbose("\nsize estimate for {0}-of-{1} spend of {2} input(s) ({3}) to {4} output(s):\n  expected vsize: {5}\n  worst-case vsize: {6}".format(
+        m, len(pubkeys), len(address_types), ", ".join(sorted(set(address_types))), len(output_scripts),
+        estimate["expected"], estimate["worst"]))
+    return estimate
+
+def select_withdrawal_inputs(source_address, destinations, redeem_script, utxos, fee_rate):
+    """
+    Choose which of the UTXOs to source_address to spend (see coin_selection.select_coins)
+    returns => (List<dict> the chosen UTXOs, <boolean> change output needed)
+    raises InsufficientFundsError
+
+    destinations: {address <string>: amount <int>} payments in satoshi, not including change
+    utxos: List<dict> candidate UTXOs, from index_utxos
+    fee_rate: <int> satoshis per vbyte
+    """
+    redeem = redeem_script.decode("hex")
+    m, pubkeys = parse_multisig_redeem_script(redeem)
+    if m is None:
+        print "ERROR: the redemption script is not a multisig script. Exiting..."
+        sys.exit()
+
+    candidates, segwit = [], False
+    for utxo in utxos:
+        address_type = multisig_address_type(utxo["scriptPubKey"]["hex"].decode("hex"), redeem)
+        if address_type is None:
+            print "ERROR: the redemption script does not match the source address. Exiting..."
+            sys.exit()
+        segwit = segwit or address_type != "p2sh"
+        candidates.append((utxo["satoshis"], multisig_input_weight(address_type, m, len(redeem))))
+
+    try:
+        output_scripts = [address_to_script_pubkey(address, testnet_mode) for address in destinations]
+        change_script = address_to_script_pubkey(source_address, testnet_mode)
+    except InvalidAddressError as e:
+        print "ERROR: {0}. Exiting...".format(e)
+        sys.exit()
 
-    verbose("\nrevise fee vars:\n  num_cur_sigs: {0}\n  num_req_sigs: {1}\n  calc'd remaining_keys: {2}\n  vsize: {3}\n  size: {4}\n  stripped_size: {5}\n  const key size: {6}\n  final_size: {7}\n  final (revised) vsize: {8}".format(num_cur_sigs, num_req_sigs, remaining_keys, vsize, size, stripped_size, key_added_size, final_size, final_vsize))
+    # version, input & output counts (at most), locktime, segwit marker & flag, and the payments
+    base_weight = ((4 + compact_size_len(len(candidates)) + compact_size_len(len(output_scripts) + 1) + 4) *
+                   WITNESS_SCALE_FACTOR + (2 if segwit else 0) + sum(output_weight(script) for script in output_scripts))
+    spend_weight = max(weight for value, weight in candidates) if candidates else 0
+    target = sum(destinations.values())
 
-    return final_vsize
+    selected, change = select_coins(candidates, target, fee_rate, base_weight, output_weight(change_script), spend_weight)
+    verbose("\ncoin selection: spending {0} of {1} UTXOs ({2} satoshis to destinations, {3})".format(
+        len(selected), len(candidates), target, "with change" if change else "no change output"))
+    return [utxos[i] for i in selected], change
 
-def get_fee_interactive(source_address, keys, destinations, redeem_script, input_txs):
+@profiled("stage", "fee")
+def get_fee_interactive(destinations, redeem_script, utxos):
     """
     Returns a recommended transaction fee, given market fee data provided by the user interactively
-    Because fees tend to be a function of transaction size, we build the transaction in order to
-    recomend a fee.
-    return => <Decimal> fee value
+    Because fees tend to be a function of transaction size, we estimate the size of the fully-signed
+    transaction (from the redeem script and inputs, without signing) in order to recomend a fee.
+    return => <int> fee value in satoshi
 
     Parameters:
-      source_address: <string> input_txs will be filtered for utxos to this source address
-      keys: A list of signing keys
-      destinations: {address <string>: amount<string>} dictionary mapping destination addresses to amount in BTC
+      destinations: {address <string>: amount <int>} dictionary mapping destination addresses to amount in satoshi
       redeem_script: String
-      input_txs: List<dict> List of input transactions in dictionary form (bitcoind decoded format)
-      fee_basis_satoshis_per_byte: <int> optional basis for fee calculation
+      utxos: List<dict> UTXOs to spend, from index_utxos
     """
 
-    MAX_FEE = .005  # in btc.  hardcoded limit to protect against user typos
-
-    ensure_bitcoind_running()
+    # the size doesn't depend on the fee rate, so estimate it once
+    size = estimate_vsize(destinations, redeem_script, utxos)["expected"]
 
     approve = False
     while not approve:
         print "\nEnter fee rate."
         fee_basis_satoshis_per_byte = int(raw_input("Satoshis per vbyte: "))
 
-        unsigned_tx = create_unsigned_transaction(
-            source_address, destinations, redeem_script, input_txs)
-
-        signed_tx = sign_transaction(source_address, keys,
-                                     redeem_script, unsigned_tx, input_txs)
-
-        decoded_tx = bitcoin_cli_call_json("decoderawtransaction", signed_tx["hex"])
-        
-        # estimate tx size - depends on whether have all required sigs now
-        if not signed_tx["complete"]:
-            verbose("transaction incomplete so revising fee estimate to account for missing keys")
-            # get total number of keys signing up to & including this point
-            num_cur_sigs = num_cur_signatures_from_witness(decoded_tx["vin"][0]["txinwitness"])
-            # get total number of keys required (m in the m-of-n)
-            num_req_sigs = num_required_keys_from_redeem(redeem_script)
-            
-            size = revise_vsize_if_missing_keys(decoded_tx["vsize"], decoded_tx["size"], num_cur_sigs, num_req_sigs)
-        else:
-            verbose("transaction complete: have enough keys to fully-sign transaction")
-            size = decoded_tx["vsize"]
-        # end estimate tx size block
-
         fee = size * fee_basis_satoshis_per_byte
-        fee = satoshi_to_btc(fee)
 
         if fee > MAX_FEE:
             print "Calculated fee ({}) is too high. Must be under {}.".format(btc_display(fee), btc_display(MAX_FEE))
@@ -662,30 +1843,128 @@ def get_fee_interactive(source_address, keys, destinations, redeem_script, input
 
     return fee
 
-def withdrawal_amounts_interactive(input_amount, fee, dest_address, source_address):
-    # inputs: input_amount & fee (to get amts) + dest_address, source address (for display)
-    # outputs: withdrawal_amount, change_amount
-    print "\nPlease enter the decimal amount (in bitcoin) to withdraw to the destination address."
+def sum_utxos(utxos):
+    """
+    Total value of UTXOs
+    returns => <int> amount in satoshi
+    """
+    return sum(utxo["satoshis"] for utxo in utxos)
+
+def withdrawal_amounts(input_amount, fee, requested_amounts):
+    """
+    Split the input amount into the withdrawals & the change going back to cold storage
+    returns => (List<int> withdrawal amounts, <int> change_amount), in satoshi
+    raises ValueError if fee + withdrawal amounts exceed the input amount
+
+    input_amount, fee: <int> satoshi
+    requested_amounts: List<int> satoshi to send to each destination; the last one may be None
+                       to withdraw everything left after the fee & the other withdrawals
+    """
+    amounts = list(requested_amounts)
+    if amounts and amounts[-1] is None:
+        amounts[-1] = input_amount - fee - sum(amounts[:-1])
+
+    if fee + sum(amounts) > input_amount or any(amount < 0 for amount in amounts):
+        raise ValueError("Output values greater than input value")
+
+    change_amount = input_amount - sum(amounts) - fee
+    return amounts, change_amount
+
+def destination_addresses_error(dest_addresses, source_address):
+    """
+    Check a list of withdrawal destinations
+    returns => <string> description of the problem, or None if the destinations are usable
+    """
+    if not dest_addresses:
+        return "no destination address given"
+    if source_address in dest_addresses:
+        return "the source address can't be a destination; change goes back to it automatically"
+    for i, address in enumerate(dest_addresses):
+        if address in dest_addresses[:i]:
+            return "destination address {0} given more than once".format(address)
+        try:
+            decode_address(address, testnet_mode)
+        except InvalidAddressError as e:
+            return str(e)
+    return None
+
+def source_address_error(source_address):
+    """
+    Check a cold storage address to withdraw from
+    returns => <string> description of the problem, or None if the address is usable
+    """
+    try:
+        address_type, _ = decode_address(source_address, testnet_mode)
+    except InvalidAddressError as e:
+        return str(e)
+    if address_type not in ("p2sh", "p2wsh"):
+        return "{0} is not a multisig cold storage address".format(source_address)
+    return None
+
+def read_source_address_interactive():
+    """
+    Read the cold storage address to withdraw from, from standard input
+    returns => <string> source address
+    """
+    while True:
+        source_address = raw_input("\nSource cold storage address: ").strip()
+        error = source_address_error(source_address)
+        if error is None:
+            return source_address
+        print "Error: {0}. Please enter the source address again.".format(error)
+
+def read_destination_addresses_interactive(source_address):
+    """
+    Read one or more destination addresses, separated by commas or spaces, from standard input
+    returns => List<string> destination addresses, in the order given
+    """
+    while True:
+        dest_addresses = [address for address in re.split(r"[\s,]+", raw_input("\nDestination address: ")) if address]
+        error = destination_addresses_error(dest_addresses, source_address)
+        if error is None:
+            return dest_addresses
+        print "Error: {0}. Please enter the destination address(es) again.".format(error)
+
+def withdrawal_amounts_interactive(input_amount, fee, dest_addresses, source_address):
+    # inputs: input_amount & fee (to get amts) + dest_addresses, source address (for display)
+    # outputs: withdrawal_amounts (one per destination address), change_amount
+    if len(dest_addresses) == 1:
+        print "\nPlease enter the decimal amount (in bitcoin) to withdraw to the destination address."
+    else:
+        print "\nPlease enter the decimal amount (in bitcoin) to withdraw to each of the {0} destination addresses.".format(len(dest_addresses))
     print "\nExample: For 2.3 bitcoins, enter \"2.3\"."
     print "\nAfter a fee of {0}, you have {1} available to withdraw.".format(btc_display(fee), btc_display(input_amount - fee))
     print "\n*** Technical note for experienced Bitcoin users:  If the withdrawal amount & fee are cumulatively less than the total amount of the unspent transactions, the remainder will be sent back to the same cold storage address as change. ***\n"
-    withdrawal_amount = raw_input(
-        "Amount to send to {0} (leave blank to withdraw all funds stored in these unspent transactions): ".format(dest_address))
-    if withdrawal_amount == "":
-        withdrawal_amount = input_amount - fee
-    else:
-        withdrawal_amount = Decimal(withdrawal_amount).quantize(SATOSHI_PLACES)
 
-    if fee + withdrawal_amount > input_amount:
+    requested_amounts = []
+    for dest_address in dest_addresses:
+        last = len(requested_amounts) == len(dest_addresses) - 1
+        if len(dest_addresses) == 1:
+            prompt = "Amount to send to {0} (leave blank to withdraw all funds stored in these unspent transactions): "
+        elif last:
+            prompt = "Amount to send to {0} (leave blank to withdraw all remaining funds): "
+        else:
+            prompt = "Amount to send to {0}: "
+
+        withdrawal_amount = raw_input(prompt.format(dest_address))
+        while withdrawal_amount == "" and not last:
+            print "Error: only the amount for the last destination address may be left blank"
+            withdrawal_amount = raw_input(prompt.format(dest_address))
+
+        if withdrawal_amount == "":
+            requested_amounts.append(None)
+        else:
+            requested_amounts.append(btc_to_satoshi(withdrawal_amount))
+
+    try:
+        withdrawal_amounts_list, change_amount = withdrawal_amounts(input_amount, fee, requested_amounts)
+    except ValueError:
         print "Error: fee + withdrawal amount greater than total amount available from unspent transactions"
         raise Exception("Output values greater than input value")
 
-    change_amount = input_amount - withdrawal_amount - fee
-    change_amount = zero_less_than_satoshi(change_amount)
-
     if change_amount > 0:
         print "{0} being returned to cold storage address address {1}.".format(btc_display(change_amount), source_address)
-    return withdrawal_amount, change_amount
+    return withdrawal_amounts_list, change_amount
 
 ################################################################################################
 #
@@ -693,37 +1972,156 @@ def withdrawal_amounts_interactive(input_amount, fee, dest_address, source_addre
 #
 ################################################################################################
 
-def write_and_verify_qr_code(name, filename, data):
-    """
-    Write a QR code and then read it back to try and detect any tricksy malware tampering with it.
+QR_SUFFIX = ".png"
+qr_next_increment = {}  # filename => first number suffix not yet known to be taken
 
-    name: <string> short description of the data
-    filename: <string> filename for storing the QR code
-    data: <string> the data to be encoded
+def create_qr_file(filename):
+    """
+    Create an empty, new QR code file for a name, adding a number (2, 3, ...) to the name rather
+    than overwriting an existing file. Files are created exclusively, so concurrent runs sharing
+    the directory can't both claim one, and numbers already found taken aren't tried again.
+    returns => <string> path of the created file, relative to the script directory
     """
-
-    QR_SUFFIX = ".png"
     script_root = os.path.dirname(os.path.abspath(__file__))
-    qr_increment = ""
+    i = qr_next_increment.get(filename, 1)
+    while True:
+        name = filename + (str(i) if i > 1 else "") + QR_SUFFIX
+        try:
+            os.close(os.open(os.path.join(script_root, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            verbose("\nQR exists at: {}, thus incrementing file suffix".format(name))
+            i += 1
+            continue
+        qr_next_increment[filename] = i + 1
+        return name
 
-    i = 2
-    while(True):
-        qr_path = script_root + "/" + filename + qr_increment + QR_SUFFIX
-        if not os.path.exists(qr_path): break
-        verbose("\nQR exists at: {}, thus incrementing file suffix".format(qr_path))
-        qr_increment = str(i)
-        i += 1
+def encode_and_verify_qr_code(job):
+    """
+    Encode data as a QR code into an already created file, then read it back to try and detect
+    any tricksy malware tampering with it. The image is written to a temporary file & renamed over
+    the QR code file, so it is never seen half-written. No shell is involved: the data is given to
+    qrencode on its standard input.
+    returns => (<boolean> verified, <string> problem, or None)
 
-    subprocess.call("qrencode -o {0} {1}".format(qr_path, data), shell=True)
-    check = subprocess.check_output(
-        "zbarimg --set '*.enable=0' --set 'qr.enable=1' --quiet --raw {}".format(qr_path), shell=True)
+    job: (<string> data, <string> QR code path)
+    """
+    data, path = job
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    fd, tmp_path = tempfile.mkstemp(suffix=QR_SUFFIX, dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as image:
+            encoder = subprocess.Popen(["qrencode", "-o", "-"], stdin=subprocess.PIPE, stdout=image)
+            encoder.communicate(data)
+        if encoder.returncode != 0:
+            return False, "qrencode failed"
+        os.rename(tmp_path, path)
+    except OSError as e:
+        return False, str(e)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
+    try:
+        reader = subprocess.Popen(["zbarimg", "--set", "*.enable=0", "--set", "qr.enable=1", "--quiet", "--raw", path],
+                                  stdout=subprocess.PIPE)
+        check = reader.communicate()[0]
+    except OSError as e:
+        return False, str(e)
+    if reader.returncode != 0:
+        return False, "zbarimg could not read it"
     if check.strip() != data:
-        print "********************************************************************"
-        print "WARNING: {} QR code could not be verified properly. This could be a sign of a security breach.".format(name)
-        print "********************************************************************"
+        return False, "it decodes to different data"
+    return True, None
 
-    print "QR code for {0} written to {1}".format(name, filename + qr_increment + QR_SUFFIX)
+def split_qr_codes(codes):
+    """
+    Replace codes with data too large for one QR code (or longer than qr_chunk_size) by their
+    parts (see qr_chunks.py), named <filename>-<i>of<n>
+    returns => List<(<string> description, <string> filename, <string> data)>
+    """
+    limit = qr_chunk_size or QR_MAX_CHARS
+    split = []
+    for name, filename, data in codes:
+        if len(data) <= limit:
+            split.append((name, filename, data))
+            continue
+        parts = split_payload(data, qr_chunk_size or QR_CHUNK_CHARS)
+        split.extend(("{0} (part {1} of {2})".format(name, i + 1, len(parts)),
+                      "{0}-{1}of{2}".format(filename, i + 1, len(parts)), part) for i, part in enumerate(parts))
+    return split
+
+def read_qr_parts_interactive(first_part):
+    """
+    Read the rest of a multi-part QR code from standard input, one scanned part per line, in any order
+    returns => <string> the reassembled data
+
+    first_part: <string> the part already read
+    """
+    parts = [first_part]
+    try:
+        missing = missing_chunks(parts)
+        while missing:
+            part = raw_input("Part {0} read; {1} more needed (any order): ".format(
+                len(parts), len(missing))).strip()
+            if part:
+                parts.append(part)
+                missing = missing_chunks(parts)
+        return reassemble_payload(parts)
+    except QRChunkError as e:
+        print "ERROR: could not reassemble the QR code parts: {0}. Exiting...".format(e)
+        sys.exit()
+
+@profiled("stage", "qr")
+def write_and_verify_qr_codes(codes, out=None):
+    """
+    Write QR codes and read each back to check it (see encode_and_verify_qr_code), qr_jobs at a
+    time. Files are named in the order given; results are reported in that order as they finish.
+    returns => List<boolean> whether each QR code verified
+
+    codes: List<(<string> short description of the data, <string> filename (without .png),
+                 <string> the data to be encoded)>
+    out: <file> where to report progress (default: stdout)
+    """
+    out = out or sys.stdout
+    codes = split_qr_codes(codes)
+    paths = [create_qr_file(filename) for name, filename, data in codes]
+    jobs = [(data, path) for (name, filename, data), path in zip(codes, paths)]
+
+    if qr_jobs > 1 and len(jobs) > 1:
+        pool = ThreadPool(min(qr_jobs, len(jobs)))
+        results = pool.imap(encode_and_verify_qr_code, jobs)
+    else:
+        pool = None
+        results = (encode_and_verify_qr_code(job) for job in jobs)
+
+    verified = []
+    try:
+        for (name, filename, data), path, (ok, problem) in zip(codes, paths, results):
+            if not ok:
+                print >>out, "********************************************************************"
+                print >>out, "WARNING: {} QR code could not be verified properly. This could be a sign of a security breach.".format(name)
+                print >>out, "({0})".format(problem)
+                print >>out, "********************************************************************"
+            print >>out, "QR code for {0} written to {1}".format(name, path)
+            verified.append(ok)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return verified
+
+def write_and_verify_qr_code(name, filename, data, out=None):
+    """
+    Write a QR code and then read it back to try and detect any tricksy malware tampering with it.
+
+    name: <string> short description of the data
+    filename: <string> filename for storing the QR code
+    data: <string> the data to be encoded
+    out: <file> where to report progress (default: stdout)
+    """
+    return write_and_verify_qr_codes([(name, filename, data)], out)[0]
 
 
 ################################################################################################
@@ -799,23 +2197,67 @@ def format_chunks(size, string):
     return body + " " + tail
 
 
-def entropy(n, length):
+def random_hex_strings(n, length):
+    """
+    Generate n random hex strings of length bytes each, with a single read of the OS's
+    cryptographic random number generator
+    returns => List<string>
+    """
+    data = os.urandom(n * length).encode("hex")
+    return [data[2 * length * i:2 * length * (i + 1)] for i in range(n)]
+
+
+def write_entropy_manifest(path, seeds, m, n):
+    """
+    Write computer entropy as a deposit manifest (see read_deposit_manifest), n keys per address,
+    for create-deposit-data --batch; the dice rolls are asked for when the addresses are created
+
+    path: <string> manifest filename; CSV if it ends in .csv, else JSON
+    seeds: List<string> hex computer entropy, one per key
+    """
+    entries = [OrderedDict([("label", str(i // n + 1)), ("m", m), ("n", n), ("keys", [])])
+               for i in range(0, len(seeds), n)]
+    for i, seed in enumerate(seeds):
+        entries[i // n]["keys"].append({"rng": seed})
+
+    with open(path, "w") as f:
+        if path.lower().endswith(".csv"):
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["label", "m", "n", "dice", "rng"])
+            for entry in entries:
+                for key in entry["keys"]:
+                    writer.writerow([entry["label"], m, n, "", key["rng"]])
+        else:
+            json.dump(entries, f, indent=2)
+            f.write("\n")
+    return len(entries)
+
+
+def entropy(n, length, output_path="-", m=1, keys_per_address=2):
     """
-    Generate n random strings for the user from /dev/random
+    Generate n random strings for the user from the OS's random number generator
+
+    output_path: <string> "-" to print the strings, else a deposit manifest to write them to
+                 (see write_entropy_manifest)
+    m, keys_per_address: <int> m-of-n of the addresses in the deposit manifest
     """
     safety_checklist()
 
     print "\n\n"
-    print "Making {} random data strings....".format(n)
-    print "If strings don't appear right away, please continually move your mouse cursor. These movements generate entropy which is used to create random data.\n"
+    print "Making {} random data strings....\n".format(n)
 
-    idx = 0
-    while idx < n:
-        seed = subprocess.check_output(
-            "xxd -l {} -p /dev/random".format(length), shell=True)
-        idx += 1
-        seed = seed.replace('\n', '')
-        print "Computer entropy #{0}: {1}".format(idx, format_chunks(4, seed))
+    start = time.time()
+    seeds = random_hex_strings(n, length)
+    if output_path == "-":
+        print "\n".join("Computer entropy #{0}: {1}".format(idx + 1, format_chunks(4, seed))
+                        for idx, seed in enumerate(seeds))
+    else:
+        addresses = write_entropy_manifest(output_path, seeds, m, keys_per_address)
+        print "Computer entropy for {0} keys of {1} {2}-of-{3} addresses written to {4}".format(
+            n, addresses, m, keys_per_address, output_path)
+    elapsed = time.time() - start
+    print >>sys.stderr, "Generated {0} random data strings in {1:.3f} seconds ({2:.1f} strings/sec)".format(
+        n, elapsed, n / elapsed if elapsed else float("inf"))
 
 
 ################################################################################################
@@ -834,8 +2276,9 @@ def deposit_interactive(m, n, dice_seed_length=62, rng_seed_length=20):
     """
 
     safety_checklist()
-    ensure_bitcoind_running()
-    require_minimum_bitcoind_version(170000) # getaddressesbylabel API new in v0.17.0
+    if wallet_derivation:
+        ensure_bitcoind_running()
+        require_minimum_bitcoind_version(170000) # getaddressesbylabel API new in v0.17.0
 
     print "\n"
     print "Creating {0}-of-{1} cold storage address.\n".format(m, n)
@@ -847,22 +2290,18 @@ def deposit_interactive(m, n, dice_seed_length=62, rng_seed_length=20):
         print "\nCreating private key #{}".format(index)
 
         dice_seed_string = read_dice_seed_interactive(dice_seed_length)
-        dice_seed_hash = hash_sha256(dice_seed_string)
-
         rng_seed_string = read_rng_seed_interactive(rng_seed_length)
-        rng_seed_hash = hash_sha256(rng_seed_string)
-
-        # back to hex string
-        hex_private_key = xor_hex_strings(dice_seed_hash, rng_seed_hash)
-        WIF_private_key = hex_private_key_to_WIF_private_key(hex_private_key)
 
-        keys.append(WIF_private_key)
+        keys.append(seeds_to_WIF_private_key(dice_seed_string, rng_seed_string))
 
     print "Private keys created."
     print "Generating {0}-of-{1} cold storage address...\n".format(m, n)
 
-    addresses = [get_address_for_wif_privkey(key) for key in keys]
-    results = addmultisigaddress(m, addresses)
+    if wallet_derivation:
+        addresses = [get_address_for_wif_privkey(key) for key in keys]
+        results = addmultisigaddress(m, addresses)
+    else:
+        results = create_multisig_from_privkeys(m, keys)
 
     print "Private keys:"
     for idx, key in enumerate(keys):
@@ -875,9 +2314,152 @@ def deposit_interactive(m, n, dice_seed_length=62, rng_seed_length=20):
     print "{}".format(results["redeemScript"])
     print ""
 
-    write_and_verify_qr_code("cold storage address", "address", results["address"])
-    write_and_verify_qr_code("redemption script", "redemption",
-                       results["redeemScript"])
+    write_and_verify_qr_codes([("cold storage address", "address", results["address"]),
+                               ("redemption script", "redemption", results["redeemScript"])])
+
+
+################################################################################################
+#
+# Main "batch deposit" function
+#
+################################################################################################
+
+def read_deposit_manifest(path, m, n):
+    """
+    Read the entropy for a batch of cold storage addresses
+    returns => List<dict> {"label", "m", "n", "keys": List<{"dice", "rng"}>}, one per address
+
+    A .csv manifest has a header row and one row per key, with columns label, dice, rng and
+    optionally m & n; consecutive rows sharing a label make up one address.
+    Any other manifest is JSON: a list of {"label", "m", "n", "keys": [{"dice", "rng"}, ...]}.
+    Entropy left out of the manifest is prompted for when the address is created.
+
+    path: <string> manifest filename
+    m: <int> default number of multisig keys required for withdrawal
+    n: <int> default total number of multisig keys
+    """
+    def manifest_error(message):
+        print "ERROR: {0} in deposit manifest {1}. Exiting...".format(message, path)
+        sys.exit()
+
+    try:
+        with open(path) as f:
+            if path.lower().endswith(".csv"):
+                entries = []
+                for row in csv.DictReader(f):
+                    if not row.get("label"):
+                        manifest_error("missing label on line {0}".format(len(entries) + 2))
+                    if not entries or entries[-1]["label"] != row["label"]:
+                        entries.append({"label": row["label"], "m": row.get("m"), "n": row.get("n"), "keys": []})
+                    entries[-1]["keys"].append({"dice": row.get("dice"), "rng": row.get("rng")})
+            else:
+                entries = json.load(f)
+    except (IOError, ValueError, csv.Error) as e:
+        manifest_error(str(e))
+
+    if not isinstance(entries, list):
+        manifest_error("expected a list of addresses")
+
+    for idx, entry in enumerate(entries):
+        entry["label"] = str(entry.get("label") or idx + 1)
+        try:
+            entry["m"] = int(entry.get("m") or m)
+            entry["n"] = int(entry.get("n") or n)
+        except ValueError:
+            manifest_error("invalid m or n for address {0}".format(entry["label"]))
+        keys = entry.get("keys") or []
+        if not 1 <= entry["m"] <= entry["n"] or len(keys) > entry["n"]:
+            manifest_error("{0} key(s) given for {1}-of-{2} address {3}".format(
+                len(keys), entry["m"], entry["n"], entry["label"]))
+        entry["keys"] = keys + [{}] * (entry["n"] - len(keys))
+
+    return entries
+
+
+def read_manifest_seeds(seeds, label, index, dice_seed_length, rng_seed_length):
+    """
+    Get validated dice & computer entropy for one key of a batch, prompting for any that's missing
+    returns => (<string> dice_seed_string, <string> rng_seed_string)
+    """
+    dice = unchunk(str(seeds.get("dice") or ""))
+    rng = unchunk(str(seeds.get("rng") or ""))
+
+    if not dice or not rng:
+        print "\nEntropy missing for address {0} key #{1}".format(label, index)
+    if not dice:
+        dice = read_dice_seed_interactive(dice_seed_length)
+    elif not validate_dice_seed(dice, dice_seed_length):
+        print "ERROR: invalid dice rolls for address {0} key #{1}. Exiting...".format(label, index)
+        sys.exit()
+    if not rng:
+        rng = read_rng_seed_interactive(rng_seed_length)
+    elif not validate_rng_seed(rng, rng_seed_length * 2):
+        print "ERROR: invalid computer entropy for address {0} key #{1}. Exiting...".format(label, index)
+        sys.exit()
+
+    return dice, rng
+
+
+def write_batch_qr_codes(qr_codes):
+    """
+    Write the QR codes of a batch run (see write_and_verify_qr_codes), reporting to stderr
+    """
+    if not qr_codes:
+        return
+    verified = write_and_verify_qr_codes(qr_codes, sys.stderr)
+    print >>sys.stderr, "Wrote {0} QR codes, {1} verified".format(len(verified), sum(verified))
+
+
+def deposit_batch(manifest_path, output_path, m, n, dice_seed_length=62, rng_seed_length=20, write_qr=False):
+    """
+    Generate cold storage addresses for every entry of an entropy manifest, non-interactively
+    Writes one JSON object per address (label, m, n, address, redeemScript, keys) to output_path.
+
+    manifest_path: <string> see read_deposit_manifest
+    output_path: <string> JSONL output filename, or "-" for stdout
+    write_qr: <boolean> also write address & redemption script QR codes, named after the labels
+    """
+    entries = read_deposit_manifest(manifest_path, m, n)
+
+    safety_checklist()
+    if wallet_derivation:
+        ensure_bitcoind_running()
+        require_minimum_bitcoind_version(170000) # getaddressesbylabel API new in v0.17.0
+
+    print >>sys.stderr, "\nCreating {0} cold storage addresses from {1}".format(len(entries), manifest_path)
+
+    output = sys.stdout if output_path == "-" else open(output_path, "w")
+    start = time.time()
+
+    qr_codes = []
+    for entry in entries:
+        keys = []
+        for idx, seeds in enumerate(entry["keys"]):
+            dice, rng = read_manifest_seeds(seeds, entry["label"], idx + 1, dice_seed_length, rng_seed_length)
+            keys.append(seeds_to_WIF_private_key(dice, rng))
+
+        if wallet_derivation:
+            results = addmultisigaddress(entry["m"], [get_address_for_wif_privkey(key) for key in keys])
+        else:
+            results = create_multisig_from_privkeys(entry["m"], keys)
+
+        record = OrderedDict([("label", entry["label"]), ("m", entry["m"]), ("n", entry["n"]),
+                              ("address", results["address"]), ("redeemScript", results["redeemScript"]),
+                              ("keys", keys)])
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+        if write_qr:
+            filename = re.sub(r"[^A-Za-z0-9_.-]", "_", entry["label"])
+            qr_codes.append(("cold storage address", filename + "-address", results["address"]))
+            qr_codes.append(("redemption script", filename + "-redemption", results["redeemScript"]))
+
+    write_batch_qr_codes(qr_codes)
+    elapsed = time.time() - start
+    if output is not sys.stdout:
+        output.close()
+    print >>sys.stderr, "Created {0} cold storage addresses in {1:.2f} seconds ({2:.1f} addresses/sec)".format(
+        len(entries), elapsed, len(entries) / elapsed if elapsed else float("inf"))
 
 
 ################################################################################################
@@ -904,40 +2486,45 @@ def withdraw_interactive():
         print "\nYou will need to enter several pieces of information to create a withdrawal transaction."
         print "\n\n*** PLEASE BE SURE TO ENTER THE CORRECT DESTINATION ADDRESS ***\n"
 
-        source_address = raw_input("\nSource cold storage address: ")
+        source_address = read_source_address_interactive()
 
         if not re_sign_mode:
             redeem_script = raw_input("\nRedemption script for source cold storage address: ")
-            dest_address = raw_input("\nDestination address: ")
-            num_tx = int(raw_input("\nHow many unspent transactions will you be using for this withdrawal? "))
+            dest_addresses = read_destination_addresses_interactive(source_address)
+            answer = raw_input("\nHow many unspent transactions will you be using for this withdrawal? ").strip()
+            # left blank, transactions are asked for until a blank line is entered
+            num_tx = int(answer) if answer else None
         else:
-            unsigned_tx, redeem_script, dest_address, change_amount, withdrawal_amount, num_tx  = parse_part_signed_tx(source_address)
+            unsigned_tx, redeem_script, dest_addresses, change_amount, withdrawal_amounts_list, num_tx  = parse_part_signed_tx(source_address)
 
         addresses[source_address] = 0
-        addresses[dest_address] = 0
+        for dest_address in dest_addresses:
+            addresses[dest_address] = 0
 
-        input_txs = []
-        utxos = []
-        utxo_sum = Decimal(0).quantize(SATOSHI_PLACES)
+        hex_txs = []
 
-        while len(input_txs) < num_tx:
+        while num_tx is None or len(hex_txs) < num_tx:
 
             # start block to be replaced by following comment line
             #   hex_tx = get_raw_tx_interactive("For input transaction #{}".format(len(input_txs) + 1))
             # not implementing now because will break testing
-            print "\nPlease paste raw transaction #{} (hexadecimal format) with unspent outputs at the source address".format(len(input_txs) + 1)
+            print "\nPlease paste raw transaction #{} (hexadecimal format) with unspent outputs at the source address".format(len(hex_txs) + 1)
             print "OR"
             print "input a filename located in the current directory which contains the raw transaction data"
             print "(If the transaction data is over ~4000 characters long, you _must_ use a file.):"
+            if num_tx is None:
+                print "(A file may hold several transactions, one per line; a directory or glob pattern of files may also be given. Enter a blank line when done.)"
 
-            hex_tx = raw_input()
-            if os.path.isfile(hex_tx):
-                hex_tx = open(hex_tx).read().strip()
+            answer = raw_input()
             # end block to be replaced
 
-            tx = bitcoin_cli_call_json("decoderawtransaction", hex_tx)
-            input_txs.append(tx)
-            utxos += get_utxos(tx, source_address)
+            if num_tx is None and not answer.strip():
+                break
+            hex_txs.extend(read_raw_txs(answer))
+
+        describe_input = lambda i: "input transaction #{0}".format(i + 1)
+        input_txs = decode_raw_transactions(hex_txs, describe_input)
+        utxos = index_utxos(input_txs, describe_input).get(source_address, [])
 
         if len(utxos) == 0:
             print "\nTransaction data not found for source address: {}".format(source_address)
@@ -945,35 +2532,27 @@ def withdraw_interactive():
         else:
             print "\nTransaction data found for source address."
 
-            for utxo in utxos:
-                value = Decimal(utxo["value"]).quantize(SATOSHI_PLACES)
-                utxo_sum += value
+            utxo_sum = sum_utxos(utxos)
 
             print "TOTAL unspent amount for this raw transaction: {}".format(btc_display(utxo_sum))
 
-        print "\nHow many private keys will you be signing this transaction with? "
-        key_count = int(raw_input("#: "))
-
-        keys = []
-        while len(keys) < key_count:
-            key = raw_input("Key #{0}: ".format(len(keys) + 1))
-            keys.append(key)
+        keys = [] if psbt_mode else read_keys_interactive()
 
         ###### fees, amount, and change #######
 
         input_amount = utxo_sum
 
         if not re_sign_mode:
-            fee = get_fee_interactive(
-                source_address, keys, addresses, redeem_script, input_txs)
+            fee = get_fee_interactive(addresses, redeem_script, utxos)
             check_fee_to_input_amt(fee, input_amount)
-            withdrawal_amount, change_amount = withdrawal_amounts_interactive(input_amount, fee, dest_address, source_address)
+            withdrawal_amounts_list, change_amount = withdrawal_amounts_interactive(input_amount, fee, dest_addresses, source_address)
         else:
-            fee = input_amount - withdrawal_amount - change_amount
+            fee = input_amount - sum(withdrawal_amounts_list) - change_amount
             check_fee_to_input_amt(fee, input_amount)
 
-        addresses[dest_address] = str(withdrawal_amount)
-        addresses[source_address] = str(change_amount)
+        for dest_address, withdrawal_amount in zip(dest_addresses, withdrawal_amounts_list):
+            addresses[dest_address] = withdrawal_amount
+        addresses[source_address] = change_amount
 
         # check data
         print "\nIs this data correct?"
@@ -986,9 +2565,10 @@ def withdraw_interactive():
             else:
                 print "{0} going to destination address {1}".format(btc_display(value), address)
         print "Fee amount: {0}".format(btc_display(fee))
-        print "\nSigning with private keys: "
-        for key in keys:
-            print "{}".format(key)
+        if not psbt_mode:
+            print "\nSigning with private keys: "
+            for key in keys:
+                print "{}".format(key)
 
         print "\n"
         confirm = yes_no_interactive()
@@ -1002,11 +2582,14 @@ def withdraw_interactive():
     print "\nCalculating transaction...\n"
 
     if not re_sign_mode:
-        unsigned_tx = create_unsigned_transaction(
-            source_address, addresses, redeem_script, input_txs)
+        unsigned_tx = create_unsigned_transaction(addresses, utxos)
 
-    signed_tx = sign_transaction(source_address, keys,
-                                 redeem_script, unsigned_tx, input_txs)
+    if psbt_mode:
+        raw_txs = dict((tx["txid"], hex_tx) for tx, hex_tx in zip(input_txs, hex_txs))
+        write_psbt("transaction", psbt_to_base64(create_withdrawal_psbt(unsigned_tx, redeem_script, utxos, raw_txs)))
+        return
+
+    signed_tx = sign_transaction(keys, redeem_script, unsigned_tx, utxos)
 
     print "\nSufficient private keys to execute transaction?"
     print signed_tx["complete"]
@@ -1020,6 +2603,439 @@ def withdraw_interactive():
     write_and_verify_qr_code("transaction", "transaction", signed_tx["hex"])
 
 
+################################################################################################
+#
+# Main "batch withdraw" function
+#
+################################################################################################
+
+def read_withdrawal_spec(path):
+    """
+    Read the withdrawals to create in a batch
+    returns => List<dict> one per withdrawal, as in the spec file with amounts in satoshi
+
+    The spec is a JSON list of withdrawals:
+      {"label": <string, optional>,
+       "source_address": <string>,
+       "redeem_script": <string>,
+       "destinations": [{"address": <string>, "amount": <BTC>}, ...],  (the last amount may be omitted
+                       to withdraw everything left after the fee & the other destinations)
+       "input_txs": [<raw transaction hex, or file, directory or glob pattern relative to the spec file>, ...],
+       "keys": [<WIF private key>, ...],  (not needed with --psbt)
+       "fee_rate": <int satoshis per vbyte>}
+    """
+    def spec_error(message):
+        print "ERROR: {0} in withdrawal spec {1}. Exiting...".format(message, path)
+        sys.exit()
+
+    try:
+        with open(path) as f:
+            entries = json.load(f, parse_float=Decimal)
+    except (IOError, ValueError) as e:
+        spec_error(str(e))
+
+    if not isinstance(entries, list):
+        spec_error("expected a list of withdrawals")
+
+    spec_dir = os.path.dirname(path)
+    for idx, entry in enumerate(entries):
+        entry["label"] = str(entry.get("label") or idx + 1)
+        for field in ("source_address", "redeem_script", "destinations", "input_txs", "keys", "fee_rate"):
+            if not entry.get(field) and not (field == "keys" and psbt_mode):
+                spec_error("missing {0} for withdrawal {1}".format(field, entry["label"]))
+        try:
+            entry["fee_rate"] = int(entry["fee_rate"])
+            for destination in entry["destinations"]:
+                destination["address"] = str(destination["address"])
+                if destination.get("amount") is not None:
+                    destination["amount"] = btc_to_satoshi(destination["amount"])
+        except (KeyError, TypeError, ArithmeticError, ValueError):
+            spec_error("invalid destination or fee rate for withdrawal {0}".format(entry["label"]))
+        if any(destination.get("amount") is None for destination in entry["destinations"][:-1]):
+            spec_error("only the last destination of withdrawal {0} may leave out its amount".format(entry["label"]))
+        entry["source_address"] = str(entry["source_address"])
+        error = source_address_error(entry["source_address"]) or destination_addresses_error([destination["address"] for destination in entry["destinations"]],
+                                            entry["source_address"])
+        if error:
+            spec_error("{0} for withdrawal {1}".format(error, entry["label"]))
+        entry["redeem_script"] = str(entry["redeem_script"])
+        entry["keys"] = [str(key) for key in entry.get("keys", [])]
+        entry["input_txs"] = [hex_tx for tx in entry["input_txs"] for hex_tx in read_raw_txs(str(tx), spec_dir)]
+
+    return entries
+
+
+@profiled("stage", "fee")
+def plan_withdrawal(entry, utxos):
+    """
+    Work out the inputs, fee & outputs of one batch withdrawal
+    returns => (List<dict> UTXOs to spend, <dict> address => amount <int> outputs for
+                createrawtransaction, <int> fee), amounts in satoshi
+
+    entry: <dict> withdrawal from read_withdrawal_spec
+    utxos: List<dict> the UTXOs to the entry's source address in its input transactions, from index_utxos
+    """
+    def withdrawal_error(message):
+        print "ERROR: withdrawal {0}: {1}. Exiting...".format(entry["label"], message)
+        sys.exit()
+
+    source_address = entry["source_address"]
+    destinations = entry["destinations"]
+
+    if not utxos:
+        withdrawal_error("transaction data not found for source address {0}".format(source_address))
+
+    change = True
+    if coin_selection_mode and destinations[-1].get("amount") is None:
+        print >>sys.stderr, ("Withdrawal {0} has no amount for its last destination: spending all {1} UTXOs, "
+                             "without coin selection".format(entry["label"], len(utxos)))
+    elif coin_selection_mode:
+        payments = dict((destination["address"], destination["amount"]) for destination in destinations)
+        try:
+            utxos, change = select_withdrawal_inputs(source_address, payments, entry["redeem_script"],
+                                                     utxos, entry["fee_rate"])
+        except InsufficientFundsError as e:
+            withdrawal_error(str(e))
+    input_amount = sum_utxos(utxos)
+
+    addresses = {}
+    if change:
+        addresses[source_address] = 0
+    for destination in destinations:
+        addresses[destination["address"]] = 0
+
+    size = estimate_vsize(addresses, entry["redeem_script"], utxos)["expected"]
+    fee = size * entry["fee_rate"]
+    if not change:
+        # the inputs match the payments closely enough that the remainder isn't worth a change output
+        fee = input_amount - sum(destination["amount"] for destination in destinations)
+    if fee > MAX_FEE:
+        withdrawal_error("calculated fee ({0}) is too high. Must be under {1}".format(btc_display(fee), btc_display(MAX_FEE)))
+
+    try:
+        amounts, change_amount = withdrawal_amounts(input_amount, fee,
+                                                    [destination.get("amount") for destination in destinations])
+    except ValueError:
+        withdrawal_error("fee + withdrawal amounts greater than total amount available from unspent transactions")
+
+    for destination, withdrawal_amount in zip(destinations, amounts):
+        addresses[destination["address"]] = withdrawal_amount
+    addresses[source_address] = change_amount
+    return utxos, addresses, fee
+
+
+def write_batch_psbts(entries, unsigned_txs, plans, raw_txs, output_path, write_qr):
+    """
+    Write the unsigned batch withdrawals as PSBTs, one JSON object (label, psbt, fee, md5) per line
+    """
+    output = sys.stdout if output_path == "-" else open(output_path, "w")
+    qr_codes = []
+    for entry, unsigned_tx, (utxos, addresses, fee) in zip(entries, unsigned_txs, plans):
+        psbt_base64 = psbt_to_base64(create_withdrawal_psbt(unsigned_tx, entry["redeem_script"], utxos, raw_txs))
+        record = OrderedDict([("label", entry["label"]), ("psbt", psbt_base64), ("fee", btc_string(fee)),
+                              ("inputs", len(utxos)), ("md5", hash_md5(psbt_base64))])
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+        if write_qr:
+            filename = re.sub(r"[^A-Za-z0-9_.-]", "_", entry["label"])
+            qr_codes.append(("PSBT", filename + "-psbt", psbt_base64))
+    if output is not sys.stdout:
+        output.close()
+    write_batch_qr_codes(qr_codes)
+
+def withdraw_batch(spec_path, output_path, write_qr=False):
+    """
+    Construct and sign every withdrawal in a spec file, non-interactively, in one bitcoind session
+    Writes one JSON object per withdrawal (label, hex, complete, fee, md5) to output_path.
+
+    spec_path: <string> see read_withdrawal_spec
+    output_path: <string> JSONL output filename, or "-" for stdout
+    write_qr: <boolean> also write transaction QR codes, named after the labels
+    """
+    entries = read_withdrawal_spec(spec_path)
+
+    safety_checklist()
+    ensure_bitcoind_running()
+    require_minimum_bitcoind_version(170000) # signrawtransaction API changed in v0.17.0
+
+    print >>sys.stderr, "\nCreating {0} withdrawal transactions from {1}".format(len(entries), spec_path)
+    start = time.time()
+
+    # decode the input transactions of all withdrawals together
+    owners = [(entry["label"], i + 1) for entry in entries for i in range(len(entry["input_txs"]))]
+    decoded = decode_raw_transactions([hex_tx for entry in entries for hex_tx in entry["input_txs"]],
+                                      lambda i: "input transaction #{1} of withdrawal {0}".format(*owners[i]))
+
+    plans = []
+    raw_txs = {}  # txid => hex of the input transactions, for PSBTs
+    spent_by = {}  # (txid, vout) => label of the withdrawal spending it
+    for entry in entries:
+        input_txs, decoded = decoded[:len(entry["input_txs"])], decoded[len(entry["input_txs"]):]
+        raw_txs.update((tx["txid"], hex_tx) for tx, hex_tx in zip(input_txs, entry["input_txs"]))
+        utxo_index = index_utxos(input_txs, lambda i: "input transaction #{0} of withdrawal {1}".format(i + 1, entry["label"]))
+        plan = plan_withdrawal(entry, utxo_index.get(entry["source_address"], []))
+
+        for utxo in plan[0]:
+            outpoint = (utxo["txid"], utxo["n"])
+            if outpoint in spent_by:
+                print "ERROR: withdrawals {0} and {1} both spend output {2}:{3}. Exiting...".format(
+                    spent_by[outpoint], entry["label"], outpoint[0], outpoint[1])
+                sys.exit()
+            spent_by[outpoint] = entry["label"]
+        plans.append(plan)
+
+    describe = lambda i: "the transaction for withdrawal {0}".format(entries[i]["label"])
+    unsigned_txs = bitcoin_cli_call_batch_or_fail(
+        [createrawtransaction_args(addresses, utxos) for utxos, addresses, fee in plans], describe)
+    if psbt_mode:
+        write_batch_psbts(entries, unsigned_txs, plans, raw_txs, output_path, write_qr)
+        print >>sys.stderr, "Created {0} withdrawal PSBTs in {1:.2f} seconds".format(len(entries), time.time() - start)
+        return
+
+    if sign_jobs > 1:
+        # sign each transaction's inputs concurrently rather than the transactions one after another
+        signed_txs = [sign_transaction(entry["keys"], entry["redeem_script"], unsigned_tx, utxos)
+                      for entry, unsigned_tx, (utxos, addresses, fee) in zip(entries, unsigned_txs, plans)]
+    else:
+        signed_txs = bitcoin_cli_call_batch_or_fail(
+            [signrawtransaction_args(entry["keys"], entry["redeem_script"], unsigned_tx, utxos)
+             for entry, unsigned_tx, (utxos, addresses, fee) in zip(entries, unsigned_txs, plans)], describe)
+
+    output = sys.stdout if output_path == "-" else open(output_path, "w")
+    qr_codes = []
+    for entry, signed_tx, (utxos, addresses, fee) in zip(entries, signed_txs, plans):
+        record = OrderedDict([("label", entry["label"]), ("hex", signed_tx["hex"]), ("complete", signed_tx["complete"]),
+                              ("fee", btc_string(fee)), ("inputs", len(utxos)), ("md5", hash_md5(signed_tx["hex"]))])
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+        if write_qr:
+            filename = re.sub(r"[^A-Za-z0-9_.-]", "_", entry["label"])
+            qr_codes.append(("transaction", filename + "-transaction", signed_tx["hex"]))
+
+    write_batch_qr_codes(qr_codes)
+    elapsed = time.time() - start
+    if output is not sys.stdout:
+        output.close()
+    print >>sys.stderr, "Created {0} withdrawal transactions in {1:.2f} seconds ({2:.1f} withdrawals/sec)".format(
+        len(entries), elapsed, len(entries) / elapsed if elapsed else float("inf"))
+
+
+################################################################################################
+#
+# Main "PSBT" functions
+#
+# create-withdrawal-data --psbt writes the withdrawal as a PSBT holding everything needed to sign
+# it; any number of signers then run sign-psbt in parallel, at different sites, without the input
+# transactions; combine-psbt merges their signatures into the final transaction.
+#
+################################################################################################
+
+@profiled("stage", "create transaction")
+def create_withdrawal_psbt(unsigned_hex, redeem_script, utxos, raw_txs):
+    """
+    Build the PSBT for an unsigned withdrawal transaction
+    returns => <dict> PSBT (see psbt.parse_psbt)
+
+    unsigned_hex: <string> unsigned transaction from create_unsigned_transaction
+    redeem_script: <string> hex multisig redeem script of the source address
+    utxos: List<dict> UTXOs spent, in transaction input order, from index_utxos
+    raw_txs: {txid <string>: hex <string>} the input transactions
+    """
+    script = redeem_script.decode("hex")
+    inputs = []
+    for utxo in utxos:
+        script_pubkey = utxo["scriptPubKey"]["hex"].decode("hex")
+        address_type = multisig_address_type(script_pubkey, script)
+        value = utxo["satoshis"]
+        if address_type == "p2sh":
+            # non-segwit signatures don't commit to the amount: the whole previous transaction proves it
+            inputs.append({"prev_tx": raw_txs[utxo["txid"]].decode("hex"), "redeem_script": script})
+        elif address_type == "p2sh-p2wsh":
+            inputs.append({"utxo": (value, script_pubkey), "witness_script": script,
+                           "redeem_script": "\x00\x20" + sha256(script).digest()})
+        elif address_type == "p2wsh":
+            inputs.append({"utxo": (value, script_pubkey), "witness_script": script})
+        else:
+            print "ERROR: output {0}:{1} is not paid to the redemption script. Exiting...".format(utxo["txid"], utxo["n"])
+            sys.exit()
+    return create_psbt(unsigned_hex.decode("hex"), inputs)
+
+@profiled("stage", "sign")
+def sign_psbt(psbt, keys):
+    """
+    Add signatures by each private key to a PSBT's inputs (made by bitcoind's signrawtransactionwithkey)
+    returns => List<int> number of inputs each key signed
+
+    psbt: <dict> PSBT (see psbt.parse_psbt), updated in place
+    keys: List<string> WIF private keys
+    """
+    unsigned_hex = psbt["global"][PSBT_GLOBAL_UNSIGNED_TX].encode("hex")
+    prevtxs = []
+    for i, txin in enumerate(psbt["tx"]["vin"]):
+        value, script_pubkey = input_utxo(psbt, i)
+        prevtxs.append({
+            "txid": txin["txid"],
+            "vout": txin["vout"],
+            "amount": btc_string(value),
+            "scriptPubKey": script_pubkey.encode("hex"),
+            "redeemScript": (signing_script(psbt, i) or "").encode("hex")
+        })
+
+    # one request per key, so every signature in a result belongs to that request's key
+    calls = [("signrawtransactionwithkey", unsigned_hex, format_rpc_json([key]), format_rpc_json(prevtxs)) for key in keys]
+    results = bitcoin_cli_call_batch_or_fail(calls, lambda k: "the signing request for key #{0}".format(k + 1))
+
+    signed_counts = []
+    for k, (key, result) in enumerate(zip(keys, results)):
+        try:
+            pubkey = wif_to_public_key(key, testnet_mode)
+        except InvalidKeyError as e:
+            print "ERROR: key #{0} is invalid: {1}. Exiting...".format(k + 1, e)
+            sys.exit()
+        signed = deserialize_transaction(result["hex"].decode("hex"))
+        count = 0
+        for i, txin in enumerate(signed["vin"]):
+            signatures = multisig_input_signatures(txin)
+            if signatures and pubkey in parse_multisig_redeem_script(signing_script(psbt, i) or "")[1]:
+                add_partial_signature(psbt, i, pubkey, signatures[0])
+                count += 1
+        signed_counts.append(count)
+    return signed_counts
+
+def read_psbt_interactive(unique_init_prompt):
+    """
+    Ask for a PSBT, pasted as base64 or in a file
+    returns => <dict> PSBT (see psbt.parse_psbt)
+    """
+    print "\n{0}".format(unique_init_prompt)
+    print "\n  Please paste the PSBT (base64 format)"
+    print "  OR"
+    print "  input a filename located in the current directory which contains the PSBT"
+    print "  (If the PSBT is over ~4000 characters long, you _must_ use a file.):"
+
+    try:
+        return psbt_from_base64(read_raw_tx(raw_input()))
+    except PSBTError as e:
+        print "ERROR: could not read the PSBT: {0}. Exiting...".format(e)
+        sys.exit()
+
+def write_psbt(filename, psbt_base64):
+    """
+    Show a PSBT, and write it to <filename>.psbt (with a number added rather than overwriting a
+    file) and as a QR code
+    """
+    print "\nPartially signed transaction (PSBT, base64):"
+    print psbt_base64
+
+    print "\nPSBT fingerprint (md5):"
+    print hash_md5(psbt_base64)
+
+    path, i = filename + ".psbt", 2
+    while os.path.exists(path):
+        path, i = "{0}{1}.psbt".format(filename, i), i + 1
+    with open(path, "w") as f:
+        f.write(psbt_base64 + "\n")
+    print "PSBT written to {0}".format(path)
+
+    write_and_verify_qr_code("PSBT", filename + "-psbt", psbt_base64)
+
+def show_psbt(psbt):
+    """
+    Print what a PSBT spends & pays and how many signatures it has, for the signer to check
+    """
+    decoded = decode_raw_transaction(psbt["global"][PSBT_GLOBAL_UNSIGNED_TX].encode("hex"), testnet_mode)
+    try:
+        input_amount = sum(input_utxo(psbt, i)[0] for i in range(len(decoded["vin"])))
+    except PSBTError as e:
+        print "ERROR: {0}. Exiting...".format(e)
+        sys.exit()
+    output_amount = sum(vout["satoshis"] for vout in decoded["vout"])
+
+    print "\n{0} in {1} inputs".format(btc_display(input_amount), len(decoded["vin"]))
+    for vout in decoded["vout"]:
+        print "{0} going to address {1}".format(btc_display(vout["satoshis"]),
+                                               ", ".join(vout["scriptPubKey"].get("addresses", ["(unknown)"])))
+    print "Fee amount: {0}".format(btc_display(input_amount - output_amount))
+    for i in range(len(decoded["vin"])):
+        m, pubkeys = parse_multisig_redeem_script(signing_script(psbt, i) or "")
+        print "Input #{0}: {1} of {2} signatures".format(i + 1, len(partial_signatures(psbt, i)), m)
+
+def sign_psbt_interactive():
+    """
+    Add signatures to a PSBT made by create-withdrawal-data --psbt
+    All data required is input at the terminal
+    """
+    safety_checklist()
+    ensure_bitcoind_running()
+    require_minimum_bitcoind_version(170000) # signrawtransaction API changed in v0.17.0
+
+    psbt = read_psbt_interactive("For the PSBT to sign")
+    show_psbt(psbt)
+    keys = read_keys_interactive()
+
+    print "\nIs this data correct?"
+    print "*** WARNING: Incorrect data may lead to loss of funds ***\n"
+    if not yes_no_interactive():
+        print "\nProcess aborted."
+        sys.exit()
+
+    print "\nSigning PSBT...\n"
+    for k, count in enumerate(sign_psbt(psbt, keys)):
+        print "Key #{0} signed {1} of {2} inputs".format(k + 1, count, len(psbt["tx"]["vin"]))
+
+    write_psbt("signed", psbt_to_base64(psbt))
+
+def combine_psbt_interactive():
+    """
+    Combine the signatures in several signed copies of a PSBT, and finalize the transaction if
+    enough keys have signed
+    All data required is input at the terminal
+    """
+    safety_checklist()
+    ensure_bitcoind_running()
+    require_minimum_bitcoind_version(170000) # PSBT RPCs were added in v0.17.0
+
+    num_psbts = int(raw_input("\nHow many PSBTs will you be combining? "))
+    psbts = [read_psbt_interactive("For PSBT #{0}".format(i + 1)) for i in range(num_psbts)]
+    if not psbts:
+        sys.exit()
+    unsigned_raw = psbts[0]["global"][PSBT_GLOBAL_UNSIGNED_TX]
+    for i, psbt in enumerate(psbts):
+        if psbt["global"][PSBT_GLOBAL_UNSIGNED_TX] != unsigned_raw:
+            print "ERROR: PSBT #{0} is not for the same transaction as PSBT #1. Exiting...".format(i + 1)
+            sys.exit()
+
+    print "\nCombining PSBTs...\n"
+    combined = bitcoin_cli_call("combinepsbt", format_rpc_json([psbt_to_base64(psbt) for psbt in psbts])).strip()
+    finalized = bitcoin_cli_call_json("finalizepsbt", combined)
+
+    print "\nSufficient private keys to execute transaction?"
+    print finalized["complete"]
+
+    if not finalized["complete"]:
+        write_psbt("combined", finalized["psbt"])
+        return
+
+    # finalizepsbt verified the signatures; check they're on the very transaction the signers were shown.
+    # (Not by txid: the scriptSig of a P2SH or P2SH-P2WSH input is part of it.)
+    signed_tx = deserialize_transaction(finalized["hex"].decode("hex"))
+    for txin in signed_tx["vin"]:
+        txin["script_sig"], txin["witness"] = "", []
+    if serialize_transaction(signed_tx) != unsigned_raw:
+        print "ERROR: the finalized transaction is not the transaction in the PSBTs. Exiting..."
+        sys.exit()
+
+    print "\nRaw signed transaction (hex):"
+    print finalized["hex"]
+
+    print "\nTransaction fingerprint (md5):"
+    print hash_md5(finalized["hex"])
+
+    write_and_verify_qr_code("transaction", "transaction", finalized["hex"])
+
+
 ################################################################################################
 #
 # main function
@@ -1031,7 +3047,8 @@ def withdraw_interactive():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('program', choices=[
-                        'entropy', 'create-deposit-data', 'create-withdrawal-data', 'sign-transaction'])
+                        'entropy', 'create-deposit-data', 'create-withdrawal-data', 'sign-transaction',
+                        'sign-psbt', 'combine-psbt'])
 
     parser.add_argument("--num-keys", type=int,
                         help="The number of keys to create random entropy for", default=1)
@@ -1048,23 +3065,103 @@ if __name__ == "__main__":
                         help='increase output verbosity')
     parser.add_argument('-s', action='store_const', default=False, dest='single_safety_confirm_mode', const=True,
                         help='suppress repeated safety prompts')
+    parser.add_argument('--rpc-backend', choices=['http', 'cli'], default='http',
+                        help='talk to bitcoind over a persistent JSON-RPC connection (http, default) or by running bitcoin-cli for every call (cli)')
+    parser.add_argument('--rpc-record', metavar='FILE',
+                        help='record every bitcoind request & response to this session file (private keys are left out)')
+    parser.add_argument('--rpc-replay', metavar='FILE',
+                        help='answer bitcoind requests from a session recorded with --rpc-record, without bitcoind')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='time every bitcoind request & stage of the run: print a summary to stderr & write a trace to FILE '
+                             '(Chrome trace format, or JSON lines if FILE ends in .jsonl)')
+    parser.add_argument('--bitcoind-decode', action='store_true', dest='bitcoind_decoding',
+                        help='decode transactions with bitcoind instead of in-process')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='create-deposit-data: create an address for every entry of a JSON or CSV entropy manifest; '
+                             'create-withdrawal-data: create every withdrawal of a JSON spec')
+    parser.add_argument('-o', '--output', default='-',
+                        help='--batch: file to write JSON lines results to (default: stdout); '
+                             'entropy: write the strings to this deposit manifest (JSON, or CSV if it ends in .csv), '
+                             'n keys per address (so --num-keys must be a multiple of n), for create-deposit-data --batch')
+    parser.add_argument('--qr', action='store_true',
+                        help='--batch: also write QR codes for each result')
+    parser.add_argument('--qr-jobs', type=int, default=4,
+                        help='QR codes to encode & verify concurrently (default: 4)')
+    parser.add_argument('--qr-chunk-size', type=int,
+                        help='write data longer than this many characters as multi-part QR codes '
+                             '(default: only data too large for one QR code, in {0}-character parts)'.format(QR_CHUNK_CHARS))
+    parser.add_argument('--select-coins', action='store_true', dest='coin_selection_mode',
+                        help='create-withdrawal-data --batch: spend only the UTXOs each withdrawal needs (branch-and-bound coin selection) '
+                             'instead of all supplied ones. Only for withdrawals giving every destination an amount; one that withdraws '
+                             'everything left to its last destination spends all its UTXOs. Interactive withdrawals always spend all of them')
+    parser.add_argument('--psbt', action='store_true', dest='psbt_mode',
+                        help='create-withdrawal-data: write an unsigned PSBT for signing with sign-psbt & combine-psbt instead of signing')
+    parser.add_argument('--sign-jobs', type=int, default=1,
+                        help='sign the inputs of a transaction in shards, concurrently in this many processes (default: 1, one signing request)')
+    parser.add_argument('--wallet-derivation', action='store_true',
+                        help='derive deposit addresses by importing the keys into bitcoind\'s wallet instead of in-process')
+    parser.add_argument('--cache-dir',
+                        help='directory for persisting decoded transactions & scripts between runs (default: memory only)')
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='maximum number of decoded results kept in memory, 0 to disable (default: 256)')
     args = parser.parse_args()
 
     verbose_mode = args.verbose_mode
     single_safety_confirm_mode = args.single_safety_confirm_mode
+    rpc_backend = args.rpc_backend
+    bitcoind_decoding = args.bitcoind_decoding
+    wallet_derivation = args.wallet_derivation
+    coin_selection_mode = args.coin_selection_mode
+    psbt_mode = args.psbt_mode
+    sign_jobs = args.sign_jobs
+    qr_jobs = args.qr_jobs
+    qr_chunk_size = args.qr_chunk_size
+    testnet_mode = bool(args.testnet)
+    cache_max_entries = args.cache_size
+    cache_dir = args.cache_dir
+    if args.rpc_record and args.rpc_replay:
+        parser.error("--rpc-record and --rpc-replay can't be used together")
+    if args.coin_selection_mode and not (args.program == "create-withdrawal-data" and args.batch):
+        parser.error("--select-coins only applies to create-withdrawal-data --batch")
+    if args.program == "entropy" and args.output != "-" and args.num_keys % args.n:
+        parser.error("--num-keys ({0}) must be a multiple of -n ({1}): the manifest has {1} keys per address".format(
+            args.num_keys, args.n))
+    if args.rpc_record or args.rpc_replay:
+        # a result cached on disk in one run would be a request missing from the session in another
+        cache_dir = None
+    if args.rpc_record:
+        rpc_record_file = args.rpc_record
+        os.close(os.open(rpc_record_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600))
+    if args.rpc_replay:
+        rpc_backend = "replay"
+        rpc_replay_file = args.rpc_replay
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    atexit.register(report_cache_stats)
+    if args.profile:
+        start_profiling(args.profile)
 
     global cli_args, wif_prefix
     cli_args = ["-testnet", "-rpcport={}".format(args.testnet), "-datadir=bitcoin-test-data"] if args.testnet else []
+    if args.testnet:
+        rpc_port = args.testnet
+        rpc_cookie_file = os.path.join("bitcoin-test-data", "testnet3", ".cookie")
     wif_prefix = "EF" if args.testnet else "80"
 
     if args.program == "entropy":
-        entropy(args.num_keys, args.rng)
+        entropy(args.num_keys, args.rng, args.output, args.m, args.n)
 
     if args.program == "create-deposit-data":
-        deposit_interactive(args.m, args.n, args.dice, args.rng)
+        if args.batch:
+            deposit_batch(args.batch, args.output, args.m, args.n, args.dice, args.rng, args.qr)
+        else:
+            deposit_interactive(args.m, args.n, args.dice, args.rng)
 
     if args.program == "create-withdrawal-data":
-        withdraw_interactive()
+        if args.batch:
+            withdraw_batch(args.batch, args.output, args.qr)
+        else:
+            withdraw_interactive()
 
     if args.program == "sign-transaction":
         # re-sign a partially signed transaction with another signature - for cold storage withdrawal
@@ -1074,3 +3171,9 @@ if __name__ == "__main__":
             sys.exit()
         re_sign_mode = True
         withdraw_interactive()
+
+    if args.program == "sign-psbt":
+        sign_psbt_interactive()
+
+    if args.program == "combine-psbt":
+        combine_psbt_interactive()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Private & public key helpers for GlacierScript
+#
+# Derives the public key for a WIF private key with plain secp256k1 point multiplication, so
+# deposit addresses can be generated without importing keys into a bitcoind wallet.
+#
+# Only public key derivation lives here; all signing is still done by Bitcoin Core.
+#
+################################################################################################
+
+from base58 import b58check_decode
+
+# secp256k1 domain parameters (SEC 2, section 2.4.1)
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+WIF_PREFIXES = {"mainnet": 0x80, "testnet": 0xef}
+
+
+class InvalidKeyError(ValueError):
+    """The string is not a valid private key for the network in use"""
+
+
+def _jacobian_double(point):
+    x, y, z = point
+    if y == 0:
+        return (0, 0, 0)
+    ysq = (y * y) % P
+    s = (4 * x * ysq) % P
+    m = (3 * x * x) % P  # curve parameter a is 0
+    nx = (m * m - 2 * s) % P
+    ny = (m * (s - nx) - 8 * ysq * ysq) % P
+    nz = (2 * y * z) % P
+    return (nx, ny, nz)
+
+
+def _jacobian_add(p1, p2):
+    x1, y1, z1 = p1
+    x2, y2, z2 = p2
+    if z1 == 0:
+        return p2
+    if z2 == 0:
+        return p1
+    z1sq, z2sq = (z1 * z1) % P, (z2 * z2) % P
+    u1, u2 = (x1 * z2sq) % P, (x2 * z1sq) % P
+    s1, s2 = (y1 * z2sq * z2) % P, (y2 * z1sq * z1) % P
+    if u1 == u2:
+        if s1 != s2:
+            return (0, 0, 0)
+        return _jacobian_double(p1)
+    h, r = (u2 - u1) % P, (s2 - s1) % P
+    hsq = (h * h) % P
+    hcu = (hsq * h) % P
+    nx = (r * r - hcu - 2 * u1 * hsq) % P
+    ny = (r * (u1 * hsq - nx) - s1 * hcu) % P
+    nz = (h * z1 * z2) % P
+    return (nx, ny, nz)
+
+
+def point_multiply(k, point=G):
+    """
+    Multiply a curve point by a scalar
+    returns => (<int> x, <int> y) affine coordinates
+    """
+    result = (0, 0, 0)
+    addend = (point[0], point[1], 1)
+    while k:
+        if k & 1:
+            result = _jacobian_add(result, addend)
+        addend = _jacobian_double(addend)
+        k >>= 1
+    x, y, z = result
+    if z == 0:
+        raise ValueError("point at infinity")
+    z_inv = pow(z, P - 2, P)
+    return ((x * z_inv * z_inv) % P, (y * z_inv * z_inv * z_inv) % P)
+
+
+def private_key_to_public_key(secret, compressed=True):
+    """
+    Derive the serialized public key for a private key
+    returns => <string> 33 (compressed) or 65 (uncompressed) bytes
+
+    secret: <int> private key, 1 <= secret < N
+    """
+    if not 1 <= secret < N:
+        raise InvalidKeyError("private key out of range")
+    x, y = point_multiply(secret)
+    if compressed:
+        return chr(2 + (y & 1)) + "{:064x}".format(x).decode("hex")
+    return "\x04" + "{:064x}{:064x}".format(x, y).decode("hex")
+
+
+def decode_wif(wif, testnet=False):
+    """
+    Decode a WIF-format private key
+    returns => (<int> secret, <boolean> compressed)
+
+    wif: <string> private key in wallet import format
+    testnet: <boolean> expect a testnet rather than a mainnet key
+    """
+    data = None
+    for length in (34, 33):  # with & without the compressed-pubkey flag
+        data = b58check_decode(wif, length)
+        if data is not None:
+            break
+    if data is None:
+        raise InvalidKeyError("invalid private key checksum or length")
+    if ord(data[0]) != WIF_PREFIXES["testnet" if testnet else "mainnet"]:
+        raise InvalidKeyError("private key is not for this network")
+    compressed = len(data) == 34
+    if compressed and data[33] != "\x01":
+        raise InvalidKeyError("invalid compressed private key flag")
+    return int(data[1:33].encode("hex"), 16), compressed
+
+
+def wif_to_public_key(wif, testnet=False):
+    """
+    Get the serialized public key belonging to a WIF private key
+    returns => <string> raw public key bytes
+    """
+    secret, compressed = decode_wif(wif, testnet)
+    return private_key_to_public_key(secret, compressed)
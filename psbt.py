@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Partially signed bitcoin transactions (BIP 174) for GlacierScript
+#
+# A PSBT carries an unsigned transaction together with everything needed to sign each input
+# (the output it spends & the redeem/witness script), so signers don't need the input
+# transactions, and signatures made independently by several signers can be combined.
+#
+# Only the container format lives here; signatures are still made by Bitcoin Core
+# (signrawtransactionwithkey), and PSBTs are combined & finalized with bitcoind's combinepsbt
+# and finalizepsbt.
+#
+################################################################################################
+
+import base64
+import binascii
+import struct
+
+from transaction import deserialize_transaction, transaction_hashes_and_sizes
+from transaction import read_bytes, write_bytes, script_ops, TransactionDecodeError
+
+PSBT_MAGIC = "psbt\xff"
+
+PSBT_GLOBAL_UNSIGNED_TX = "\x00"
+
+PSBT_IN_NON_WITNESS_UTXO = "\x00"
+PSBT_IN_WITNESS_UTXO = "\x01"
+PSBT_IN_PARTIAL_SIG = "\x02"
+PSBT_IN_REDEEM_SCRIPT = "\x04"
+PSBT_IN_WITNESS_SCRIPT = "\x05"
+PSBT_IN_FINAL_SCRIPTSIG = "\x07"
+PSBT_IN_FINAL_SCRIPTWITNESS = "\x08"
+
+
+class PSBTError(ValueError):
+    """The data is not a valid PSBT"""
+
+
+def read_map(raw, pos):
+    """
+    Read a PSBT key-value map, up to & including its 0x00 separator
+    returns => (<dict> key <string> => value <string>, <int> new position)
+    """
+    entries = {}
+    while True:
+        key, pos = read_bytes(raw, pos)
+        if not key:
+            return entries, pos
+        if key in entries:
+            raise PSBTError("duplicate key {0}".format(binascii.hexlify(key)))
+        entries[key], pos = read_bytes(raw, pos)
+
+
+def write_map(entries):
+    """Serialize a PSBT key-value map (in key order, as Bitcoin Core does) & its separator"""
+    return "".join(write_bytes(key) + write_bytes(entries[key]) for key in sorted(entries)) + "\x00"
+
+
+def parse_psbt(raw):
+    """
+    Parse a serialized PSBT
+    returns => <dict> with keys tx (the unsigned transaction, as from deserialize_transaction),
+               global, inputs & outputs (key-value maps; one per transaction input & output)
+
+    raw: <string> serialized PSBT bytes
+    """
+    if not raw.startswith(PSBT_MAGIC):
+        raise PSBTError("missing PSBT magic bytes")
+    try:
+        global_map, pos = read_map(raw, len(PSBT_MAGIC))
+        if PSBT_GLOBAL_UNSIGNED_TX not in global_map:
+            raise PSBTError("no unsigned transaction")
+        tx = deserialize_transaction(global_map[PSBT_GLOBAL_UNSIGNED_TX], allow_witness=False)
+        if any(txin["script_sig"] for txin in tx["vin"]):
+            raise PSBTError("the unsigned transaction has signatures")
+
+        inputs, outputs = [], []
+        for _ in tx["vin"]:
+            entries, pos = read_map(raw, pos)
+            inputs.append(entries)
+        for _ in tx["vout"]:
+            entries, pos = read_map(raw, pos)
+            outputs.append(entries)
+    except (IndexError, struct.error, TransactionDecodeError) as e:
+        raise PSBTError("truncated or invalid PSBT ({0})".format(e))
+    if pos != len(raw):
+        raise PSBTError("extra data after PSBT")
+
+    return {"tx": tx, "global": global_map, "inputs": inputs, "outputs": outputs}
+
+
+def serialize_psbt(psbt):
+    """
+    Serialize a PSBT (the inverse of parse_psbt)
+    returns => <string> serialized PSBT bytes
+    """
+    return PSBT_MAGIC + write_map(psbt["global"]) + "".join(
+        write_map(entries) for entries in psbt["inputs"] + psbt["outputs"])
+
+
+def psbt_from_base64(text):
+    """Parse a PSBT in base64, the format used by bitcoind & most wallets"""
+    try:
+        return parse_psbt(base64.b64decode(text.strip()))
+    except TypeError:
+        raise PSBTError("PSBT is not valid base64")
+
+
+def psbt_to_base64(psbt):
+    return base64.b64encode(serialize_psbt(psbt))
+
+
+def create_psbt(unsigned_raw, inputs):
+    """
+    Build a PSBT for an unsigned transaction
+    returns => <dict> PSBT, as from parse_psbt
+
+    unsigned_raw: <string> serialized unsigned transaction
+    inputs: List<dict> for each transaction input:
+      "prev_tx": <string> serialized transaction it spends from (for non-segwit inputs), or
+      "utxo": (<int> value in satoshis, <string> output script) it spends (for segwit inputs);
+      "redeem_script" & "witness_script": <string> raw scripts, if the input has them
+    """
+    tx = deserialize_transaction(unsigned_raw, allow_witness=False)
+    if any(txin["script_sig"] for txin in tx["vin"]):
+        raise PSBTError("the transaction is already signed")
+    if len(inputs) != len(tx["vin"]):
+        raise PSBTError("{0} inputs given for a transaction with {1}".format(len(inputs), len(tx["vin"])))
+    psbt = {"tx": tx, "global": {PSBT_GLOBAL_UNSIGNED_TX: unsigned_raw},
+            "inputs": [{} for _ in tx["vin"]], "outputs": [{} for _ in tx["vout"]]}
+
+    for entries, info in zip(psbt["inputs"], inputs):
+        if info.get("prev_tx"):
+            entries[PSBT_IN_NON_WITNESS_UTXO] = info["prev_tx"]
+        else:
+            value, script_pubkey = info["utxo"]
+            entries[PSBT_IN_WITNESS_UTXO] = struct.pack("<q", value) + write_bytes(script_pubkey)
+        if info.get("redeem_script"):
+            entries[PSBT_IN_REDEEM_SCRIPT] = info["redeem_script"]
+        if info.get("witness_script"):
+            entries[PSBT_IN_WITNESS_SCRIPT] = info["witness_script"]
+    return psbt
+
+
+def input_utxo(psbt, index):
+    """
+    Get the output spent by an input of a PSBT
+    returns => (<int> value in satoshis, <string> output script)
+    """
+    entries = psbt["inputs"][index]
+    txin = psbt["tx"]["vin"][index]
+    if PSBT_IN_NON_WITNESS_UTXO in entries:
+        raw = entries[PSBT_IN_NON_WITNESS_UTXO]
+        try:
+            prev_tx = deserialize_transaction(raw)
+        except TransactionDecodeError:
+            prev_tx = deserialize_transaction(raw, allow_witness=False)
+        # the txid commits to the amounts, so they can't be misrepresented to a signer
+        if transaction_hashes_and_sizes(raw, prev_tx)["txid"] != txin["txid"] or txin["vout"] >= len(prev_tx["vout"]):
+            raise PSBTError("input {0} has the wrong previous transaction".format(index))
+        txout = prev_tx["vout"][txin["vout"]]
+        return txout["value"], txout["script_pubkey"]
+    if PSBT_IN_WITNESS_UTXO in entries:
+        value = struct.unpack_from("<q", entries[PSBT_IN_WITNESS_UTXO], 0)[0]
+        script_pubkey, _ = read_bytes(entries[PSBT_IN_WITNESS_UTXO], 8)
+        return value, script_pubkey
+    raise PSBTError("input {0} has no UTXO data".format(index))
+
+
+def signing_script(psbt, index):
+    """
+    Get the script the signatures of an input are for: its witness script, else its redeem script
+    returns => <string> raw script, or None
+    """
+    entries = psbt["inputs"][index]
+    return entries.get(PSBT_IN_WITNESS_SCRIPT) or entries.get(PSBT_IN_REDEEM_SCRIPT)
+
+
+def partial_signatures(psbt, index):
+    """
+    Get the signatures collected so far for an input
+    returns => <dict> public key <string> => signature <string> (DER + sighash type byte)
+    """
+    return dict((key[1:], value) for key, value in psbt["inputs"][index].items()
+                if key[:1] == PSBT_IN_PARTIAL_SIG)
+
+
+def add_partial_signature(psbt, index, pubkey, signature):
+    psbt["inputs"][index][PSBT_IN_PARTIAL_SIG + pubkey] = signature
+
+
+def is_finalized(psbt, index):
+    entries = psbt["inputs"][index]
+    return PSBT_IN_FINAL_SCRIPTSIG in entries or PSBT_IN_FINAL_SCRIPTWITNESS in entries
+
+
+def multisig_input_signatures(txin):
+    """
+    Get the signatures in a signed (or partially signed) multisig input
+    returns => List<string> signatures, in redeem script public key order
+
+    txin: <dict> input, as from deserialize_transaction: its witness is
+          ["", <signature>..., <witness script>], else its scriptSig is
+          OP_0 <signature>... <redeem script>
+    """
+    if txin["witness"]:
+        return [item for item in txin["witness"][1:-1] if item]
+    ops, _ = script_ops(txin["script_sig"])
+    return [data for opcode, data in ops[1:-1] if data]
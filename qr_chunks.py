@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Multi-part QR codes for GlacierScript
+#
+# A QR code holds at most 2953 bytes (version 40, lowest error correction), and codes near that
+# size are hard to scan. Larger data is split into parts, each written as its own QR code with a
+# header:
+#
+#   GQR:<index>/<total>:<checksum>:<data>
+#
+# index counts from 1, and checksum is the first 8 hex digits of the SHA256 of the whole data, so
+# parts of different payloads can't be mixed up and the reassembled data can be checked.
+#
+################################################################################################
+
+import hashlib
+import re
+
+QR_CHUNK_PREFIX = "GQR:"
+QR_CHUNK_HEADER = re.compile(r"GQR:([1-9][0-9]*)/([1-9][0-9]*):([0-9a-f]{8}):")
+
+
+class QRChunkError(ValueError):
+    """The QR code parts are invalid, inconsistent or don't reassemble to valid data"""
+
+
+def payload_checksum(payload):
+    return hashlib.sha256(payload).hexdigest()[:8]
+
+
+def is_qr_chunk(text):
+    return text.strip().startswith(QR_CHUNK_PREFIX)
+
+
+def split_payload(payload, chunk_size):
+    """
+    Split data into QR code parts of (almost) equal size
+    returns => List<string> parts, each with its header
+
+    payload: <string> data to split
+    chunk_size: <int> maximum characters of data per part, not counting the header
+    """
+    total = max(1, -(-len(payload) // chunk_size))
+    size = -(-len(payload) // total)
+    checksum = payload_checksum(payload)
+    return ["{0}{1}/{2}:{3}:{4}".format(QR_CHUNK_PREFIX, i + 1, total, checksum, payload[i * size:(i + 1) * size])
+            for i in range(total)]
+
+
+def parse_chunk(part):
+    """
+    Parse one QR code part
+    returns => (<int> index, <int> total, <string> checksum, <string> data)
+    """
+    part = part.strip()
+    match = QR_CHUNK_HEADER.match(part)
+    if not match:
+        raise QRChunkError("not a QR code part: {0}".format(part[:30]))
+    index, total = int(match.group(1)), int(match.group(2))
+    if index > total:
+        raise QRChunkError("part {0} of only {1}".format(index, total))
+    return index, total, match.group(3), part[match.end():]
+
+
+def collect_chunks(parts):
+    """
+    Check that QR code parts, in any order and possibly repeated, belong to the same data
+    returns => (<int> total, <string> checksum, <dict> index => data)
+    """
+    total, checksum, chunks = None, None, {}
+    for part in parts:
+        index, part_total, part_checksum, data = parse_chunk(part)
+        if total is None:
+            total, checksum = part_total, part_checksum
+        elif (part_total, part_checksum) != (total, checksum):
+            raise QRChunkError("part {0} belongs to different data ({1} parts, checksum {2}; expected {3} parts, "
+                               "checksum {4})".format(index, part_total, part_checksum, total, checksum))
+        if chunks.get(index, data) != data:
+            raise QRChunkError("part {0} given twice with different data".format(index))
+        chunks[index] = data
+    if total is None:
+        raise QRChunkError("no QR code parts given")
+    return total, checksum, chunks
+
+
+def missing_chunks(parts):
+    """
+    returns => List<int> indexes of the parts still needed to reassemble the data
+    """
+    total, checksum, chunks = collect_chunks(parts)
+    return [i for i in range(1, total + 1) if i not in chunks]
+
+
+def reassemble_payload(parts):
+    """
+    Rebuild data from its QR code parts, in any order
+    returns => <string> the data
+    raises QRChunkError if parts are missing or the checksum doesn't match
+    """
+    total, checksum, chunks = collect_chunks(parts)
+    missing = [i for i in range(1, total + 1) if i not in chunks]
+    if missing:
+        raise QRChunkError("missing part(s) {0} of {1}".format(", ".join(str(i) for i in missing), total))
+    payload = "".join(chunks[i] for i in range(1, total + 1))
+    if payload_checksum(payload) != checksum:
+        raise QRChunkError("checksum mismatch: the parts don't reassemble to the original data")
+    return payload
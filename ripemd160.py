@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Pure-Python RIPEMD-160, following the reference description at:
+# https://homes.esat.kuleuven.be/~bosselae/ripemd160.html
+#
+# Only used when hashlib cannot provide ripemd160 (OpenSSL 3 moved it to the
+# "legacy" provider, which many distributions do not load by default).
+
+"""RIPEMD-160 hash function, preferring hashlib's implementation when available"""
+
+import hashlib
+import struct
+
+# Message word selection, rotation amounts and constants for the left and right lines
+_ML = [
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+    7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14, 11, 8,
+    3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12,
+    1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15, 14, 5, 6, 2,
+    4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13]
+_MR = [
+    5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12,
+    6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9, 1, 2,
+    15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13,
+    8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13, 9, 7, 10, 14,
+    12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11]
+_RL = [
+    11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8,
+    7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11, 7, 13, 12,
+    11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5,
+    11, 12, 14, 15, 14, 15, 9, 8, 9, 14, 5, 6, 8, 6, 5, 12,
+    9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6]
+_RR = [
+    8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6,
+    9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6, 15, 13, 11,
+    9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5,
+    15, 5, 8, 11, 14, 14, 6, 14, 6, 9, 12, 9, 12, 5, 15, 8,
+    8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11]
+_KL = [0x00000000, 0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xA953FD4E]
+_KR = [0x50A28BE6, 0x5C4DD124, 0x6D703EF3, 0x7A6D76E9, 0x00000000]
+
+_MASK = 0xffffffff
+
+
+def _f(j, x, y, z):
+    if j == 0:
+        return x ^ y ^ z
+    if j == 1:
+        return (x & y) | (~x & z)
+    if j == 2:
+        return (x | ~y) ^ z
+    if j == 3:
+        return (x & z) | (y & ~z)
+    return x ^ (y | ~z)
+
+
+def _rol(x, i):
+    return ((x << i) | (x >> (32 - i))) & _MASK
+
+
+def _compress(h0, h1, h2, h3, h4, block):
+    x = struct.unpack("<16L", block)
+    al, bl, cl, dl, el = h0, h1, h2, h3, h4
+    ar, br, cr, dr, er = h0, h1, h2, h3, h4
+    for j in range(80):
+        rnd = j >> 4
+        al = (_rol((al + _f(rnd, bl, cl, dl) + x[_ML[j]] + _KL[rnd]) & _MASK, _RL[j]) + el) & _MASK
+        al, bl, cl, dl, el = el, al, bl, _rol(cl, 10), dl
+        ar = (_rol((ar + _f(4 - rnd, br, cr, dr) + x[_MR[j]] + _KR[rnd]) & _MASK, _RR[j]) + er) & _MASK
+        ar, br, cr, dr, er = er, ar, br, _rol(cr, 10), dr
+    return ((h1 + cl + dr) & _MASK, (h2 + dl + er) & _MASK, (h3 + el + ar) & _MASK,
+            (h4 + al + br) & _MASK, (h0 + bl + cr) & _MASK)
+
+
+def _ripemd160(data):
+    h = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0)
+    padded = data + "\x80" + "\x00" * ((55 - len(data)) % 64) + struct.pack("<Q", 8 * len(data))
+    for i in range(0, len(padded), 64):
+        h = _compress(h[0], h[1], h[2], h[3], h[4], padded[i:i + 64])
+    return struct.pack("<5L", *h)
+
+
+try:
+    hashlib.new('ripemd160')
+    have_hashlib_ripemd160 = True
+except ValueError:
+    have_hashlib_ripemd160 = False
+
+
+def ripemd160(data):
+    """ RIPEMD-160 digest of data (a string of bytes)
+    """
+    if have_hashlib_ripemd160:
+        return hashlib.new('ripemd160', data).digest()
+    return _ripemd160(data)
+
+
+def hash_160(data):
+    """ RIPEMD-160(SHA-256(data)), as used for Bitcoin addresses
+    """
+    return ripemd160(hashlib.sha256(data).digest())
+
+
+if __name__ == '__main__':
+    # test vectors from the RIPEMD-160 reference page
+    for msg, digest in [
+            ("", "9c1185a5c5e9fc54612808977ee8f548b2258d31"),
+            ("abc", "8eb208f7e05d987a9b044a8e98c6b087f15a0bfc"),
+            ("message digest", "5d0689ef49d2fae572b881b123a85ffa21595f36"),
+            ("1234567890" * 8, "9b752e45573d4b39f4dbd3323cab82bf63326bfb"),
+            ("a" * 1000000, "52783243c1697bdbe16d37f97f68f08325dc1528")]:
+        print _ripemd160(msg).encode('hex_codec') == digest, digest
@@ -0,0 +1,775 @@
+#!/usr/bin/env python
+
+################################################################################################
+#
+# Raw transaction decoding for GlacierScript
+#
+# A pure-Python equivalent of Bitcoin Core's `decoderawtransaction` RPC (as of v0.17, the version
+# GlacierScript runs), so that transactions can be inspected without a round-trip through
+# bitcoind. The decoded result has the same shape as v0.17's output, e.g.
+# tx["vout"][i]["scriptPubKey"]["addresses"], with one difference: the address of a witness v1+
+# output ("witness_unknown", e.g. taproot) is encoded with bech32m (BIP 350), as Bitcoin Core
+# does from v0.21.1, where v0.17 encodes it with bech32.
+#
+# Usage (prints the same JSON as `bitcoin-cli decoderawtransaction`):
+#   transaction.py [--testnet] <hex or filename> [...]
+#
+################################################################################################
+
+import argparse
+import binascii
+import hashlib
+import json
+import os
+import struct
+from decimal import Decimal
+
+import bech32
+from base58 import b58check_encode
+from ripemd160 import hash_160
+
+MAINNET = {"p2pkh": "\x00", "p2sh": "\x05", "hrp": "bc"}
+TESTNET = {"p2pkh": "\x6f", "p2sh": "\xc4", "hrp": "tb"}
+
+WITNESS_SCALE_FACTOR = 4
+MAX_SCRIPT_SIZE = 10000
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6a
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+OPCODE_NAMES = dict([(0x00, "0"), (0x4c, "OP_PUSHDATA1"), (0x4d, "OP_PUSHDATA2"), (0x4e, "OP_PUSHDATA4"),
+                     (0x4f, "-1"), (0x50, "OP_RESERVED")] +
+                    [(OP_1 + i, str(i + 1)) for i in range(16)] +
+                    [(0x61 + i, name) for i, name in enumerate([
+                        "OP_NOP", "OP_VER", "OP_IF", "OP_NOTIF", "OP_VERIF", "OP_VERNOTIF", "OP_ELSE",
+                        "OP_ENDIF", "OP_VERIFY", "OP_RETURN", "OP_TOALTSTACK", "OP_FROMALTSTACK",
+                        "OP_2DROP", "OP_2DUP", "OP_3DUP", "OP_2OVER", "OP_2ROT", "OP_2SWAP", "OP_IFDUP",
+                        "OP_DEPTH", "OP_DROP", "OP_DUP", "OP_NIP", "OP_OVER", "OP_PICK", "OP_ROLL",
+                        "OP_ROT", "OP_SWAP", "OP_TUCK", "OP_CAT", "OP_SUBSTR", "OP_LEFT", "OP_RIGHT",
+                        "OP_SIZE", "OP_INVERT", "OP_AND", "OP_OR", "OP_XOR", "OP_EQUAL", "OP_EQUALVERIFY",
+                        "OP_RESERVED1", "OP_RESERVED2", "OP_1ADD", "OP_1SUB", "OP_2MUL", "OP_2DIV",
+                        "OP_NEGATE", "OP_ABS", "OP_NOT", "OP_0NOTEQUAL", "OP_ADD", "OP_SUB", "OP_MUL",
+                        "OP_DIV", "OP_MOD", "OP_LSHIFT", "OP_RSHIFT", "OP_BOOLAND", "OP_BOOLOR",
+                        "OP_NUMEQUAL", "OP_NUMEQUALVERIFY", "OP_NUMNOTEQUAL", "OP_LESSTHAN",
+                        "OP_GREATERTHAN", "OP_LESSTHANOREQUAL", "OP_GREATERTHANOREQUAL", "OP_MIN",
+                        "OP_MAX", "OP_WITHIN", "OP_RIPEMD160", "OP_SHA1", "OP_SHA256", "OP_HASH160",
+                        "OP_HASH256", "OP_CODESEPARATOR", "OP_CHECKSIG", "OP_CHECKSIGVERIFY",
+                        "OP_CHECKMULTISIG", "OP_CHECKMULTISIGVERIFY", "OP_NOP1", "OP_CHECKLOCKTIMEVERIFY",
+                        "OP_CHECKSEQUENCEVERIFY", "OP_NOP4", "OP_NOP5", "OP_NOP6", "OP_NOP7", "OP_NOP8",
+                        "OP_NOP9", "OP_NOP10"])] +
+                    [(0xff, "OP_INVALIDOPCODE")])
+
+# Key order of bitcoind's decoderawtransaction output. Decoded transactions are plain dicts
+# (OrderedDict is slow in Python 2); this restores bitcoind's ordering when printing.
+# Keys not in bitcoind's output (NOT_IN_BITCOIND_OUTPUT) are left out when printing.
+JSON_KEY_ORDER = dict((key, i) for i, key in enumerate([
+    "txid", "hash", "version", "size", "vsize", "weight", "locktime", "vin", "vout", "coinbase",
+    "scriptSig", "txinwitness", "sequence", "value", "n", "scriptPubKey", "asm", "hex", "reqSigs",
+    "type", "addresses"]))
+
+# each vout also carries its amount as an integer number of satoshi, for arithmetic & signing
+NOT_IN_BITCOIND_OUTPUT = frozenset(["satoshis"])
+
+SIGHASH_NAMES = {0x01: "ALL", 0x81: "ALL|ANYONECANPAY", 0x02: "NONE", 0x82: "NONE|ANYONECANPAY",
+                 0x03: "SINGLE", 0x83: "SINGLE|ANYONECANPAY"}
+
+
+class TransactionDecodeError(ValueError):
+    """The data is not a valid serialized transaction"""
+
+
+################################################################################################
+#
+# Hashing & address helpers
+#
+################################################################################################
+
+def sha256d(data):
+    """Double SHA-256 of a string of bytes"""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def base58check_encode(version, payload):
+    """Base58Check-encode payload with a one-byte version prefix"""
+    return b58check_encode(version + payload)
+
+
+def format_amount(satoshi):
+    """
+    Format an amount in satoshi as Bitcoin Core does in JSON (always 8 decimal places)
+    returns => <string>
+    """
+    sign = "-" if satoshi < 0 else ""
+    quotient, remainder = divmod(abs(satoshi), 100000000)
+    return "{0}{1}.{2:08d}".format(sign, quotient, remainder)
+
+
+################################################################################################
+#
+# Script parsing
+#
+################################################################################################
+
+def script_ops(script):
+    """
+    Parse a script into its operations
+    returns => List<(opcode <int>, pushed data <string> or None)>, and <boolean> False if the
+               script ended in a truncated push
+
+    script: <string> raw script bytes
+    """
+    ops = []
+    pos = 0
+    end = len(script)
+    while pos < end:
+        opcode = ord(script[pos])
+        pos += 1
+        if opcode > OP_PUSHDATA4:
+            ops.append((opcode, None))
+            continue
+        if opcode < OP_PUSHDATA1:
+            size = opcode
+        else:
+            width = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2, OP_PUSHDATA4: 4}[opcode]
+            if pos + width > end:
+                return ops, False
+            size = struct.unpack_from({1: "<B", 2: "<H", 4: "<I"}[width], script, pos)[0]
+            pos += width
+        if size > end - pos:
+            return ops, False
+        ops.append((opcode, script[pos:pos + size]))
+        pos += size
+    return ops, True
+
+
+def script_num(data):
+    """Interpret a (short) script push as a CScriptNum, as Bitcoin Core does for asm output"""
+    if not data:
+        return 0
+    value = 0
+    for i, c in enumerate(data):
+        value |= ord(c) << (8 * i)
+    if ord(data[-1]) & 0x80:
+        return -(value & ~(0x80 << (8 * (len(data) - 1))))
+    return value
+
+
+def is_valid_signature_encoding(sig):
+    """Strict DER signature check (BIP66), with sighash byte appended"""
+    if len(sig) < 9 or len(sig) > 73:
+        return False
+    b = [ord(c) for c in sig]
+    if b[0] != 0x30 or b[1] != len(b) - 3:
+        return False
+    len_r = b[3]
+    if 5 + len_r >= len(b):
+        return False
+    len_s = b[5 + len_r]
+    if len_r + len_s + 7 != len(b):
+        return False
+    if b[2] != 0x02 or len_r == 0 or b[4] & 0x80:
+        return False
+    if len_r > 1 and b[4] == 0x00 and not b[5] & 0x80:
+        return False
+    if b[len_r + 4] != 0x02 or len_s == 0 or b[len_r + 6] & 0x80:
+        return False
+    if len_s > 1 and b[len_r + 6] == 0x00 and not b[len_r + 7] & 0x80:
+        return False
+    return True
+
+
+def script_to_asm(script, attempt_sighash_decode=False):
+    """
+    Human-readable form of a script, identical to Bitcoin Core's ScriptToAsmStr
+    returns => <string>
+
+    script: <string> raw script bytes
+    attempt_sighash_decode: <boolean> render signature pushes as <sig>[ALL] etc. (for scriptSigs)
+    """
+    ops, ok = script_ops(script)
+    unspendable = (len(script) > 0 and ord(script[0]) == OP_RETURN) or len(script) > MAX_SCRIPT_SIZE
+    words = []
+    for opcode, data in ops:
+        if data is None:
+            words.append(OPCODE_NAMES.get(opcode, "OP_UNKNOWN"))
+        elif len(data) <= 4:
+            words.append(str(script_num(data)))
+        elif attempt_sighash_decode and not unspendable and is_valid_signature_encoding(data) \
+                and ord(data[-1]) in SIGHASH_NAMES:
+            words.append("{0}[{1}]".format(binascii.hexlify(data[:-1]), SIGHASH_NAMES[ord(data[-1])]))
+        else:
+            words.append(binascii.hexlify(data))
+    if not ok:
+        words.append("[error]")
+    return " ".join(words)
+
+
+def is_valid_pubkey_size(data):
+    """Whether data has the length its header byte calls for (CPubKey::ValidSize)"""
+    if not data:
+        return False
+    header = ord(data[0])
+    if header in (2, 3):
+        return len(data) == 33
+    if header in (4, 6, 7):
+        return len(data) == 65
+    return False
+
+
+def classify_script(script):
+    """
+    Determine the standard type of an output script, like Bitcoin Core's Solver
+    returns => (<string> type, List<string> solutions) where solutions depend on the type:
+               hashes for pubkeyhash/scripthash, pubkeys for pubkey/multisig (preceded by m),
+               (version, program) for witness programs
+    """
+    size = len(script)
+    if size == 23 and script[0] == chr(OP_HASH160) and script[1] == "\x14" and script[22] == chr(OP_EQUAL):
+        return "scripthash", [script[2:22]]
+
+    if 4 <= size <= 42:
+        version = ord(script[0])
+        if (version == OP_0 or OP_1 <= version <= OP_16) and ord(script[1]) + 2 == size:
+            version = 0 if version == OP_0 else version - OP_1 + 1
+            program = script[2:]
+            if version == 0 and size == 22:
+                return "witness_v0_keyhash", [program]
+            if version == 0 and size == 34:
+                return "witness_v0_scripthash", [program]
+            if version != 0:
+                return "witness_unknown", [version, program]
+            return "nonstandard", []
+
+    if size >= 1 and ord(script[0]) == OP_RETURN:
+        ops, ok = script_ops(script[1:])
+        if ok and all(opcode <= OP_16 for opcode, _ in ops):
+            return "nulldata", []
+
+    if size in (35, 67) and ord(script[0]) == size - 2 and ord(script[-1]) == OP_CHECKSIG:
+        pubkey = script[1:-1]
+        if is_valid_pubkey_size(pubkey):
+            return "pubkey", [pubkey]
+
+    if size == 25 and script[0] == chr(OP_DUP) and script[1] == chr(OP_HASH160) and script[2] == "\x14" \
+            and script[23] == chr(OP_EQUALVERIFY) and script[24] == chr(OP_CHECKSIG):
+        return "pubkeyhash", [script[3:23]]
+
+    if size >= 1 and ord(script[-1]) == OP_CHECKMULTISIG:
+        ops, ok = script_ops(script)
+        if ok and len(ops) >= 3 and OP_1 <= ops[0][0] <= OP_16 and OP_1 <= ops[-2][0] <= OP_16:
+            required = ops[0][0] - OP_1 + 1
+            keys = ops[-2][0] - OP_1 + 1
+            pubkeys = [data for _, data in ops[1:-2]]
+            if all(data is not None and is_valid_pubkey_size(data) for data in pubkeys) \
+                    and len(pubkeys) == keys and keys >= required:
+                return "multisig", [required] + pubkeys
+
+    return "nonstandard", []
+
+
+def script_to_destinations(script, network=MAINNET):
+    """
+    Addresses paid by an output script, like Bitcoin Core's ExtractDestinations
+    returns => (<string> type, <int> required signatures or None, List<string> addresses)
+    """
+    script_type, solutions = classify_script(script)
+    if script_type == "pubkeyhash":
+        return script_type, 1, [base58check_encode(network["p2pkh"], solutions[0])]
+    if script_type == "scripthash":
+        return script_type, 1, [base58check_encode(network["p2sh"], solutions[0])]
+    if script_type == "pubkey":
+        return script_type, 1, [base58check_encode(network["p2pkh"], hash_160(solutions[0]))]
+    if script_type == "multisig":
+        addresses = [base58check_encode(network["p2pkh"], hash_160(pubkey)) for pubkey in solutions[1:]]
+        return script_type, solutions[0], addresses
+    if script_type in ("witness_v0_keyhash", "witness_v0_scripthash"):
+        program = [ord(c) for c in solutions[0]]
+        return script_type, 1, [bech32.encode(network["hrp"], 0, program)]
+    if script_type == "witness_unknown":
+        address = bech32.encode(network["hrp"], solutions[0], [ord(c) for c in solutions[1]])
+        if address:
+            return script_type, 1, [address]
+    return script_type, None, []
+
+
+def script_pubkey_to_json(script, network=MAINNET):
+    """
+    Decoded form of an output script, as in bitcoind's "scriptPubKey" objects
+    returns => <dict>
+    """
+    script_type, required, addresses = script_to_destinations(script, network)
+    result = {"asm": script_to_asm(script), "hex": binascii.hexlify(script), "type": script_type}
+    if addresses:
+        result["reqSigs"] = required
+        result["addresses"] = addresses
+    return result
+
+
+################################################################################################
+#
+# Transaction deserialization
+#
+################################################################################################
+
+def read_compact_size(data, pos):
+    """
+    Read a Bitcoin variable-length integer
+    returns => (<int> value, <int> new position)
+    """
+    first = ord(data[pos])
+    if first < 0xfd:
+        return first, pos + 1
+    if first == 0xfd:
+        return struct.unpack_from("<H", data, pos + 1)[0], pos + 3
+    if first == 0xfe:
+        return struct.unpack_from("<I", data, pos + 1)[0], pos + 5
+    return struct.unpack_from("<Q", data, pos + 1)[0], pos + 9
+
+
+def write_compact_size(n):
+    """
+    Encode a Bitcoin variable-length integer
+    returns => <string>
+    """
+    if n < 0xfd:
+        return chr(n)
+    if n <= 0xffff:
+        return "\xfd" + struct.pack("<H", n)
+    if n <= 0xffffffff:
+        return "\xfe" + struct.pack("<I", n)
+    return "\xff" + struct.pack("<Q", n)
+
+
+def write_bytes(data):
+    """Encode a length-prefixed byte string"""
+    return write_compact_size(len(data)) + data
+
+
+def read_bytes(data, pos):
+    """
+    Read a length-prefixed byte string
+    returns => (<string>, <int> new position)
+    """
+    size, pos = read_compact_size(data, pos)
+    if pos + size > len(data):
+        raise TransactionDecodeError("length prefix exceeds data")
+    return data[pos:pos + size], pos + size
+
+
+def deserialize_transaction(raw, allow_witness=True):
+    """
+    Parse a serialized transaction
+    returns => <dict> with keys version, vin, vout, locktime, has_witness, and the byte ranges
+               needed to compute the txid ("body": vin & vout, without witness data)
+               vin: List<dict> prevout txid (hex), vout, script_sig, sequence, witness
+               vout: List<dict> value (satoshi), script_pubkey
+
+    raw: <string> serialized transaction bytes
+    allow_witness: <boolean> honor the segwit marker & flag (BIP144)
+    """
+    try:
+        version = struct.unpack_from("<i", raw, 0)[0]
+        pos = 4
+        flags = 0
+        body_start = pos
+        num_vin, pos = read_compact_size(raw, pos)
+        if num_vin == 0 and allow_witness:
+            flags = ord(raw[pos])
+            pos += 1
+            body_start = pos
+            if flags != 0:
+                num_vin, pos = read_compact_size(raw, pos)
+
+        vin = []
+        for _ in xrange(num_vin):
+            prev_hash = raw[pos:pos + 32]
+            prev_index = struct.unpack_from("<I", raw, pos + 32)[0]
+            script_sig, pos = read_bytes(raw, pos + 36)
+            sequence = struct.unpack_from("<I", raw, pos)[0]
+            pos += 4
+            vin.append({"txid": binascii.hexlify(prev_hash[::-1]), "vout": prev_index,
+                        "script_sig": script_sig, "sequence": sequence, "witness": []})
+
+        num_vout, pos = read_compact_size(raw, pos)
+        vout = []
+        for _ in xrange(num_vout):
+            value = struct.unpack_from("<q", raw, pos)[0]
+            script_pubkey, pos = read_bytes(raw, pos + 8)
+            vout.append({"value": value, "script_pubkey": script_pubkey})
+        body_end = pos
+
+        if flags & 1 and allow_witness:
+            flags ^= 1
+            for txin in vin:
+                num_items, pos = read_compact_size(raw, pos)
+                for _ in xrange(num_items):
+                    item, pos = read_bytes(raw, pos)
+                    txin["witness"].append(item)
+            if not any(txin["witness"] for txin in vin):
+                raise TransactionDecodeError("superfluous witness record")
+        if flags:
+            raise TransactionDecodeError("unknown transaction optional data")
+
+        locktime = struct.unpack_from("<I", raw, pos)[0]
+        pos += 4
+    except (IndexError, struct.error):
+        raise TransactionDecodeError("truncated transaction")
+    if pos != len(raw):
+        raise TransactionDecodeError("extra data after transaction")
+
+    return {"version": version, "vin": vin, "vout": vout, "locktime": locktime,
+            "has_witness": any(txin["witness"] for txin in vin),
+            "body": (body_start, body_end)}
+
+
+def serialize_transaction(tx):
+    """
+    Serialize a transaction parsed by deserialize_transaction (the inverse of it)
+    returns => <string> serialized transaction bytes, with witness data if any input has some
+    """
+    has_witness = any(txin["witness"] for txin in tx["vin"])
+    parts = [struct.pack("<i", tx["version"])]
+    if has_witness:
+        parts.append("\x00\x01")
+
+    parts.append(write_compact_size(len(tx["vin"])))
+    for txin in tx["vin"]:
+        parts.append(binascii.unhexlify(txin["txid"])[::-1] + struct.pack("<I", txin["vout"]))
+        parts.append(write_bytes(txin["script_sig"]) + struct.pack("<I", txin["sequence"]))
+
+    parts.append(write_compact_size(len(tx["vout"])))
+    for txout in tx["vout"]:
+        parts.append(struct.pack("<q", txout["value"]) + write_bytes(txout["script_pubkey"]))
+
+    if has_witness:
+        for txin in tx["vin"]:
+            parts.append(write_compact_size(len(txin["witness"])))
+            parts.extend(write_bytes(item) for item in txin["witness"])
+
+    parts.append(struct.pack("<I", tx["locktime"]))
+    return "".join(parts)
+
+
+def combine_signed_inputs(unsigned_raw, shards):
+    """
+    Merge copies of a transaction which each had a different subset of its inputs signed
+    returns => <string> serialized transaction, each input's scriptSig & witness taken from the
+               copy which signed it (inputs no copy signed are kept as in unsigned_raw)
+    raises TransactionDecodeError if a copy isn't the same transaction
+
+    unsigned_raw: <string> serialized transaction the copies were signed from
+    shards: List<(<string> serialized signed copy, List<int> indexes of the inputs it signed)>
+    """
+    tx = deserialize_transaction(unsigned_raw)
+    if serialize_transaction(tx) != unsigned_raw:
+        raise TransactionDecodeError("transaction does not round-trip through serialization")
+    outpoints = [(txin["txid"], txin["vout"], txin["sequence"]) for txin in tx["vin"]]
+
+    for raw, indexes in shards:
+        signed = deserialize_transaction(raw)
+        if (signed["version"], signed["locktime"], signed["vout"]) != (tx["version"], tx["locktime"], tx["vout"]) \
+                or [(txin["txid"], txin["vout"], txin["sequence"]) for txin in signed["vin"]] != outpoints:
+            raise TransactionDecodeError("signed copy spends different inputs or pays different outputs")
+        for i in indexes:
+            tx["vin"][i]["script_sig"] = signed["vin"][i]["script_sig"]
+            tx["vin"][i]["witness"] = signed["vin"][i]["witness"]
+
+    return serialize_transaction(tx)
+
+
+def transaction_hashes_and_sizes(raw, tx):
+    """
+    Compute txid, wtxid, size, vsize and weight of a deserialized transaction
+    returns => <dict>
+    """
+    if tx["has_witness"]:
+        body_start, body_end = tx["body"]
+        stripped = raw[:4] + raw[body_start:body_end] + raw[-4:]
+    else:
+        stripped = raw
+    weight = len(stripped) * (WITNESS_SCALE_FACTOR - 1) + len(raw)
+    return {
+        "txid": binascii.hexlify(sha256d(stripped)[::-1]),
+        "hash": binascii.hexlify(sha256d(raw)[::-1]),
+        "size": len(raw),
+        "vsize": (weight + WITNESS_SCALE_FACTOR - 1) // WITNESS_SCALE_FACTOR,
+        "weight": weight,
+    }
+
+
+def decode_raw_transaction_bytes(raw, testnet=False):
+    """
+    Decode a serialized transaction into bitcoind's `decoderawtransaction` format
+    returns => <dict>
+
+    raw: <string> serialized transaction bytes
+    testnet: <boolean> encode addresses for testnet
+    """
+    network = TESTNET if testnet else MAINNET
+    try:
+        tx = deserialize_transaction(raw)
+    except TransactionDecodeError:
+        # like bitcoind, fall back to the pre-segwit serialization
+        tx = deserialize_transaction(raw, allow_witness=False)
+
+    result = transaction_hashes_and_sizes(raw, tx)
+    result["version"] = tx["version"]
+    result["locktime"] = tx["locktime"]
+
+    result["vin"] = []
+    for txin in tx["vin"]:
+        if txin["txid"] == "0" * 64 and txin["vout"] == 0xffffffff and len(tx["vin"]) == 1:
+            decoded = {"coinbase": binascii.hexlify(txin["script_sig"])}
+        else:
+            decoded = {"txid": txin["txid"], "vout": txin["vout"],
+                       "scriptSig": {"asm": script_to_asm(txin["script_sig"], attempt_sighash_decode=True),
+                                     "hex": binascii.hexlify(txin["script_sig"])}}
+        if txin["witness"]:
+            decoded["txinwitness"] = [binascii.hexlify(item) for item in txin["witness"]]
+        decoded["sequence"] = txin["sequence"]
+        result["vin"].append(decoded)
+
+    result["vout"] = []
+    for n, txout in enumerate(tx["vout"]):
+        result["vout"].append({
+            # the same exact amount that parsing bitcoind's output with parse_float=Decimal gives
+            "value": Decimal(format_amount(txout["value"])),
+            "satoshis": txout["value"],
+            "n": n,
+            "scriptPubKey": script_pubkey_to_json(txout["script_pubkey"], network)})
+
+    return result
+
+
+def decode_raw_transaction(hex_tx, testnet=False):
+    """
+    Decode a hex-encoded transaction into bitcoind's `decoderawtransaction` format
+    returns => <dict>
+
+    hex_tx: <string> hex-encoded transaction
+    testnet: <boolean> encode addresses for testnet
+    """
+    try:
+        raw = binascii.unhexlify(hex_tx.strip())
+    except (TypeError, binascii.Error):
+        raise TransactionDecodeError("transaction is not valid hex")
+    return decode_raw_transaction_bytes(raw, testnet)
+
+
+################################################################################################
+#
+# Transaction size estimation
+#
+# Sizes of fully-signed m-of-n multisig spends, computed from the script templates instead of by
+# building and signing a transaction. A signature is DER-encoded plus one sighash byte: at most
+# 73 bytes, and 71 bytes for the low-R signatures Bitcoin Core creates since v0.17.
+#
+################################################################################################
+
+SIGNATURE_SIZE_EXPECTED = 71
+SIGNATURE_SIZE_WORST = 73
+MULTISIG_ADDRESS_TYPES = ("p2sh", "p2sh-p2wsh", "p2wsh")
+
+
+def compact_size_len(n):
+    """Bytes taken by n encoded as a Bitcoin variable-length integer"""
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    if n <= 0xffffffff:
+        return 5
+    return 9
+
+
+def push_len(size):
+    """Bytes taken by a script push of size bytes of data (opcode(s) + data)"""
+    if size < OP_PUSHDATA1:
+        return 1 + size
+    if size <= 0xff:
+        return 2 + size
+    if size <= 0xffff:
+        return 3 + size
+    return 5 + size
+
+
+def multisig_redeem_script_size(n, compressed=True):
+    """Size of an n-key OP_CHECKMULTISIG redeem script: OP_m <pubkey>... OP_n OP_CHECKMULTISIG"""
+    return 3 + n * (34 if compressed else 66)
+
+
+def multisig_input_size(address_type, m, redeem_script_size, signature_size):
+    """
+    Size of one fully-signed m-of-n multisig input
+    returns => (<int> non-witness bytes, <int> witness bytes)
+
+    address_type: <string> one of MULTISIG_ADDRESS_TYPES
+    """
+    if address_type not in MULTISIG_ADDRESS_TYPES:
+        raise ValueError("unknown multisig address type: {0}".format(address_type))
+
+    if address_type == "p2sh":
+        # scriptSig: OP_0 <sig>... <redeem script>
+        script_sig = 1 + m * push_len(signature_size) + push_len(redeem_script_size)
+        witness = 0
+    else:
+        # scriptSig: nothing (p2wsh), or a push of the 34-byte witness program (p2sh-p2wsh)
+        script_sig = 0 if address_type == "p2wsh" else push_len(34)
+        # witness: "" <sig>... <redeem script>
+        witness = (compact_size_len(m + 2) + 1 + m * (compact_size_len(signature_size) + signature_size) +
+                   compact_size_len(redeem_script_size) + redeem_script_size)
+
+    # prevout (36) + scriptSig + sequence (4)
+    return 36 + compact_size_len(script_sig) + script_sig + 4, witness
+
+
+def multisig_input_weight(address_type, m, redeem_script_size, signature_size=SIGNATURE_SIZE_EXPECTED):
+    """Weight one fully-signed m-of-n multisig input adds to a segwit transaction"""
+    input_size, input_witness = multisig_input_size(address_type, m, redeem_script_size, signature_size)
+    return input_size * WITNESS_SCALE_FACTOR + (input_witness or 1)
+
+
+def output_weight(script):
+    """Weight of a transaction output paying to script"""
+    return (8 + compact_size_len(len(script)) + len(script)) * WITNESS_SCALE_FACTOR
+
+
+def multisig_spend_weight(address_types, m, redeem_script_size, output_scripts, signature_size):
+    """
+    Weight of a transaction spending multisig inputs, once every input carries m signatures
+    returns => <int>
+
+    address_types: List<string> address type of each input
+    output_scripts: List<string> raw scriptPubKey of each output
+    """
+    non_witness = 4 + compact_size_len(len(address_types)) + compact_size_len(len(output_scripts)) + 4
+    witness = 0
+    for address_type in address_types:
+        input_size, input_witness = multisig_input_size(address_type, m, redeem_script_size, signature_size)
+        non_witness += input_size
+        # an input without witness data still takes one byte (empty stack) in a segwit transaction
+        witness += input_witness or 1
+    for script in output_scripts:
+        non_witness += 8 + compact_size_len(len(script)) + len(script)
+
+    if any(address_type != "p2sh" for address_type in address_types):
+        witness += 2  # segwit marker & flag
+    else:
+        witness = 0
+    return non_witness * WITNESS_SCALE_FACTOR + witness
+
+
+def estimate_multisig_vsize(num_inputs, address_type, m, n, output_scripts, compressed=True,
+                            redeem_script_size=None):
+    """
+    Virtual size of a fully-signed transaction spending m-of-n multisig inputs, without signing anything
+    returns => {"expected": <int>, "worst": <int>} vsize with low-R (71 byte) and maximum-size
+               (73 byte) signatures respectively
+
+    num_inputs: <int> number of inputs
+    address_type: <string> one of MULTISIG_ADDRESS_TYPES, or List<string> one per input (mixed inputs)
+    m: <int> signatures required
+    n: <int> keys in the redeem script
+    output_scripts: List<string> raw scriptPubKey of each output
+    compressed: <boolean> whether the redeem script uses compressed (33 byte) pubkeys
+    redeem_script_size: <int> exact redeem script size, overriding the one derived from n & compressed
+    """
+    if isinstance(address_type, basestring):
+        address_types = [address_type] * num_inputs
+    else:
+        address_types = list(address_type)
+        if len(address_types) != num_inputs:
+            raise ValueError("expected {0} input address types, got {1}".format(num_inputs, len(address_types)))
+    if redeem_script_size is None:
+        redeem_script_size = multisig_redeem_script_size(n, compressed)
+
+    estimate = {}
+    for name, signature_size in (("expected", SIGNATURE_SIZE_EXPECTED), ("worst", SIGNATURE_SIZE_WORST)):
+        weight = multisig_spend_weight(address_types, m, redeem_script_size, output_scripts, signature_size)
+        estimate[name] = (weight + WITNESS_SCALE_FACTOR - 1) // WITNESS_SCALE_FACTOR
+    return estimate
+
+
+def parse_multisig_redeem_script(redeem_script):
+    """
+    Get m and the public keys of an m-of-n OP_CHECKMULTISIG redeem script
+    returns => (<int> m, List<string> pubkeys), or (None, []) if not a multisig script
+
+    redeem_script: <string> raw script bytes
+    """
+    script_type, solutions = classify_script(redeem_script)
+    if script_type != "multisig":
+        return None, []
+    return solutions[0], solutions[1:]
+
+
+def multisig_address_type(script_pubkey, redeem_script):
+    """
+    Determine how an output pays to a redeem script
+    returns => <string> one of MULTISIG_ADDRESS_TYPES, or None if the output doesn't pay to it
+
+    script_pubkey: <string> raw output script
+    redeem_script: <string> raw redeem (witness) script
+    """
+    script_type, solutions = classify_script(script_pubkey)
+    witness_program = "\x00\x20" + hashlib.sha256(redeem_script).digest()
+    if script_type == "witness_v0_scripthash" and script_pubkey == witness_program:
+        return "p2wsh"
+    if script_type == "scripthash":
+        if solutions[0] == hash_160(redeem_script):
+            return "p2sh"
+        if solutions[0] == hash_160(witness_program):
+            return "p2sh-p2wsh"
+    return None
+
+
+################################################################################################
+#
+# JSON output in bitcoin-cli's format
+#
+################################################################################################
+
+def format_json(value, indent_level=1):
+    """
+    Render decoded data exactly as bitcoin-cli prints it (UniValue::write with 2-space indent)
+    returns => <string>
+    """
+    indent = "  " * indent_level
+    closing_indent = "  " * (indent_level - 1)
+    if isinstance(value, dict):
+        keys = sorted((key for key in value if key not in NOT_IN_BITCOIND_OUTPUT),
+                      key=lambda key: JSON_KEY_ORDER.get(key, len(JSON_KEY_ORDER)))
+        items = ["{0}{1}: {2}".format(indent, json.dumps(key), format_json(value[key], indent_level + 1))
+                 for key in keys]
+        return "{\n" + ",\n".join(items) + ("\n" if items else "") + closing_indent + "}"
+    if isinstance(value, list):
+        items = [indent + format_json(item, indent_level + 1) for item in value]
+        return "[\n" + ",\n".join(items) + ("\n" if items else "") + closing_indent + "]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, Decimal):
+        return "{0:f}".format(value)
+    return json.dumps(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Decode raw transactions like `bitcoin-cli decoderawtransaction`")
+    parser.add_argument("transactions", nargs="+", help="hex-encoded transaction, or a file containing one")
+    parser.add_argument("--testnet", action="store_true", help="encode addresses for testnet")
+    args = parser.parse_args()
+
+    for tx in args.transactions:
+        if os.path.isfile(tx):
+            tx = open(tx).read()
+        print format_json(decode_raw_transaction(tx, args.testnet))